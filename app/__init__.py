@@ -1,4 +1,6 @@
 # /app/__init__.py
+import logging
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_session import Session  # <-- ДОБАВЬТЕ ЭТОТ ИМПОРТ
@@ -12,21 +14,56 @@ def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # Уровень логов приложения (LOG_LEVEL); обработчик не добавляется, если логирование уже настроено
+    logging.basicConfig(level=Config.LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger('app').setLevel(Config.LOG_LEVEL)
+
     # --- ИНИЦИАЛИЗИРУЙТЕ СЕССИЮ ---
     sess.init_app(app) # <-- ДОБАВЬТЕ ЭТУ СТРОКУ
 
     db.init_app(app)
 
+    from .database import configure_sqlite_engine
+    with app.app_context():
+        # PRAGMA профиля SQLite (WAL, busy_timeout, ...) - до первого подключения
+        configure_sqlite_engine(db.engine)
+
     if app.config.get("RESET_DB_ON_START"):
         with app.app_context():
             from .cadastre_process.models import DealStatus
 
-            print("Resetting local database...")
+            logger = logging.getLogger(__name__)
+            logger.info("Resetting local database...")
             db.drop_all()
             db.create_all()
-            print("Local database has been successfully reset.")
+            logger.info("Local database has been successfully reset.")
+
+    from .database import MysqlSession
+
+    @app.teardown_appcontext
+    def remove_mysql_session(exception=None):
+        # Одна сессия MySQL на запрос: возвращаем соединение в пул в конце запроса
+        MysqlSession.remove()
+
+    from .metrics import init_request_metrics
+    init_request_metrics(app)
 
     from .cadastre_process import cadastre_bp
     app.register_blueprint(cadastre_bp)
 
+    from .cadastre_process.services.deadline_service import backfill_arrival_deadlines, start_deadline_sweeper
+    from .cadastre_process.services.job_service import fail_interrupted_jobs
+    with app.app_context():
+        # Сделки, доставленные до появления срока явки, получают его сразу при старте
+        backfill_arrival_deadlines()
+        # Фоновые загрузки, прерванные перезапуском, уже никто не доделает
+        fail_interrupted_jobs()
+    start_deadline_sweeper(app)
+
+    from .cadastre_process.services.crm_snapshot_service import start_snapshot_refresher
+    start_snapshot_refresher(app)
+
+    from .cadastre_process.services.scan_storage import start_scan_gc
+    start_scan_gc(app)
+
     return app
\ No newline at end of file
@@ -0,0 +1,115 @@
+# app/cache.py
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from app.config import Config
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Потокобезопасный кэш в памяти процесса: TTL на каждый ключ,
+    вытеснение давно не использованных ключей (LRU) при переполнении,
+    счетчики попаданий и промахов.
+    """
+
+    def __init__(self, maxsize: int = 256, default_ttl: float = 300):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Удаляет один ключ."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_prefix(self, prefix):
+        """Удаляет все ключи-кортежи, начинающиеся с prefix (например, имени функции)."""
+        with self._lock:
+            for key in [k for k in self._data if isinstance(k, tuple) and k[:1] == (prefix,)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+def cached(cache: TTLCache, ttl: float = None):
+    """
+    Декоратор: кэширует результат функции по (имя функции, аргументы).
+    Сброс - cache.invalidate_prefix(func.__name__) или func.invalidate(*args).
+    """
+    def decorator(func):
+        def make_key(args, kwargs):
+            return (func.__name__,) + args + tuple(sorted(kwargs.items()))
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = make_key(args, kwargs)
+            value = cache.get(key, _MISSING)
+            if value is _MISSING:
+                value = func(*args, **kwargs)
+                cache.set(key, value, ttl)
+            return value
+
+        wrapper.invalidate = lambda *args, **kwargs: cache.invalidate(make_key(args, kwargs))
+        wrapper.invalidate_all = lambda: cache.invalidate_prefix(func.__name__)
+        return wrapper
+    return decorator
+
+
+# Кэш справочных запросов к CRM (список ЖК/домов, квартиры дома)
+reference_cache = TTLCache(
+    maxsize=Config.REFERENCE_CACHE_SIZE,
+    default_ttl=Config.REFERENCE_CACHE_TTL,
+)
+
+
+# Готовые шахматки запусков обработки (ключ - run_id)
+checkerboard_cache = TTLCache(
+    maxsize=Config.CHECKERBOARD_CACHE_SIZE,
+    default_ttl=Config.CHECKERBOARD_CACHE_TTL,
+)
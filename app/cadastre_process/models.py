@@ -7,11 +7,13 @@ class DealStatus(db.Model):
     __tablename__ = 'deal_statuses'
 
     deal_id = db.Column(db.Integer, primary_key=True)
-    group_key = db.Column(db.String(50), nullable=True)
+    group_key = db.Column(db.String(50), nullable=True, index=True)
     status = db.Column(db.String(50), default='processing', nullable=False)
 
     # Существующие этапы
     documents_delivered_at = db.Column(db.DateTime, nullable=True)
+    # Крайний срок явки клиента (доставка + ARRIVAL_DEADLINE_DAYS), см. deadline_service
+    arrival_deadline = db.Column(db.DateTime, nullable=True)
     client_arrived_at = db.Column(db.DateTime, nullable=True)
     unilateral_act_downloaded_at = db.Column(db.DateTime, nullable=True)
     unilateral_act_uploaded_path = db.Column(db.String(255), nullable=True)
@@ -21,4 +23,118 @@ class DealStatus(db.Model):
     is_act_signed = db.Column(db.Boolean, nullable=True)
     has_defect_list = db.Column(db.Boolean, nullable=True)
     signed_act_uploaded_path = db.Column(db.String(255), nullable=True)
-    defect_list_uploaded_path = db.Column(db.String(255), nullable=True)
\ No newline at end of file
+    defect_list_uploaded_path = db.Column(db.String(255), nullable=True)
+
+    __table_args__ = (
+        # Фильтры списка сделок и фоновая проверка: по статусу и сроку явки
+        db.Index('ix_deal_statuses_status_deadline', 'status', 'arrival_deadline'),
+    )
+
+
+class UploadRun(db.Model):
+    """Один запуск обработки кадастрового файла. В сессии хранится только его id."""
+    __tablename__ = 'upload_runs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    house_id = db.Column(db.Integer, nullable=True, index=True)  # пусто для пакетной загрузки
+    house_ids = db.Column(db.JSON, nullable=True)  # все дома запуска в порядке загрузки
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    # Отсортированные шахматки по домам: {house_id: {...}} (см. checkerboard_service.build_checkerboards)
+    checkerboards = db.Column(db.JSON, nullable=True)
+    # Отчеты разбора файлов по домам: {house_id: {...}} (см. ParseDiagnostics.to_dict)
+    parse_reports = db.Column(db.JSON, nullable=True)
+
+
+class UploadJob(db.Model):
+    """Фоновая обработка загруженного файла: состояние, текущий этап и время этапов."""
+    __tablename__ = 'upload_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    house_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued | running | done | failed
+    stage = db.Column(db.String(50), nullable=True)
+    percent = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text, nullable=True)
+    run_id = db.Column(db.String(32), nullable=True)
+    status_report = db.Column(db.JSON, nullable=True)
+    timings = db.Column(db.JSON, nullable=True)  # {stage: секунды}
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)  # начало первого этапа (без ожидания в очереди)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+class RunApartment(db.Model):
+    """
+    Квартира из загруженного файла в рамках запуска.
+    Для квартир со сделкой заполнены group_key и данные сделки, для остальных - только площадь из файла.
+    """
+    __tablename__ = 'run_apartments'
+
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(32), db.ForeignKey('upload_runs.id', ondelete='CASCADE'), nullable=False)
+    house_id = db.Column(db.Integer, nullable=True)
+    property_id = db.Column(db.String(50), nullable=False)
+    cadastre_area = db.Column(db.Float, nullable=True)
+
+    group_key = db.Column(db.String(50), nullable=True)
+    deal_id = db.Column(db.Integer, nullable=True)
+    area_diff = db.Column(db.Float, nullable=True)
+    contract_area = db.Column(db.Float, nullable=True)
+    client_id = db.Column(db.Integer, nullable=True)
+    client_name = db.Column(db.String(255), nullable=True)
+    # Этаж и подъезд храним как JSON, чтобы не потерять тип (число или строка) - от него зависит сортировка шахматки
+    floor = db.Column(db.JSON, nullable=True)
+    section = db.Column(db.JSON, nullable=True)
+    sell_status_name = db.Column(db.String(100), nullable=True)
+    deal_status_name = db.Column(db.String(100), nullable=True)
+    # Отпечаток площади и полей CRM квартиры - для сравнения с повторной загрузкой (см. reconcile_service)
+    fingerprint = db.Column(db.String(16), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_run_apartments_run_group', 'run_id', 'group_key'),
+        db.Index('ix_run_apartments_house_run', 'house_id', 'run_id'),
+        db.Index('ix_run_apartments_run_property', 'run_id', 'property_id', 'house_id'),
+        db.Index('ix_run_apartments_run_deal', 'run_id', 'deal_id'),
+    )
+
+
+class CrmSnapshotHouse(db.Model):
+    """Снимок данных CRM по дому: когда обновлялся, когда в последний раз менялся и контрольная сумма строк."""
+    __tablename__ = 'crm_snapshot_houses'
+
+    house_id = db.Column(db.Integer, primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
+    checksum = db.Column(db.String(32), nullable=False)
+    rows_count = db.Column(db.Integer, default=0, nullable=False)
+    # Снимок помечен устаревшим (сброс справочников): перечитывается при следующем обращении
+    stale = db.Column(db.Boolean, default=False, nullable=False)
+
+
+class CrmSnapshotRow(db.Model):
+    """
+    Строка снимка CRM: квартира дома (estate_sells) с активной сделкой (estate_deals) и покупателем
+    (estate_deals_contacts). Имена колонок совпадают с полями выборки CRM в data_service.
+    """
+    __tablename__ = 'crm_snapshot_rows'
+
+    id = db.Column(db.Integer, primary_key=True)
+    house_id = db.Column(db.Integer, nullable=False)
+    estate_sell_id = db.Column(db.Integer, nullable=True)
+    geo_flatnum = db.Column(db.String(50), nullable=True)
+    # Этаж и подъезд - JSON, чтобы сохранить тип значения из CRM (от него зависит сортировка шахматки)
+    estate_floor = db.Column(db.JSON, nullable=True)
+    geo_house_entrance = db.Column(db.JSON, nullable=True)
+    estate_sell_status_name = db.Column(db.String(100), nullable=True)
+    estate_area = db.Column(db.Float, nullable=True)
+    deal_id = db.Column(db.Integer, nullable=True)
+    deal_area = db.Column(db.Float, nullable=True)
+    deal_status_name = db.Column(db.String(100), nullable=True)
+    seller_contacts_id = db.Column(db.Integer, nullable=True)
+    has_debt = db.Column(db.Boolean, nullable=True)
+    contacts_buy_name = db.Column(db.String(255), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_crm_snapshot_rows_house_flat', 'house_id', 'geo_flatnum'),
+        db.Index('ix_crm_snapshot_rows_deal', 'deal_id'),
+    )
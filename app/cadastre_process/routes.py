@@ -1,68 +1,56 @@
 # app/cadastre_process/routes.py
 
 import math
+import mimetypes
 import os
-from datetime import datetime, timedelta
 from flask import (
-    render_template, request, flash, redirect, url_for, send_file, session, jsonify
+    render_template, request, flash, redirect, url_for, send_file, session, jsonify,
+    Response, stream_with_context
 )
-from werkzeug.utils import secure_filename
-from collections import defaultdict, OrderedDict  # <-- ИМПОРТИРУЕМ OrderedDict
+from app.cache import reference_cache, checkerboard_cache
+from app.config import Config
+from app.database import get_pool_stats
+from app.metrics import registry, PROMETHEUS_CONTENT_TYPE
+from .services.checkerboard_service import get_checkerboards
 from .services.export_service import generate_checkerboard_excel
 from . import cadastre_bp
 from .services.data_service import (
     get_complexes_and_houses, get_single_deal_details,
-    update_deal_status, get_statuses_for_deals
+    update_deal_status, update_deal_statuses, get_statuses_for_deals, BATCH_ACTIONS
 )
 from .services.file_service import (
-    parse_cadastre_excel, generate_apartment_template,
-    generate_archive_for_group, generate_single_document
+    generate_apartment_template, generate_batch_template, match_sheets_to_houses, is_supported_excel,
+    generate_archive_for_group, stream_archive_for_group, generate_single_document
+)
+from .services.crm_snapshot_service import expire_snapshots, get_snapshot_stats, refresh_snapshots
+from .services.deadline_service import get_deadline_deals
+from .services.scan_storage import SCAN_KINDS, ScanStorageError, save_scan, scan_path, scan_etag
+from .services.job_service import submit_upload_job, submit_batch_upload_job, get_job
+from .services.run_service import (
+    run_exists, get_run_house_ids, get_parse_report, get_categorized_results, get_group_deals,
+    find_deal_by_property, get_deals_page
 )
-from .services.processing_service import process_cadastre_data
 from .workflows.group_1_workflow import generate_unilateral_act
 
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
-
 
-# --- НОВАЯ ВЛОЖЕННАЯ СОРТИРОВКА (СНАЧАЛА ПОДЪЕЗД, ПОТОМ ЭТАЖ) ---
-def _sort_checkerboard_data(data):
-    """Сортирует вложенную структуру: [section][floor] -> [apartments]."""
+def _unsupported_excel_message(file_names) -> str:
+    """Сообщение для файлов, которые не разобрать (старый .xls и не Excel)."""
+    return (f"Формат файла не поддерживается: {', '.join(file_names)}. "
+            f"Загрузите книгу Excel .xlsx (файлы .xls пересохраните в Excel как .xlsx).")
 
-    # 1. Создаем итоговый OrderedDict для подъездов
-    final_sorted_data = OrderedDict()
-
-    # 2. Сортируем подъезды (сначала числа, потом строки 'N/A')
-    sorted_section_keys = sorted(
-        data.keys(),
-        key=lambda s: (isinstance(s, str), s)
-    )
-
-    for section in sorted_section_keys:
-        floors_data = data[section]
-
-        # 3. Сортируем этажи (числовые по убыванию, потом 'N/A')
-        sorted_floors = sorted(
-            floors_data.keys(),
-            key=lambda x: (isinstance(x, str), -float(x) if isinstance(x, (int, float)) else 0),
-            reverse=False
-        )
 
-        # 4. Создаем OrderedDict для этажей
-        sorted_floors_dict = OrderedDict()
-        for floor in sorted_floors:
-            apartments = floors_data[floor]
-            # 5. Сортируем квартиры
-            try:
-                apartments.sort(key=lambda x: int(x['property_id']))
-            except (ValueError, TypeError):
-                apartments.sort(key=lambda x: str(x['property_id']))
-            sorted_floors_dict[floor] = apartments
+def _get_current_run_id():
+    """Возвращает id текущего запуска из сессии, если его результаты еще хранятся."""
+    run_id = session.get('run_id')
+    return run_id if run_exists(run_id) else None
 
-        final_sorted_data[section] = sorted_floors_dict
 
-    return final_sorted_data
+def _get_house_names():
+    """{house_id: 'ЖК, дом'} по кэшированному справочнику CRM."""
+    return {
+        house['id']: f"{complex_name}, {house['name']}"
+        for complex_name, houses in get_complexes_and_houses().items() for house in houses
+    }
 
 
 @cadastre_bp.route('/', methods=['GET'])
@@ -71,52 +59,100 @@ def upload_page():
     return render_template('upload.html', houses_data=houses_data)
 
 
+@cadastre_bp.route('/refresh-reference-data', methods=['POST'])
+def refresh_reference_data():
+    """
+    Сбрасывает кэш справочников CRM (список домов, квартиры) и помечает снимки CRM устаревшими,
+    чтобы подтянуть свежие данные.
+    """
+    reference_cache.clear()
+    expire_snapshots()
+    flash('Справочные данные CRM будут загружены заново.', 'info')
+    return redirect(url_for('cadastre_process.upload_page'))
+
+
+@cadastre_bp.route('/pool-stats')
+def pool_stats():
+    """Состояние пула соединений с CRM и кэша справочников (для мониторинга)."""
+    return jsonify({
+        'mysql_pool': get_pool_stats(),
+        'reference_cache': reference_cache.stats(),
+    })
+
+
+@cadastre_bp.route('/crm-snapshot')
+def crm_snapshot():
+    """Состояние локальных снимков CRM по домам."""
+    return jsonify({'enabled': Config.CRM_SNAPSHOT_ENABLED, 'max_age': Config.CRM_SNAPSHOT_MAX_AGE,
+                    'houses': get_snapshot_stats()})
+
+
+@cadastre_bp.route('/crm-snapshot/refresh', methods=['POST'])
+def refresh_crm_snapshot():
+    """
+    Перечитывает снимки CRM сейчас: домов из house_id (можно несколько), без них - всех
+    уже снятых домов. Отвечает числом строк и тем, изменились ли данные дома.
+    """
+    try:
+        house_ids = [int(house_id) for house_id in request.values.getlist('house_id')]
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'house_id должен быть числом'}), 400
+    if not house_ids:
+        house_ids = [snapshot['house_id'] for snapshot in get_snapshot_stats()]
+    reports = refresh_snapshots(house_ids)
+    reference_cache.invalidate_prefix('get_apartments_for_house')
+    return jsonify({'status': 'success', 'houses': [
+        {'house_id': house_id, **report} for house_id, report in reports.items()
+    ]})
+
+
+@cadastre_bp.route('/deadlines')
+def deadlines():
+    """Просроченные сделки и сделки, у которых срок явки скоро истекает (по всем запускам)."""
+    return jsonify(get_deadline_deals())
+
+
+# Поля get_pool_stats() для метрик: число соединений по состояниям и статистика ожидания
+POOL_CONNECTION_STATES = ('pool_size', 'checked_in', 'checked_out', 'overflow')
+POOL_WAIT_STATS = ('total', 'avg', 'max')
+
+
+@cadastre_bp.route('/metrics')
+def metrics():
+    """Метрики в текстовом формате Prometheus: этапы обработки, HTTP-запросы, пул CRM, кэши."""
+    pool = get_pool_stats()
+    caches = {'reference': reference_cache.stats(), 'checkerboard': checkerboard_cache.stats()}
+    gauges = [
+        ('cadastre_mysql_pool_connections', 'Соединения пула CRM по состояниям',
+         [({'state': name}, pool[name]) for name in POOL_CONNECTION_STATES]),
+        ('cadastre_mysql_pool_waits', 'Сколько раз запрос ждал свободное соединение пула CRM',
+         [({}, pool['wait_count'])] if 'wait_count' in pool else []),
+        ('cadastre_mysql_pool_wait_ms', 'Ожидание соединения пула CRM (мс): суммарное, среднее, максимальное',
+         [({'stat': stat}, pool[f'wait_{stat}_ms']) for stat in POOL_WAIT_STATS if 'wait_count' in pool]),
+        ('cadastre_cache_entries', 'Число ключей в кэшах',
+         [({'cache': name}, stats['size']) for name, stats in caches.items()]),
+        ('cadastre_cache_requests', 'Попадания и промахи кэшей с запуска процесса',
+         [({'cache': name, 'result': result}, stats[result])
+          for name, stats in caches.items() for result in ('hits', 'misses')]),
+        ('cadastre_crm_snapshot_age_seconds', 'Возраст снимков CRM по домам',
+         [({'house_id': snapshot['house_id']}, snapshot['age_seconds']) for snapshot in get_snapshot_stats()]),
+    ]
+    return Response(registry.render(gauges), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @cadastre_bp.route('/download-checkerboard')
 def download_checkerboard():
-    """Готовит данные для 3-х шахматок (сгруппированных по подъездам) и отдает Excel-файл."""
-    categorized_results = session.get('categorized_results')
-    raw_cadastre_data = session.get('raw_cadastre_data')
+    """Отдает Excel-файл с 3-мя шахматками (сгруппированными по подъездам)."""
+    run_id = _get_current_run_id()
+    checkerboards = get_checkerboards(run_id, request.args.get('house_id', type=int)) if run_id else None
 
-    if not categorized_results or not raw_cadastre_data:
+    if not checkerboards:
         flash('Данные для генерации файла не найдены...', 'warning')
         return redirect(url_for('cadastre_process.upload_page'))
 
-    # --- ГОТОВИМ ДАННЫЕ ДЛЯ ВСЕХ ШАХМАТОК ---
-
-    # 1. Собираем все сделки и создаем карты "квартира -> этаж/подъезд"
-    all_deals = [deal for deals_in_group in categorized_results.values() for deal in deals_in_group]
-    floor_map = {str(d['property_id']): d.get('floor') or 'N/A' for d in all_deals}
-    section_map = {str(d['property_id']): d.get('section') or 'N/A' for d in all_deals}
-
-    # 2. Готовим "Расхождения" (структура [section][floor])
-    diff_checkerboard = defaultdict(lambda: defaultdict(list))
-    for deal in all_deals:
-        section = deal.get('section') or 'N/A'
-        floor = deal.get('floor') or 'N/A'
-        diff_checkerboard[section][floor].append(deal)
-
-    # 3. Готовим "Данные из файла" (структура [section][floor])
-    file_checkerboard = defaultdict(lambda: defaultdict(list))
-    for prop_id, area in raw_cadastre_data.items():
-        section = section_map.get(str(prop_id), 'N/A')
-        floor = floor_map.get(str(prop_id), 'N/A')
-        file_checkerboard[section][floor].append({'property_id': prop_id, 'area': area})
-
-    # 4. Готовим "Данные из БД" (структура [section][floor])
-    db_checkerboard = defaultdict(lambda: defaultdict(list))
-    for deal in all_deals:
-        section = deal.get('section') or 'N/A'
-        floor = deal.get('floor') or 'N/A'
-        db_checkerboard[section][floor].append({
-            'property_id': deal['property_id'],
-            'area': deal.get('contract_area', 0)
-        })
-
-    # --- ВЫЗЫВАЕМ ФУНКЦИЮ ЭКСПОРТА С ТРЕМЯ НАБОРАМИ ДАННЫХ ---
+    # Шахматки построены и отсортированы один раз при загрузке файла
     excel_buffer = generate_checkerboard_excel(
-        _sort_checkerboard_data(diff_checkerboard),
-        _sort_checkerboard_data(file_checkerboard),
-        _sort_checkerboard_data(db_checkerboard)
+        checkerboards['diff'], checkerboards['file'], checkerboards['db']
     )
 
     return send_file(
@@ -127,6 +163,11 @@ def download_checkerboard():
     )
 
 
+def _incremental_requested():
+    """Флажок 'полная обработка' на форме загрузки отключает инкрементальную сверку."""
+    return False if request.form.get('full_reprocess') else None
+
+
 @cadastre_bp.route('/process-upload', methods=['POST'])
 def process_upload():
     if 'cadastre_file' not in request.files or not request.form.get('house_id'):
@@ -134,97 +175,158 @@ def process_upload():
         return redirect(url_for('cadastre_process.upload_page'))
 
     file = request.files['cadastre_file']
-    house_id = request.form.get('house_id')
+    house_id = request.form.get('house_id', type=int)
 
     if file.filename == '':
         flash('Файл не выбран', 'danger')
         return redirect(url_for('cadastre_process.upload_page'))
 
-    cadastre_data = parse_cadastre_excel(file)
-    if cadastre_data is None:
-        flash('Ошибка чтения Excel файла...', 'danger')
+    if not is_supported_excel(file.filename):
+        flash(_unsupported_excel_message([file.filename]), 'danger')
         return redirect(url_for('cadastre_process.upload_page'))
 
-    results = process_cadastre_data(cadastre_data, house_id)
+    # Разбор файла и сверка с CRM идут в фоне, запрос сразу отдает страницу задачи
+    job_id = submit_upload_job(file, house_id, incremental=_incremental_requested())
+    session['job_id'] = job_id
+    return redirect(url_for('cadastre_process.job_page', job_id=job_id))
+
+
+@cadastre_bp.route('/process-batch-upload', methods=['POST'])
+def process_batch_upload():
+    """
+    Пакетная загрузка по ЖК: отдельный файл на каждый дом (поля cadastre_file_<house_id>)
+    и/или одна книга с листом на каждый дом (поле batch_workbook).
+    """
+    complex_name = request.form.get('complex_name')
+    houses = get_complexes_and_houses().get(complex_name) if complex_name else None
+    if not houses:
+        flash('Выберите ЖК для пакетной загрузки.', 'danger')
+        return redirect(url_for('cadastre_process.upload_page'))
+
+    workbook = request.files.get('batch_workbook')
+    uploaded = [workbook] + [request.files.get(f"cadastre_file_{house['id']}") for house in houses]
+    unsupported = [file.filename for file in uploaded
+                   if file and file.filename and not is_supported_excel(file.filename)]
+    if unsupported:
+        flash(_unsupported_excel_message(unsupported), 'danger')
+        return redirect(url_for('cadastre_process.upload_page'))
 
-    session['raw_cadastre_data'] = cadastre_data
-    session['categorized_results'] = results
-    return redirect(url_for('cadastre_process.show_results'))
+    sources = {}
+    if workbook and workbook.filename:
+        matched, unmatched = match_sheets_to_houses(workbook, houses)
+        if unmatched:
+            flash(f"Листы без соответствующего дома пропущены: {', '.join(unmatched)}.", 'warning')
+        for house_id, sheet_name in matched.items():
+            sources[house_id] = (house_id, workbook, sheet_name)
+
+    # Отдельный файл дома важнее листа книги
+    for house in houses:
+        file = request.files.get(f"cadastre_file_{house['id']}")
+        if file and file.filename:
+            sources[house['id']] = (house['id'], file, None)
+
+    if not sources:
+        flash('Не загружено ни одного файла для домов выбранного ЖК.', 'danger')
+        return redirect(url_for('cadastre_process.upload_page'))
+
+    job_id = submit_batch_upload_job(list(sources.values()), incremental=_incremental_requested())
+    session['job_id'] = job_id
+    return redirect(url_for('cadastre_process.job_page', job_id=job_id))
+
+
+@cadastre_bp.route('/jobs/<job_id>')
+def job_page(job_id):
+    """Страница ожидания фоновой обработки с прогрессом."""
+    job = get_job(job_id)
+    if not job:
+        flash('Задача обработки не найдена.', 'warning')
+        return redirect(url_for('cadastre_process.upload_page'))
+    return render_template('job_status.html', job=job)
+
+
+@cadastre_bp.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    """Опрос состояния задачи: этап, процент, время этапов."""
+    job = get_job(job_id)
+    if not job:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+
+    if job['status'] == 'done':
+        # Результаты готовы - привязываем запуск к сессии того, кто загружал файл
+        if session.get('job_id') == job_id:
+            session.pop('job_id')
+            session['run_id'] = job['run_id']
+            report = job['status_report'] or {}
+            flash(
+                f"Статусы сделок: создано {report.get('inserted', 0)}, сброшено {report.get('reset', 0)}, "
+                f"без изменений {report.get('kept', 0)}.",
+                'info'
+            )
+            reconcile = report.get('reconcile')
+            if reconcile and reconcile.get('mode') == 'incremental':
+                flash(
+                    f"Сравнение с прошлой загрузкой: новых квартир {reconcile['added']}, "
+                    f"изменилось {reconcile['changed']}, без изменений {reconcile['unchanged']}, "
+                    f"нет в файле {reconcile['removed']}.",
+                    'info'
+                )
+            if report.get('skipped_houses'):
+                house_names = _get_house_names()
+                skipped = ', '.join(house_names.get(h, str(h)) for h in report['skipped_houses'])
+                flash(f'Не удалось разобрать файлы домов: {skipped}.', 'warning')
+        job['results_url'] = url_for('cadastre_process.show_results')
+    return jsonify(job)
 
 
 @cadastre_bp.route('/results')
 def show_results():
     """Отображает страницу с результатами, сгруппированными по подъездам."""
-    results = session.get('categorized_results')
+    run_id = _get_current_run_id()
+    results = get_categorized_results(run_id) if run_id else None
     if not results:
         flash('Нет данных для отображения. Пожалуйста, загрузите файл заново.', 'info')
         return redirect(url_for('cadastre_process.upload_page'))
 
-    all_deals = [deal for deals_in_group in results.values() for deal in deals_in_group]
-    total_apartments = len(all_deals)
-
-    # --- НОВАЯ ЛОГИКА ГРУППИРОВКИ: [section][floor] -> [apartments] ---
-    checkerboard_data = defaultdict(lambda: defaultdict(list))
-    for deal in all_deals:
-        section = deal.get('section') or 'N/A'
-        floor = deal.get('floor') or 'N/A'
-        checkerboard_data[section][floor].append(deal)
+    total_apartments = sum(len(deals) for deals in results.values())
 
-    # --- СОРТИРУЕМ ДАННЫЕ С ПОМОЩЬЮ НОВОЙ ФУНКЦИИ ---
-    sorted_checkerboard = _sort_checkerboard_data(checkerboard_data)
+    # В пакетном запуске шахматка показывается по одному дому
+    house_ids = get_run_house_ids(run_id)
+    active_house_id = request.args.get('house_id', type=int)
+    if active_house_id not in house_ids:
+        active_house_id = house_ids[0] if house_ids else None
+    house_names = _get_house_names() if len(house_ids) > 1 else {}
 
     return render_template(
         'results.html',
         results=results,
         total_apartments=total_apartments,
-        checkerboard=sorted_checkerboard  # Передаем новую вложенную структуру
+        checkerboard=get_checkerboards(run_id, active_house_id)['diff'],  # [section][floor] -> [apartments]
+        houses=[(house_id, house_names.get(house_id, str(house_id))) for house_id in house_ids],
+        active_house_id=active_house_id,
+        parse_report=get_parse_report(run_id, active_house_id)
     )
 
 
 @cadastre_bp.route('/deals')
 def deals_list():
     PER_PAGE = 20
-    page = request.args.get('page', 1, type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
 
-    categorized_results = session.get('categorized_results', {})
-    if not categorized_results:
+    run_id = _get_current_run_id()
+    if not run_id:
         flash('Нет обработанных данных для отображения. Пожалуйста, загрузите файл.', 'info')
         return redirect(url_for('cadastre_process.upload_page'))
 
-    all_deals_unfiltered = []
-    for group_key, deals_in_group in categorized_results.items():
-        for deal in deals_in_group:
-            deal['group_key'] = group_key
-            all_deals_unfiltered.append(deal)
-
-    all_deals = [
-        d for d in all_deals_unfiltered
-        if d.get('deal_id') is not None
-    ]
+    filters = {
+        'group_key': request.args.get('group_key', ''),
+        'status': request.args.get('status', ''),
+        'timeout': request.args.get('timeout', ''),
+    }
+    deals_for_page, total_deals = get_deals_page(run_id, filters, page, PER_PAGE)
+    if not total_deals and not any(filters.values()):
+        flash('Нет обработанных данных для отображения. Пожалуйста, загрузите файл.', 'info')
+        return redirect(url_for('cadastre_process.upload_page'))
 
-    all_deal_ids = [d['deal_id'] for d in all_deals]
-    statuses_map = get_statuses_for_deals(all_deal_ids)
-
-    for deal in all_deals:
-        status_obj = statuses_map.get(deal['deal_id'])
-        deal['status_obj'] = status_obj
-        deal['is_timed_out'] = False
-        deal['deadline_iso'] = None
-        if status_obj and status_obj.documents_delivered_at:
-            deadline = status_obj.documents_delivered_at + timedelta(days=30)
-            deal['is_timed_out'] = datetime.utcnow() > deadline
-            deal['deadline_iso'] = deadline.isoformat()
-
-    active_group_filter = request.args.get('group_key', '')
-    if active_group_filter:
-        filtered_deals = [d for d in all_deals if d.get('group_key') == active_group_filter]
-    else:
-        filtered_deals = all_deals
-
-    total_deals = len(filtered_deals)
-    start = (page - 1) * PER_PAGE
-    end = start + PER_PAGE
-    deals_for_page = filtered_deals[start:end]
     total_pages = math.ceil(total_deals / PER_PAGE)
 
     group_names = {
@@ -232,14 +334,23 @@ def deals_list():
         '3_debt_and_increase': '3) С долгом, с увел. площади', '4_debt_and_decrease': '4) С долгом, с уменьш. площади',
         '5_increase_only': '5) Без долга, с увел. площади', '6_decrease_only': '6) Без долга, с уменьш. площади',
     }
+    status_names = {
+        'processing': 'В обработке', 'pending_arrival': 'Ожидание явки клиента',
+        'acceptance_pending': 'Приемка', 'unilateral_pending': 'Односторонний акт',
+        'arrival_overdue': 'Срок явки истек', 'completed': 'Завершено',
+    }
 
     return render_template(
         'deals_list.html',
         deals=deals_for_page,
         group_names=group_names,
-        active_group_filter=active_group_filter,
+        status_names=status_names,
+        active_group_filter=filters['group_key'],
+        active_status_filter=filters['status'],
+        active_timeout_filter=filters['timeout'],
         current_page=page,
-        total_pages=total_pages
+        total_pages=total_pages,
+        house_names=_get_house_names() if len(get_run_house_ids(run_id)) > 1 else {}
     )
 
 
@@ -259,15 +370,40 @@ def download_template(house_id):
     )
 
 
+@cadastre_bp.route('/download-batch-template')
+def download_batch_template():
+    """Шаблон для пакетной загрузки: книга с листом на каждый дом ЖК."""
+    complex_name = request.args.get('complex_name')
+    houses = get_complexes_and_houses().get(complex_name) if complex_name else None
+    excel_buffer = generate_batch_template(houses) if houses else None
+    if excel_buffer is None:
+        flash('Не удалось сгенерировать пакетный шаблон для выбранного ЖК.', 'warning')
+        return redirect(url_for('cadastre_process.upload_page'))
+
+    return send_file(
+        excel_buffer, as_attachment=True,
+        download_name='template_batch.xlsx',
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
 @cadastre_bp.route('/download-archive/<group_key>')
 def download_archive(group_key):
-    results = session.get('categorized_results')
-    if not results or group_key not in results:
+    run_id = _get_current_run_id()
+    deals = get_group_deals(run_id, group_key) if run_id else None
+    if not deals:
         flash('Данные для генерации архива не найдены или сессия истекла.', 'danger')
         return redirect(url_for('cadastre_process.upload_page'))
 
-    archive_buffer = generate_archive_for_group(results[group_key], group_key)
+    if Config.ARCHIVE_STREAMING:
+        # Документы уходят клиенту по мере рендера; размер архива заранее неизвестен
+        return Response(
+            stream_with_context(stream_archive_for_group(deals, group_key)),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename=archive_{group_key}.zip'},
+        )
 
+    archive_buffer = generate_archive_for_group(deals, group_key)
     return send_file(
         archive_buffer, as_attachment=True,
         download_name=f'archive_{group_key}.zip', mimetype='application/zip'
@@ -276,8 +412,9 @@ def download_archive(group_key):
 
 @cadastre_bp.route('/download-document/<group_key>/<property_id>')
 def download_document(group_key, property_id):
-    results = session.get('categorized_results', {})
-    deal = next((d for d in results.get(group_key, []) if d['property_id'] == property_id), None)
+    run_id = _get_current_run_id()
+    house_id = request.args.get('house_id', type=int)
+    deal = find_deal_by_property(run_id, group_key, property_id, house_id) if run_id else None
     if not deal:
         flash(f'Сделка с номером квартиры {property_id} не найдена.', 'danger')
         return redirect(url_for('cadastre_process.deals_list'))
@@ -303,6 +440,28 @@ def mark_arrived(deal_id):
     return jsonify({'status': 'success' if success else 'error'}), 200 if success else 500
 
 
+@cadastre_bp.route('/batch-status', methods=['POST'])
+def batch_status():
+    """
+    Одно действие (mark_delivered / mark_arrived) для списка сделок (пишется пачками).
+    Тело: {"action": ..., "deal_ids": [...]}; в ответе - результат по каждой сделке.
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    deal_ids = data.get('deal_ids')
+    if action not in BATCH_ACTIONS or not isinstance(deal_ids, list) or not deal_ids:
+        return jsonify({'status': 'error', 'message': 'Нужны action из списка и непустой deal_ids'}), 400
+    try:
+        deal_ids = [int(deal_id) for deal_id in deal_ids]
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'deal_ids должны быть числами'}), 400
+
+    results = update_deal_statuses(deal_ids, action)
+    updated = sum(result['ok'] for result in results)
+    status = 'success' if updated == len(results) else ('partial' if updated else 'error')
+    return jsonify({'status': status, 'updated': updated, 'failed': len(results) - updated, 'results': results})
+
+
 @cadastre_bp.route('/download-unilateral-act/<int:deal_id>')
 def download_unilateral_act(deal_id):
     deal_data = get_single_deal_details(deal_id)
@@ -331,11 +490,17 @@ def upload_unilateral_act(deal_id):
         flash('Файл не выбран.', 'danger')
         return redirect(url_for('cadastre_process.deals_list'))
 
-    filename = secure_filename(f"unilateral_act_deal_{deal_id}.pdf")
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(filepath)
+    try:
+        scan_key = save_scan(file)
+    except ScanStorageError as e:
+        flash(f'Скан не загружен: {e}', 'danger')
+        return redirect(url_for('cadastre_process.deals_list'))
+
+    # Непринятый скан остается в хранилище без ссылок - его удалит сборка мусора (collect_orphan_scans)
+    if not update_deal_status(deal_id, 'act_uploaded', data=scan_key):
+        flash('Скан не загружен: не удалось обновить статус сделки.', 'danger')
+        return redirect(url_for('cadastre_process.deals_list'))
 
-    update_deal_status(deal_id, 'act_uploaded', data=filepath)
     flash('Скан одностороннего акта успешно загружен.', 'success')
     return redirect(url_for('cadastre_process.deals_list'))
 
@@ -365,17 +530,45 @@ def upload_final_docs(deal_id):
     signed_act = request.files.get('signed_act')
     defect_list = request.files.get('defect_list')
 
-    if signed_act:
-        filename = f"signed_act_deal_{deal_id}.pdf"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        signed_act.save(filepath)
-        update_deal_status(deal_id, 'upload_signed_act', data=filepath)
+    try:
+        # Оба файла сохраняются до изменения статуса, чтобы не записать половину
+        signed_act_key = save_scan(signed_act) if signed_act else None
+        defect_list_key = save_scan(defect_list) if defect_list else None
+    except ScanStorageError as e:
+        flash(f'Файлы не загружены: {e}', 'danger')
+        return redirect(url_for('cadastre_process.deals_list'))
 
-    if defect_list:
-        filename = f"defect_list_deal_{deal_id}.pdf"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        defect_list.save(filepath)
-        update_deal_status(deal_id, 'upload_defect_list', data=filepath)
+    # Непринятые сканы остаются в хранилище без ссылок - их удалит сборка мусора (collect_orphan_scans)
+    if signed_act_key and not update_deal_status(deal_id, 'upload_signed_act', data=signed_act_key):
+        flash('Файлы не загружены: не удалось обновить статус сделки.', 'danger')
+        return redirect(url_for('cadastre_process.deals_list'))
+    if defect_list_key and not update_deal_status(deal_id, 'upload_defect_list', data=defect_list_key):
+        message = 'Акт загружен, но лист дефектов' if signed_act_key else 'Лист дефектов'
+        flash(f'{message} не загружен: не удалось обновить статус сделки.', 'danger')
+        return redirect(url_for('cadastre_process.deals_list'))
 
     flash('Файлы успешно загружены.', 'success')
-    return redirect(url_for('cadastre_process.deals_list'))
\ No newline at end of file
+    return redirect(url_for('cadastre_process.deals_list'))
+
+
+@cadastre_bp.route('/scans/<int:deal_id>/<kind>')
+def download_scan(deal_id, kind):
+    """
+    Отдает загруженный скан сделки. Поддерживает Range (просмотр больших PDF по частям)
+    и условные запросы: ETag - хэш содержимого, поэтому файл кэшируется надолго.
+    """
+    status = get_statuses_for_deals([deal_id]).get(deal_id)
+    column = SCAN_KINDS.get(kind)
+    scan_key = getattr(status, column) if status is not None and column else None
+    path = scan_path(scan_key)
+    if not path or not os.path.isfile(path):
+        flash('Скан не найден.', 'danger')
+        return redirect(url_for('cadastre_process.deals_list'))
+
+    etag = scan_etag(scan_key)
+    return send_file(
+        os.path.abspath(path), conditional=True, etag=etag or True,
+        mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream',
+        download_name=f'{kind}_deal_{deal_id}{os.path.splitext(path)[1]}',
+        max_age=31536000 if etag else None,
+    )
\ No newline at end of file
@@ -0,0 +1,127 @@
+# app/cadastre_process/services/checkerboard_service.py
+
+from collections import OrderedDict, defaultdict
+
+from app import db
+from app.cache import checkerboard_cache
+from ..models import UploadRun
+
+NO_VALUE = 'N/A'
+
+# Виды шахматки и поле значения в ячейке
+CHECKERBOARD_VIEWS = {
+    'diff': 'area_diff',   # расхождения
+    'file': 'area',        # площади из загруженного файла
+    'db': 'area',          # площади по договору из CRM
+}
+
+
+def _as_number(value):
+    """Число для естественной сортировки ('10' после '9') или None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _natural_key(value):
+    """Сначала числа по возрастанию, затем строки (в т.ч. 'N/A')."""
+    number = _as_number(value)
+    return (0, number, '') if number is not None else (1, 0.0, str(value))
+
+
+def _floor_key(value):
+    """Этажи: числовые сверху вниз (по убыванию), затем нечисловые."""
+    number = _as_number(value)
+    return (0, -number, '') if number is not None else (1, 0.0, str(value))
+
+
+def _to_sorted_view(grouped):
+    """
+    defaultdict [section][floor] -> [[property_id, value], ...] в компактный
+    отсортированный вид: [[section, [[floor, [[property_id, value], ...]], ...]], ...].
+    Ключи сортировки считаются один раз на элемент.
+    """
+    view = []
+    for section in sorted(grouped, key=_natural_key):
+        floors = grouped[section]
+        view.append([section, [
+            [floor, sorted(floors[floor], key=lambda cell: _natural_key(cell[0]))]
+            for floor in sorted(floors, key=_floor_key)
+        ]])
+    return view
+
+
+def build_checkerboards(cadastre_data: dict, categorized_results: dict) -> dict:
+    """
+    Строит три шахматки запуска (расхождения, файл, CRM) один раз при загрузке.
+    Результат - JSON-совместимые списки, уже отсортированные по подъездам,
+    этажам и номерам квартир.
+    """
+    grouped = {view: defaultdict(lambda: defaultdict(list)) for view in CHECKERBOARD_VIEWS}
+    placement = {}
+
+    for deals in categorized_results.values():
+        for deal in deals:
+            prop_id = str(deal['property_id'])
+            section = deal.get('section') or NO_VALUE
+            floor = deal.get('floor') or NO_VALUE
+            placement[prop_id] = (section, floor)
+            grouped['diff'][section][floor].append([deal['property_id'], deal['area_diff']])
+            grouped['db'][section][floor].append([deal['property_id'], deal.get('contract_area', 0)])
+
+    # Квартиры из файла без сделки попадают в подъезд/этаж 'N/A'
+    for prop_id, area in cadastre_data.items():
+        section, floor = placement.get(str(prop_id), (NO_VALUE, NO_VALUE))
+        grouped['file'][section][floor].append([prop_id, area])
+
+    return {view: _to_sorted_view(grouped[view]) for view in CHECKERBOARD_VIEWS}
+
+
+def _expand_view(view, value_field):
+    """Компактный вид -> OrderedDict[section][floor] -> [{'property_id', value_field}, ...]."""
+    return OrderedDict(
+        (section, OrderedDict(
+            (floor, [{'property_id': prop_id, value_field: value} for prop_id, value in cells])
+            for floor, cells in floors
+        ))
+        for section, floors in view
+    )
+
+
+def expand_checkerboards(stored: dict) -> dict:
+    """Шахматки дома из компактного вида build_checkerboards в вид для шаблона и Excel."""
+    return {
+        view: _expand_view(stored[view], value_field)
+        for view, value_field in CHECKERBOARD_VIEWS.items()
+    }
+
+
+def get_checkerboards(run_id, house_id=None):
+    """
+    Возвращает шахматки дома из запуска {'diff': ..., 'file': ..., 'db': ...} или None.
+    Без house_id - шахматки первого (для обычной загрузки - единственного) дома.
+    Готовая структура кэшируется в памяти процесса, повторные просмотры
+    и выгрузки не обращаются к БД.
+    """
+    cache_key = (run_id, None if house_id is None else str(house_id))
+    checkerboards = checkerboard_cache.get(cache_key)
+    if checkerboards is not None:
+        return checkerboards
+
+    run = db.session.get(UploadRun, run_id) if run_id else None
+    stored_by_house = run.checkerboards if run else None
+    if not stored_by_house:
+        return None
+    house_key = str(house_id) if house_id is not None else next(iter(stored_by_house))
+    stored = stored_by_house.get(house_key)
+    if not stored:
+        return None
+
+    checkerboards = expand_checkerboards(stored)
+    checkerboard_cache.set(cache_key, checkerboards)
+    return checkerboards
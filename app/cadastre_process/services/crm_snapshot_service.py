@@ -0,0 +1,250 @@
+# app/cadastre_process/services/crm_snapshot_service.py
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import bindparam, cast, delete, func, insert, select, text, update, Integer
+
+from app import db
+from app.config import Config
+from app.database import mysql_session_factory
+from app.metrics import timed
+from ..models import CrmSnapshotHouse, CrmSnapshotRow
+
+logger = logging.getLogger(__name__)
+
+# Квартиры с активной сделкой и покупателем - основа запросов к CRM (data_service) и снимка
+CRM_DEALS_FROM = """
+    SELECT
+        es.house_id,
+        es.id AS estate_sell_id,
+        es.geo_flatnum,
+        es.estate_floor,
+        es.geo_house_entrance, -- <-- ИСПОЛЬЗУЕМ КОРРЕКТНОЕ ИМЯ ПОЛЯ
+        es.estate_sell_status_name,
+        es.estate_area, -- Базовая площадь из объекта
+        d.id as deal_id,
+        d.deal_area,  -- Площадь из сделки (может быть NULL)
+        d.deal_status_name,
+        d.seller_contacts_id,
+        (d.finances_income_reserved > 0) AS has_debt,
+        edc.contacts_buy_name
+    FROM estate_sells es
+    LEFT JOIN estate_deals d ON es.id = d.estate_sell_id AND d.deal_status_name IN ('Сделка в работе', 'Сделка проведена')
+    LEFT JOIN estate_deals_contacts edc ON d.contacts_buy_id = edc.id
+"""
+
+_SNAPSHOT_QUERY = text(CRM_DEALS_FROM + """
+    WHERE es.house_id IN :h_ids
+      AND es.estate_sell_category = 'flat'
+""").bindparams(bindparam('h_ids', expanding=True))
+
+# Колонки снимка в порядке выборки (id - внутренний, сохраняет порядок строк CRM)
+SNAPSHOT_COLUMNS = tuple(column.name for column in CrmSnapshotRow.__table__.columns if column.name != 'id')
+
+_refresh_lock = threading.Lock()
+_refresher_started = False
+_refresher_lock = threading.Lock()
+
+
+def _row_values(row) -> dict:
+    """Строка выборки CRM в значения колонок снимка (Decimal -> float, номер квартиры - строкой)."""
+    mapping = row._mapping
+    values = {}
+    for name in SNAPSHOT_COLUMNS:
+        value = mapping[name]
+        values[name] = float(value) if isinstance(value, Decimal) else value
+    values['house_id'] = int(values['house_id'])
+    if values['geo_flatnum'] is not None:
+        values['geo_flatnum'] = str(values['geo_flatnum'])
+    if values['has_debt'] is not None:
+        values['has_debt'] = bool(values['has_debt'])
+    return values
+
+
+def _checksum(rows: list) -> str:
+    """Контрольная сумма строк дома: по ней видно, изменились ли данные CRM с прошлого обновления."""
+    digest = hashlib.blake2b(digest_size=16)
+    for values in rows:
+        digest.update(repr(tuple(values[name] for name in SNAPSHOT_COLUMNS)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+@timed('crm_snapshot_refresh', rows=lambda reports: sum(report['rows'] for report in reports.values()))
+def refresh_snapshots(house_ids) -> dict:
+    """
+    Перечитывает квартиры домов из CRM одним запросом и обновляет их снимки. Строки дома
+    переписываются, только если изменилась их контрольная сумма, иначе обновляется лишь
+    время проверки. Возвращает {house_id: {'rows': N, 'changed': bool}}.
+    """
+    house_ids = list(dict.fromkeys(int(house_id) for house_id in house_ids))
+    if not house_ids:
+        return {}
+
+    rows_by_house = {house_id: [] for house_id in house_ids}
+    mysql_session = mysql_session_factory()
+    try:
+        result = mysql_session.execute(
+            _SNAPSHOT_QUERY, {'h_ids': house_ids}, execution_options={'yield_per': Config.DEALS_YIELD_PER}
+        )
+        for row in result:
+            values = _row_values(row)
+            rows_by_house[values['house_id']].append(values)
+    finally:
+        mysql_session.close()
+
+    now = datetime.utcnow()
+    reports = {}
+    with _refresh_lock:
+        try:
+            for house_id, rows in rows_by_house.items():
+                checksum = _checksum(rows)
+                snapshot = db.session.get(CrmSnapshotHouse, house_id)
+                changed = snapshot is None or snapshot.checksum != checksum
+                if changed:
+                    db.session.execute(delete(CrmSnapshotRow).where(CrmSnapshotRow.house_id == house_id))
+                    if rows:
+                        db.session.execute(insert(CrmSnapshotRow), rows)
+                    if snapshot is None:
+                        snapshot = CrmSnapshotHouse(house_id=house_id)
+                        db.session.add(snapshot)
+                    snapshot.checksum = checksum
+                    snapshot.rows_count = len(rows)
+                    snapshot.changed_at = now
+                snapshot.refreshed_at = now
+                snapshot.stale = False
+                reports[house_id] = {'rows': len(rows), 'changed': changed}
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return reports
+
+
+def _stale_house_ids(house_ids: list) -> list:
+    fresh_border = datetime.utcnow() - timedelta(seconds=Config.CRM_SNAPSHOT_MAX_AGE)
+    fresh = set(db.session.scalars(
+        select(CrmSnapshotHouse.house_id)
+        .where(
+            CrmSnapshotHouse.house_id.in_(house_ids),
+            CrmSnapshotHouse.refreshed_at >= fresh_border,
+            CrmSnapshotHouse.stale.is_(False),
+        )
+    ))
+    return [house_id for house_id in house_ids if house_id not in fresh]
+
+
+def ensure_snapshots(house_ids) -> dict:
+    """
+    Снимки домов не старше CRM_SNAPSHOT_MAX_AGE: отсутствующие и устаревшие перечитываются
+    из CRM (одним запросом на все такие дома). Возвращает отчет refresh_snapshots или {}.
+    """
+    house_ids = list(dict.fromkeys(int(house_id) for house_id in house_ids))
+    stale = _stale_house_ids(house_ids)
+    return refresh_snapshots(stale) if stale else {}
+
+
+def snapshot_rows(house_ids):
+    """Строки снимка домов в порядке выборки CRM (поля - как в запросе к CRM)."""
+    columns = [getattr(CrmSnapshotRow, name) for name in SNAPSHOT_COLUMNS]
+    return db.session.execute(
+        select(*columns)
+        .where(CrmSnapshotRow.house_id.in_([int(house_id) for house_id in house_ids]))
+        .order_by(CrmSnapshotRow.id)
+    )
+
+
+def snapshot_flatnums(house_id: int):
+    """Номера квартир дома из снимка (по одному на объект), как в CRM: по числовому значению номера."""
+    first_row_ids = (
+        select(func.min(CrmSnapshotRow.id))
+        .where(CrmSnapshotRow.house_id == house_id)
+        .group_by(CrmSnapshotRow.estate_sell_id)
+    )
+    return db.session.execute(
+        select(CrmSnapshotRow.geo_flatnum)
+        .where(CrmSnapshotRow.id.in_(first_row_ids))
+        .order_by(cast(CrmSnapshotRow.geo_flatnum, Integer), CrmSnapshotRow.id)
+    ).fetchall()
+
+
+def snapshot_deal(deal_id: int):
+    """
+    Номер квартиры и покупатель сделки из свежего снимка ее дома или None
+    (сделки нет в снимках или снимок устарел - тогда нужен запрос к CRM).
+    """
+    fresh_border = datetime.utcnow() - timedelta(seconds=Config.CRM_SNAPSHOT_MAX_AGE)
+    row = db.session.execute(
+        select(
+            CrmSnapshotRow.deal_id,
+            CrmSnapshotRow.geo_flatnum.label('property_id'),
+            CrmSnapshotRow.contacts_buy_name.label('client_name'),
+        )
+        .join(CrmSnapshotHouse, CrmSnapshotHouse.house_id == CrmSnapshotRow.house_id)
+        .where(
+            CrmSnapshotRow.deal_id == deal_id,
+            CrmSnapshotHouse.refreshed_at >= fresh_border,
+            CrmSnapshotHouse.stale.is_(False),
+        )
+        .limit(1)
+    ).first()
+    return dict(row._mapping) if row else None
+
+
+def expire_snapshots():
+    """Помечает все снимки устаревшими: при следующем обращении они перечитаются из CRM."""
+    db.session.execute(update(CrmSnapshotHouse).values(stale=True))
+    db.session.commit()
+
+
+def get_snapshot_stats():
+    """Состояние снимков по домам: число строк, возраст (сек), когда данные менялись, свежесть, сброс."""
+    now = datetime.utcnow()
+    stats = []
+    for snapshot in db.session.scalars(select(CrmSnapshotHouse).order_by(CrmSnapshotHouse.house_id)):
+        age = (now - snapshot.refreshed_at).total_seconds()
+        stats.append({
+            'house_id': snapshot.house_id,
+            'rows': snapshot.rows_count,
+            'refreshed_at': snapshot.refreshed_at.isoformat(),
+            'changed_at': snapshot.changed_at.isoformat(),
+            'age_seconds': round(age, 1),
+            'stale': snapshot.stale,
+            'fresh': not snapshot.stale and age <= Config.CRM_SNAPSHOT_MAX_AGE,
+        })
+    return stats
+
+
+def _refresh_loop(app, stop_event):
+    while not stop_event.wait(Config.CRM_SNAPSHOT_REFRESH_INTERVAL):
+        with app.app_context():
+            try:
+                house_ids = db.session.scalars(select(CrmSnapshotHouse.house_id)).all()
+                reports = refresh_snapshots(house_ids)
+                changed = [house_id for house_id, report in reports.items() if report['changed']]
+                if changed:
+                    logger.info('Снимки CRM обновлены, изменились дома: %s', changed)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Ошибка фонового обновления снимков CRM')
+
+
+def start_snapshot_refresher(app):
+    """
+    Запускает фоновое обновление всех снимков CRM раз в CRM_SNAPSHOT_REFRESH_INTERVAL секунд
+    (0 - не запускать, снимки обновляются по обращению). Один поток на процесс приложения.
+    """
+    global _refresher_started
+    if not Config.CRM_SNAPSHOT_ENABLED or not Config.CRM_SNAPSHOT_REFRESH_INTERVAL:
+        return None
+    with _refresher_lock:
+        if _refresher_started:
+            return None
+        _refresher_started = True
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=_refresh_loop, args=(app, stop_event), name='crm-snapshot-refresher', daemon=True
+    )
+    thread.start()
+    return stop_event
@@ -1,221 +1,390 @@
 # app/cadastre_process/services/data_service.py
 
+import logging
+import threading
 from collections import defaultdict
-from datetime import datetime, timedelta
-from sqlalchemy import text
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, select, text
 
 from app import db
-from app.database import MysqlSession
+from app.cache import cached, reference_cache
+from app.config import Config
+from app.database import MysqlSession, mysql_session_factory
+from app.metrics import timed
+from app.write_coalescer import WriteCoalescer
 from ..models import DealStatus
+from .crm_snapshot_service import (
+    CRM_DEALS_FROM, ensure_snapshots, snapshot_deal, snapshot_flatnums, snapshot_rows,
+)
+from .deadline_service import OVERDUE_STATUS, arrival_deadline_for
 
+logger = logging.getLogger(__name__)
 
+_status_writer_lock = threading.Lock()
+
+
+@cached(reference_cache, ttl=Config.HOUSES_CACHE_TTL)
 def get_complexes_and_houses():
     """Получает список всех ЖК и домов из MySQL для UI фильтров."""
     db_session = MysqlSession()
     houses_data = defaultdict(list)
-    try:
-        query = text(
-            "SELECT id, complex_name, name FROM estate_houses WHERE complex_name IS NOT NULL AND name IS NOT NULL ORDER BY complex_name, name;")
-        result = db_session.execute(query).fetchall()
-        for row in result:
-            houses_data[row.complex_name].append({'id': row.id, 'name': row.name})
-        return houses_data
-    finally:
-        MysqlSession.remove()
+    query = text(
+        "SELECT id, complex_name, name FROM estate_houses WHERE complex_name IS NOT NULL AND name IS NOT NULL ORDER BY complex_name, name;")
+    result = db_session.execute(query).fetchall()
+    for row in result:
+        houses_data[row.complex_name].append({'id': row.id, 'name': row.name})
+    return houses_data
 
 
+@cached(reference_cache)
 def get_apartments_for_house(house_id: int):
-    """Получает номера квартир из MySQL для генерации Excel-шаблона."""
+    """Получает номера квартир из MySQL (или снимка CRM) для генерации Excel-шаблона."""
+    if Config.CRM_SNAPSHOT_ENABLED:
+        ensure_snapshots([house_id])
+        return snapshot_flatnums(house_id)
+
     db_session = MysqlSession()
+    query = text("""
+        SELECT es.geo_flatnum FROM estate_sells es
+        WHERE es.house_id = :h_id 
+          AND es.estate_sell_category = 'flat'
+        ORDER BY CAST(es.geo_flatnum AS UNSIGNED);
+    """)
+    return db_session.execute(query, {'h_id': house_id}).fetchall()
+
+
+_DEALS_SELECT = CRM_DEALS_FROM + """
+    WHERE es.house_id = :h_id
+      AND es.estate_sell_category = 'flat'
+"""
+
+_DEALS_BY_IDS_QUERY = text(_DEALS_SELECT + " AND es.geo_flatnum IN :p_ids").bindparams(
+    bindparam('p_ids', expanding=True)
+)
+_DEALS_BY_HOUSE_QUERY = text(_DEALS_SELECT)
+
+# Пакетная загрузка: все дома одним запросом
+_DEALS_BY_HOUSES_QUERY = text(CRM_DEALS_FROM + """
+    WHERE es.house_id IN :h_ids
+      AND es.estate_sell_category = 'flat'
+""").bindparams(bindparam('h_ids', expanding=True))
+
+
+def _row_to_property(row):
+    """Преобразует строку выборки в словарь данных по объекту."""
+    # Логика выбора площади: приоритет у сделки, если ее нет - берем из объекта
+    contract_area = row.deal_area if row.deal_area is not None else row.estate_area
+    return {
+        'deal_id': row.deal_id,
+        'contract_area': contract_area or 0,
+        'client_id': row.seller_contacts_id,
+        'floor': row.estate_floor,
+        'section': row.geo_house_entrance, # <-- ДОБАВЛЕНЫ ДАННЫЕ О ПОДЪЕЗДЕ
+        'has_debt': bool(row.has_debt),
+        'client_name': row.contacts_buy_name,
+        'deal_status_name': row.deal_status_name,
+        'sell_status_name': row.estate_sell_status_name
+    }
+
+
+def _collect_properties(rows, wanted_ids=None):
+    """
+    Собирает словарь объектов из строк выборки (CRM или снимка).
+    Если передан wanted_ids, оставляет только эти квартиры (hash-join на стороне Python).
+    """
+    properties_data = {}
+    for row in rows:
+        prop_id = str(row.geo_flatnum)
+        if wanted_ids is not None and prop_id not in wanted_ids:
+            continue
+        properties_data[prop_id] = _row_to_property(row)
+    return properties_data
+
+
+def _stream_properties(db_session, query, params, wanted_ids=None):
+    """Выполняет запрос с потоковой выборкой (yield_per) и собирает словарь объектов."""
+    result = db_session.execute(
+        query, params, execution_options={'yield_per': Config.DEALS_YIELD_PER}
+    )
+    return _collect_properties(result, wanted_ids)
+
+
+def _fetch_chunk(property_ids: list, house_id: int):
+    """Выполняет одну пачку IN-запроса на отдельном соединении из пула."""
+    db_session = mysql_session_factory()
     try:
-        query = text("""
-            SELECT es.geo_flatnum FROM estate_sells es
-            WHERE es.house_id = :h_id 
-              AND es.estate_sell_category = 'flat'
-            ORDER BY CAST(es.geo_flatnum AS UNSIGNED);
-        """)
-        return db_session.execute(query, {'h_id': house_id}).fetchall()
+        return _stream_properties(db_session, _DEALS_BY_IDS_QUERY, {'p_ids': property_ids, 'h_id': house_id})
     finally:
-        MysqlSession.remove()
+        db_session.close()
 
 
+@timed('get_deals_data', rows=len)
 def get_deals_data(db_session, property_ids: list, house_id: int):
     """
     Получает данные по всем объектам из estate_sells. Если для объекта есть активная
     сделка, присоединяет данные из нее.
+
+    При CRM_SNAPSHOT_ENABLED данные берутся из локального снимка дома (он перечитывается
+    из CRM, если старше CRM_SNAPSHOT_MAX_AGE). Иначе стратегия выбирается по размеру списка квартир:
+      - небольшой список - один запрос с IN;
+      - средний - пачки IN по DEALS_CHUNK_SIZE, параллельно на соединениях из пула;
+      - большой - весь дом по house_id с фильтрацией нужных квартир в Python.
     """
-    query = text("""
-        SELECT
-            es.geo_flatnum,
-            es.estate_floor,
-            es.geo_house_entrance, -- <-- ИСПОЛЬЗУЕМ КОРРЕКТНОЕ ИМЯ ПОЛЯ
-            es.estate_sell_status_name,
-            es.estate_area, -- Базовая площадь из объекта
-            d.id as deal_id,
-            d.deal_area,  -- Площадь из сделки (может быть NULL)
-            d.deal_status_name,
-            d.seller_contacts_id,
-            (d.finances_income_reserved > 0) AS has_debt,
-            edc.contacts_buy_name
-        FROM estate_sells es
-        LEFT JOIN estate_deals d ON es.id = d.estate_sell_id AND d.deal_status_name IN ('Сделка в работе', 'Сделка проведена')
-        LEFT JOIN estate_deals_contacts edc ON d.contacts_buy_id = edc.id
-        WHERE es.house_id = :h_id
-          AND es.geo_flatnum IN :p_ids
-          AND es.estate_sell_category = 'flat';
-    """)
-    result = db_session.execute(query, {'p_ids': property_ids, 'h_id': house_id}).fetchall()
+    property_ids = [str(p) for p in property_ids]
+    if not property_ids:
+        return {}
 
+    if Config.CRM_SNAPSHOT_ENABLED:
+        ensure_snapshots([house_id])
+        return _collect_properties(snapshot_rows([house_id]), wanted_ids=set(property_ids))
+
+    if len(property_ids) >= Config.DEALS_HOUSE_SCAN_THRESHOLD:
+        return _stream_properties(
+            db_session, _DEALS_BY_HOUSE_QUERY, {'h_id': house_id}, wanted_ids=set(property_ids)
+        )
+
+    chunk_size = Config.DEALS_CHUNK_SIZE
+    if len(property_ids) <= chunk_size:
+        return _stream_properties(db_session, _DEALS_BY_IDS_QUERY, {'p_ids': property_ids, 'h_id': house_id})
+
+    chunks = [property_ids[i:i + chunk_size] for i in range(0, len(property_ids), chunk_size)]
     properties_data = {}
-    for row in result:
-        # Логика выбора площади: приоритет у сделки, если ее нет - берем из объекта
-        contract_area = row.deal_area if row.deal_area is not None else row.estate_area
-
-        properties_data[str(row.geo_flatnum)] = {
-            'deal_id': row.deal_id,
-            'contract_area': contract_area or 0,
-            'client_id': row.seller_contacts_id,
-            'floor': row.estate_floor,
-            'section': row.geo_house_entrance, # <-- ДОБАВЛЕНЫ ДАННЫЕ О ПОДЪЕЗДЕ
-            'has_debt': bool(row.has_debt),
-            'client_name': row.contacts_buy_name,
-            'deal_status_name': row.deal_status_name,
-            'sell_status_name': row.estate_sell_status_name
-        }
+    with ThreadPoolExecutor(max_workers=min(Config.DEALS_QUERY_WORKERS, len(chunks))) as executor:
+        for chunk_data in executor.map(lambda chunk: _fetch_chunk(chunk, house_id), chunks):
+            properties_data.update(chunk_data)
     return properties_data
 
 
-def get_filtered_deals(filters: dict, page: int, per_page: int):
+@timed('get_deals_data', rows=lambda by_house: sum(map(len, by_house.values())))
+def get_deals_data_for_houses(db_session, property_ids_by_house: dict):
     """
-    Получает сделки из MySQL, а затем обогащает их статусами из SQLite.
+    Пакетный вариант get_deals_data: данные по квартирам нескольких домов
+    одним запросом (house_id IN ...) к CRM или снимкам домов с потоковой выборкой
+    и hash-join по (дом, номер квартиры) на стороне Python.
+    Возвращает {house_id: {property_id: данные объекта}}.
     """
-    # Шаг 1: Получаем основные данные по сделкам из MySQL
-    db_session_mysql = MysqlSession()
-    deals_for_page = []
-    total_count = 0
-    try:
-        base_query = """
-            FROM estate_deals d
-            JOIN estate_sells es ON d.estate_sell_id = es.id
-            JOIN estate_houses h ON d.house_id = h.id
-            LEFT JOIN estate_deals_contacts edc ON d.contacts_buy_id = edc.id
-        """
-        where_clauses = ["es.estate_sell_category = 'flat'"]
-        params = {}
-
-        if filters.get('complex_name'):
-            where_clauses.append("h.complex_name = :complex_name")
-            params['complex_name'] = filters['complex_name']
-        if filters.get('house_id'):
-            where_clauses.append("d.house_id = :house_id")
-            params['house_id'] = filters['house_id']
-
-        where_sql = " WHERE " + " AND ".join(where_clauses)
-
-        count_query = text(f"SELECT COUNT(d.id) {base_query} {where_sql}")
-        total_count = db_session_mysql.execute(count_query, params).scalar_one()
-
-        offset = (page - 1) * per_page
-        data_query_str = f"""
-            SELECT d.id as deal_id, d.deal_status_name, es.geo_flatnum, 
-                   h.complex_name, h.name as house_name, d.finances_income_reserved,
-                   edc.contacts_buy_name, edc.contacts_buy_phones
-            {base_query} {where_sql}
-            ORDER BY d.id DESC
-            LIMIT :limit OFFSET :offset
-        """
-        params.update({'limit': per_page, 'offset': offset})
-        deals_for_page_raw = db_session_mysql.execute(text(data_query_str), params).fetchall()
-        deals_for_page = [dict(row._mapping) for row in deals_for_page_raw]
-    finally:
-        MysqlSession.remove()
+    wanted = {
+        str(house_id): {str(p) for p in property_ids}
+        for house_id, property_ids in property_ids_by_house.items()
+    }
+    properties_by_house = {house_id: {} for house_id in property_ids_by_house}
+    if not any(wanted.values()):
+        return properties_by_house
+
+    house_keys = {str(house_id): house_id for house_id in property_ids_by_house}
+    if Config.CRM_SNAPSHOT_ENABLED:
+        ensure_snapshots(list(property_ids_by_house))
+        result = snapshot_rows(list(property_ids_by_house))
+    else:
+        result = db_session.execute(
+            _DEALS_BY_HOUSES_QUERY, {'h_ids': list(property_ids_by_house)},
+            execution_options={'yield_per': Config.DEALS_YIELD_PER}
+        )
+    for row in result:
+        house_key = str(row.house_id)
+        prop_id = str(row.geo_flatnum)
+        if prop_id in wanted.get(house_key, ()):
+            properties_by_house[house_keys[house_key]][prop_id] = _row_to_property(row)
+    return properties_by_house
 
-    # Шаг 2: Обогащаем данные статусами из локальной SQLite базы
-    if deals_for_page:
-        deal_ids = [d['deal_id'] for d in deals_for_page]
-        statuses = DealStatus.query.filter(DealStatus.deal_id.in_(deal_ids)).all()
-        status_map = {s.deal_id: s for s in statuses}
 
-        # Шаг 3: Объединяем данные, добавляя статус и вычисляя дедлайн
-        for deal in deals_for_page:
-            status_obj = status_map.get(deal['deal_id'])
-            deal['status_obj'] = status_obj
-            deal['is_timed_out'] = False
-            deal['deadline_iso'] = None
+def get_single_deal_details(deal_id: int):
+    """
+    Получает детальную информацию по одной сделке по ее ID: из свежего снимка CRM,
+    если сделка в нем есть, иначе из MySQL.
+    """
+    if Config.CRM_SNAPSHOT_ENABLED:
+        deal = snapshot_deal(deal_id)
+        if deal:
+            return deal
 
-            if status_obj and status_obj.documents_delivered_at:
-                deadline = status_obj.documents_delivered_at + timedelta(days=30)
-                deal['is_timed_out'] = datetime.utcnow() > deadline
-                deal['deadline_iso'] = deadline.isoformat()
+    db_session_mysql = MysqlSession()
+    query = text("""
+        SELECT d.id as deal_id, es.geo_flatnum as property_id, edc.contacts_buy_name as client_name
+        FROM estate_deals d
+        JOIN estate_sells es ON d.estate_sell_id = es.id
+        LEFT JOIN estate_deals_contacts edc ON d.contacts_buy_id = edc.id
+        WHERE d.id = :deal_id
+    """)
+    result = db_session_mysql.execute(query, {'deal_id': deal_id}).fetchone()
+    return dict(result._mapping) if result else None
 
-    return deals_for_page, total_count
 
+# Из каких статусов разрешено каждое действие при массовом изменении (update_deal_statuses);
+# одиночные действия со страницы сделок, как и раньше, статус не проверяют
+TRANSITION_RULES = {
+    'mark_delivered': ('processing',),
+    # Клиент может прийти и после истечения срока, пока не оформлен односторонний акт
+    'mark_arrived': ('pending_arrival', OVERDUE_STATUS),
+    'acceptance_act_downloaded': ('acceptance_pending',),
+    'process_acceptance': ('acceptance_pending',),
+    'upload_signed_act': ('acceptance_pending', 'completed'),
+    'upload_defect_list': ('acceptance_pending', 'completed'),
+    'act_downloaded': ('pending_arrival', OVERDUE_STATUS, 'unilateral_pending'),
+    'act_uploaded': ('pending_arrival', OVERDUE_STATUS, 'unilateral_pending', 'completed'),
+}
 
-def get_single_deal_details(deal_id: int):
-    """Получает детальную информацию по одной сделке из MySQL по ее ID."""
-    db_session_mysql = MysqlSession()
-    try:
-        query = text("""
-            SELECT d.id as deal_id, es.geo_flatnum as property_id, edc.contacts_buy_name as client_name
-            FROM estate_deals d
-            JOIN estate_sells es ON d.estate_sell_id = es.id
-            LEFT JOIN estate_deals_contacts edc ON d.contacts_buy_id = edc.id
-            WHERE d.id = :deal_id
-        """)
-        result = db_session_mysql.execute(query, {'deal_id': deal_id}).fetchone()
-        return dict(result._mapping) if result else None
-    finally:
-        MysqlSession.remove()
+# Действия без дополнительных данных, которые можно применять к списку сделок
+BATCH_ACTIONS = ('mark_delivered', 'mark_arrived')
 
 
-def update_deal_status(deal_id: int, action: str, data=None):
-    """Центральная функция для обновления статуса сделки в SQLite."""
-    try:
-        status = DealStatus.query.get(deal_id)
-        if not status: return False
-
-        if action == 'mark_delivered':
-            status.documents_delivered_at = datetime.utcnow()
-            status.status = 'pending_arrival'
-        elif action == 'mark_arrived':
-            status.client_arrived_at = datetime.utcnow()
-            status.status = 'acceptance_pending'
-
-        # --- ОБНОВЛЕННЫЕ ДЕЙСТВИЯ ---
-        elif action == 'acceptance_act_downloaded':
-            status.acceptance_act_downloaded_at = datetime.utcnow()
-
-        elif action == 'process_acceptance':
-            is_signed = data.get('is_signed')
-            has_defects = data.get('has_defects')
-            status.is_act_signed = is_signed
-            status.has_defect_list = has_defects
-            if is_signed is False and has_defects is False:
-                status.status = 'unilateral_pending'
-
-        elif action == 'upload_signed_act':
-            status.signed_act_uploaded_path = data
-            if not status.has_defect_list:
-                status.status = 'completed'
-        elif action == 'upload_defect_list':
-            status.defect_list_uploaded_path = data
-            if status.signed_act_uploaded_path:
-                status.status = 'completed'
-
-        elif action == 'act_downloaded':
-            status.unilateral_act_downloaded_at = datetime.utcnow()
-        elif action == 'act_uploaded':
-            status.unilateral_act_uploaded_path = data
+def _apply_transition(status, action: str, data=None, now: datetime = None, check_rules: bool = False):
+    """
+    Меняет объект DealStatus по действию (без commit). С check_rules сначала проверяет
+    по TRANSITION_RULES, что действие разрешено в текущем статусе.
+    Возвращает текст ошибки или None, если переход выполнен.
+    """
+    if check_rules:
+        allowed = TRANSITION_RULES.get(action)
+        if allowed is None:
+            return f'Неизвестное действие: {action}'
+        if status.status not in allowed:
+            return f"Действие недоступно в статусе '{status.status}'"
+    now = now or datetime.utcnow()
+
+    if action == 'mark_delivered':
+        status.documents_delivered_at = now
+        status.arrival_deadline = arrival_deadline_for(now)
+        status.status = 'pending_arrival'
+    elif action == 'mark_arrived':
+        status.client_arrived_at = now
+        status.status = 'acceptance_pending'
+
+    # --- ОБНОВЛЕННЫЕ ДЕЙСТВИЯ ---
+    elif action == 'acceptance_act_downloaded':
+        status.acceptance_act_downloaded_at = now
+
+    elif action == 'process_acceptance':
+        is_signed = data.get('is_signed')
+        has_defects = data.get('has_defects')
+        status.is_act_signed = is_signed
+        status.has_defect_list = has_defects
+        if is_signed is False and has_defects is False:
+            status.status = 'unilateral_pending'
+
+    elif action == 'upload_signed_act':
+        status.signed_act_uploaded_path = data
+        if not status.has_defect_list:
+            status.status = 'completed'
+    elif action == 'upload_defect_list':
+        status.defect_list_uploaded_path = data
+        if status.signed_act_uploaded_path:
             status.status = 'completed'
 
+    elif action == 'act_downloaded':
+        status.unilateral_act_downloaded_at = now
+    elif action == 'act_uploaded':
+        status.unilateral_act_uploaded_path = data
+        status.status = 'completed'
+    return None
+
+
+def _write_status_batch(items: list):
+    """
+    Применяет пачку обновлений [(deal_id, action, data, check_rules), ...] одной транзакцией:
+    статусы читаются одним IN, действия применяются по порядку с общим временем пачки
+    (с check_rules - с проверкой TRANSITION_RULES).
+    Возвращает [{'deal_id', 'ok', 'status', 'error'}, ...]; ошибка commit пробрасывается (после rollback).
+    """
+    deal_ids = {item[0] for item in items}
+    statuses = {
+        status.deal_id: status
+        for status in db.session.scalars(select(DealStatus).where(DealStatus.deal_id.in_(deal_ids)))
+    }
+    now = datetime.utcnow()
+    results = []
+    for deal_id, action, data, check_rules in items:
+        status = statuses.get(deal_id)
+        try:
+            error = 'Сделка не найдена' if status is None else _apply_transition(
+                status, action, data, now=now, check_rules=check_rules
+            )
+        except Exception as e:
+            error = f'Некорректные данные: {e}'
+        if error:
+            logger.warning('Сделка %s, действие %s: %s', deal_id, action, error)
+        results.append({'deal_id': deal_id, 'ok': error is None, 'status': status.status if status else None,
+                        'error': error})
+
+    try:
         db.session.commit()
-        return True
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"Ошибка при обновлении статуса: {e}")
+        raise
+    return results
+
+
+def _get_status_writer() -> WriteCoalescer:
+    """Поток-писатель статусов текущего приложения (создается при первом обновлении)."""
+    app = current_app._get_current_object()
+    with _status_writer_lock:
+        writer = app.extensions.get('status_writer')
+        if writer is None:
+            writer = app.extensions['status_writer'] = WriteCoalescer(
+                app, _write_status_batch,
+                window=Config.STATUS_WRITE_COALESCE_MS / 1000,
+                max_batch=Config.STATUS_UPSERT_BATCH_SIZE,
+                name='status_write_batch',
+            )
+    return writer
+
+
+def update_deal_status(deal_id: int, action: str, data=None):
+    """
+    Центральная функция для обновления статуса сделки в SQLite.
+    При STATUS_WRITE_COALESCE_MS > 0 обновления, пришедшие из разных запросов за эти
+    миллисекунды, записываются одной транзакцией общим потоком-писателем.
+    """
+    item = (deal_id, action, data, False)
+    try:
+        if Config.STATUS_WRITE_COALESCE_MS > 0:
+            return _get_status_writer().submit(item)['ok']
+        return _write_status_batch([item])[0]['ok']
+    except Exception:
+        logger.exception('Ошибка при обновлении статуса сделки %s (%s)', deal_id, action)
         return False
 
 
+def _save_failed(deal_id: int):
+    return {'deal_id': deal_id, 'ok': False, 'status': None, 'error': 'Ошибка сохранения'}
+
+
+@timed('status_transition', rows=len)
+def update_deal_statuses(deal_ids: list, action: str):
+    """
+    Пакетный вариант update_deal_status для действий из BATCH_ACTIONS: правила переходов
+    проверяются по каждой сделке, изменения пишутся пачками по STATUS_UPSERT_BATCH_SIZE
+    через тот же поток-писатель, что и одиночные обновления (без него - напрямую).
+    Возвращает [{'deal_id', 'ok', 'status', 'error'}, ...] в порядке deal_ids (без повторов).
+    """
+    if action not in BATCH_ACTIONS:
+        raise ValueError(f'Действие {action} нельзя применить к списку сделок')
+
+    items = [(deal_id, action, None, True) for deal_id in dict.fromkeys(deal_ids)]
+    if Config.STATUS_WRITE_COALESCE_MS > 0:
+        results = []
+        for item, future in zip(items, _get_status_writer().submit_many(items)):
+            try:
+                results.append(future.result())
+            except Exception:
+                logger.exception('Ошибка сохранения статуса сделки %s (%s)', item[0], action)
+                results.append(_save_failed(item[0]))
+        return results
+
+    batch_size = Config.STATUS_UPSERT_BATCH_SIZE
+    results = []
+    for i in range(0, len(items), batch_size):
+        batch = items[i:i + batch_size]
+        try:
+            results.extend(_write_status_batch(batch))
+        except Exception:
+            logger.exception('Ошибка пакетного обновления статусов (%s, %d сделок)', action, len(batch))
+            results.extend(_save_failed(deal_id) for deal_id, _, _, _ in batch)
+    return results
+
+
 def get_statuses_for_deals(deal_ids: list):
     """
     Получает из SQLite статусы для конкретного списка ID сделок.
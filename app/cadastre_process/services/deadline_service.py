@@ -0,0 +1,149 @@
+# app/cadastre_process/services/deadline_service.py
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, select, update
+
+from app import db
+from app.config import Config
+from ..models import DealStatus
+
+logger = logging.getLogger(__name__)
+
+# Статус сделки, у которой истек срок явки клиента (его ставит фоновая проверка)
+OVERDUE_STATUS = 'arrival_overdue'
+
+_sweeper_started = False
+_sweeper_lock = threading.Lock()
+
+
+def arrival_deadline_for(delivered_at: datetime) -> datetime:
+    """Крайний срок явки клиента после доставки документов."""
+    return delivered_at + timedelta(days=Config.ARRIVAL_DEADLINE_DAYS)
+
+
+def is_overdue(status_obj, now: datetime = None) -> bool:
+    """
+    Просрочена ли явка: статус уже переведен проверкой или срок истек,
+    а проверка еще не успела пройти.
+    """
+    if status_obj is None:
+        return False
+    if status_obj.status == OVERDUE_STATUS:
+        return True
+    return (status_obj.status == 'pending_arrival' and status_obj.arrival_deadline is not None
+            and status_obj.arrival_deadline < (now or datetime.utcnow()))
+
+
+def deadline_conditions(timeout_filter: str, now: datetime = None):
+    """
+    Условия SQL для фильтра срока явки: 'overdue', 'due_soon' (срок истекает
+    в ближайшие DEADLINE_DUE_SOON_DAYS дней) или 'on_time'. Все идут по индексу (status, arrival_deadline).
+    """
+    now = now or datetime.utcnow()
+    pending = DealStatus.status == 'pending_arrival'
+    if timeout_filter == 'overdue':
+        return [or_(DealStatus.status == OVERDUE_STATUS, and_(pending, DealStatus.arrival_deadline < now))]
+    if timeout_filter == 'due_soon':
+        due_soon_border = now + timedelta(days=Config.DEADLINE_DUE_SOON_DAYS)
+        return [pending, DealStatus.arrival_deadline >= now, DealStatus.arrival_deadline < due_soon_border]
+    if timeout_filter == 'on_time':
+        return [pending, DealStatus.arrival_deadline >= now]
+    return []
+
+
+def backfill_arrival_deadlines() -> int:
+    """
+    Проставляет срок явки сделкам 'pending_arrival', доставленным до появления arrival_deadline
+    (срок считается от documents_delivered_at). Без срока такие сделки не попадали бы
+    ни в фильтры по сроку, ни в просроченные. Возвращает число обновленных сделок.
+    """
+    rows = db.session.execute(
+        select(DealStatus.deal_id, DealStatus.documents_delivered_at)
+        .where(
+            DealStatus.status == 'pending_arrival',
+            DealStatus.arrival_deadline.is_(None),
+            DealStatus.documents_delivered_at.is_not(None),
+        )
+    ).all()
+    if rows:
+        db.session.execute(update(DealStatus), [
+            {'deal_id': row.deal_id, 'arrival_deadline': arrival_deadline_for(row.documents_delivered_at)}
+            for row in rows
+        ])
+    db.session.commit()
+    return len(rows)
+
+
+def sweep_overdue_deals(now: datetime = None) -> int:
+    """Одним UPDATE переводит просроченные 'pending_arrival' в OVERDUE_STATUS. Возвращает число сделок."""
+    now = now or datetime.utcnow()
+    result = db.session.execute(
+        update(DealStatus)
+        .where(DealStatus.status == 'pending_arrival', DealStatus.arrival_deadline < now)
+        .values(status=OVERDUE_STATUS)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def get_deadline_deals(now: datetime = None):
+    """
+    Просроченные сделки и сделки со сроком в ближайшие DEADLINE_DUE_SOON_DAYS дней
+    одним запросом по индексу. Возвращает {'overdue': [...], 'due_soon': [...]} по сроку.
+    """
+    now = now or datetime.utcnow()
+    due_soon_border = now + timedelta(days=Config.DEADLINE_DUE_SOON_DAYS)
+    rows = db.session.execute(
+        select(DealStatus.deal_id, DealStatus.group_key, DealStatus.status, DealStatus.arrival_deadline)
+        .where(
+            DealStatus.status.in_(('pending_arrival', OVERDUE_STATUS)),
+            DealStatus.arrival_deadline < due_soon_border,
+        )
+        .order_by(DealStatus.arrival_deadline)
+    )
+    deadlines = {'overdue': [], 'due_soon': []}
+    for row in rows:
+        key = 'overdue' if row.status == OVERDUE_STATUS or row.arrival_deadline < now else 'due_soon'
+        deadlines[key].append({
+            'deal_id': row.deal_id,
+            'group_key': row.group_key,
+            'status': row.status,
+            'arrival_deadline': row.arrival_deadline.isoformat(),
+        })
+    return deadlines
+
+
+def _sweep_loop(app, stop_event):
+    while not stop_event.wait(Config.DEADLINE_SWEEP_INTERVAL):
+        with app.app_context():
+            try:
+                backfilled = backfill_arrival_deadlines()
+                if backfilled:
+                    logger.info('Проставлен срок явки %d сделкам без срока', backfilled)
+                swept = sweep_overdue_deals()
+                if swept:
+                    logger.info('Срок явки истек у %d сделок', swept)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Ошибка фоновой проверки сроков явки')
+
+
+def start_deadline_sweeper(app):
+    """
+    Запускает фоновую проверку сроков явки раз в DEADLINE_SWEEP_INTERVAL секунд
+    (0 - не запускать). Один поток на процесс приложения.
+    """
+    global _sweeper_started
+    if not Config.DEADLINE_SWEEP_INTERVAL:
+        return None
+    with _sweeper_lock:
+        if _sweeper_started:
+            return None
+        _sweeper_started = True
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=_sweep_loop, args=(app, stop_event), name='deadline-sweeper', daemon=True
+    )
+    thread.start()
+    return stop_event
@@ -0,0 +1,94 @@
+# app/cadastre_process/services/docx_service.py
+
+import io
+import re
+import zipfile
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+import docx
+
+from .zip_writer import build_zip, make_entry
+
+# Тексты уведомлений по группам (поля: {client_name}, {apartment_id})
+NOTIFICATION_TEXTS = {
+    '1_no_issues': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} нет расхождений по площади и отсутствуют задолженности. Приглашаем вас для получения ключей.",
+    '2_debt_only': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} нет расхождений по площади, однако имеется задолженность. Просим вас погасить её перед получением ключей.",
+    '3_debt_and_increase': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} имеется задолженность и зафиксировано увеличение площади более чем на 2 кв.м. Просим вас обратиться в офис для проведения доплаты и получения ключей.",
+    '4_debt_and_decrease': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} имеется задолженность и зафиксировано уменьшение площади более чем на 2 кв.м. Просим вас обратиться в офис для проведения взаиморасчетов и получения ключей.",
+    '5_increase_only': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} отсутствуют задолженности, но зафиксировано увеличение площади более чем на 2 кв.м. Просим вас обратиться в офис для проведения доплаты и получения ключей.",
+    '6_decrease_only': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} отсутствуют задолженности, но зафиксировано уменьшение площади более чем на 2 кв.м. Просим вас обратиться в офис для проведения взаиморасчетов и получения ключей.",
+}
+DEFAULT_NOTIFICATION_TEXT = "Уведомление для клиента {client_name} по квартире №{apartment_id}."
+
+DOCUMENT_PART = 'word/document.xml'
+
+
+class DocxTemplate:
+    """
+    Заготовка docx-документа, собранная один раз.
+
+    Каркас строится через python-docx с плейсхолдерами вида {field} в тексте,
+    сохраняется, и все части пакета, кроме word/document.xml, держатся уже сжатыми.
+    document.xml разрезается по плейсхолдерам, так что рендер - это склейка
+    строк с подставленными значениями, сжатие одной части и запись ZIP.
+    """
+
+    def __init__(self, build_document, fields):
+        skeleton = io.BytesIO()
+        build_document().save(skeleton)
+
+        field_pattern = re.compile(r'\{(' + '|'.join(map(re.escape, fields)) + r')\}')
+        self._entries = []
+        self._document_index = None
+        with zipfile.ZipFile(skeleton) as package:
+            for info in package.infolist():
+                data = package.read(info)
+                if info.filename == DOCUMENT_PART:
+                    self._document_index = len(self._entries)
+                    # Нечетные элементы - имена полей, четные - куски XML между ними
+                    self._segments = field_pattern.split(data.decode('utf-8'))
+                    self._entries.append(None)
+                else:
+                    self._entries.append(make_entry(info.filename, data))
+
+    def render(self, **values) -> bytes:
+        """Возвращает байты docx с подставленными значениями полей."""
+        segments = self._segments[:]
+        for i in range(1, len(segments), 2):
+            segments[i] = escape(str(values.get(segments[i], '')))
+        document_entry = make_entry(DOCUMENT_PART, ''.join(segments).encode('utf-8'))
+
+        entries = self._entries[:]
+        entries[self._document_index] = document_entry
+        return build_zip(entries)
+
+    def render_buffer(self, **values) -> io.BytesIO:
+        buffer = io.BytesIO(self.render(**values))
+        buffer.seek(0)
+        return buffer
+
+
+def get_notification_text(group_key: str) -> str:
+    return NOTIFICATION_TEXTS.get(group_key, DEFAULT_NOTIFICATION_TEXT)
+
+
+@lru_cache(maxsize=None)
+def get_notification_template(group_key: str) -> DocxTemplate:
+    """Заготовка уведомления для группы (строится один раз на процесс)."""
+    text = get_notification_text(group_key)
+
+    def build():
+        doc = docx.Document()
+        doc.add_paragraph(text)
+        return doc
+
+    return DocxTemplate(build, fields=('client_name', 'apartment_id'))
+
+
+def render_notification(deal: dict, group_key: str) -> bytes:
+    """Рендерит уведомление по сделке."""
+    return get_notification_template(group_key).render(
+        client_name=deal.get('client_name', 'Клиент'),
+        apartment_id=deal['property_id'],
+    )
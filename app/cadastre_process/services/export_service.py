@@ -1,134 +1,121 @@
 # /app/cadastre_process/services/export_service.py
-import io
+import tempfile
 import xlsxwriter
+from app.config import Config
+from app.metrics import timed
 
+FLOOR_COLUMN_WIDTH = 10
+APARTMENT_COLUMN_WIDTH = 12
+SECTION_ROW_HEIGHT = 25
+FLOOR_ROW_HEIGHT = 30
+DIFF_HIGHLIGHT_THRESHOLD = 0.1
 
-def _create_simple_checkerboard(workbook, sheet_name, checkerboard_data):
+
+def _create_formats(workbook):
+    """Создает стили один раз на книгу - они общие для всех трех листов."""
+    base_cell_format = {'align': 'center', 'valign': 'vcenter', 'border': 1, 'text_wrap': True}
+    return {
+        'floor': workbook.add_format(
+            {'bold': True, 'align': 'center', 'valign': 'vcenter', 'bg_color': '#e9ecef', 'border': 1}),
+        'section_header': workbook.add_format(
+            {'bold': True, 'font_size': 14, 'align': 'center', 'valign': 'vcenter', 'bg_color': '#dee2e6', 'border': 1}),
+        'cell': workbook.add_format(base_cell_format),
+        'increase': workbook.add_format({**base_cell_format, 'bg_color': '#d1e7dd'}),
+        'decrease': workbook.add_format({**base_cell_format, 'bg_color': '#f8d7da'}),
+    }
+
+
+def _max_floor_width(checkerboard_data):
+    """Максимальное число квартир на этаже по всей шахматке."""
+    return max(
+        (len(apartments) for floors in checkerboard_data.values() for apartments in floors.values()),
+        default=0
+    )
+
+
+def _add_checkerboard_sheet(workbook, sheet_name, checkerboard_data, formats, render_cell):
     """
-    Создает простой лист шахматки (номер и площадь).
-    Данные сгруппированы [section][floor] -> [apartments].
+    Пишет лист шахматки строго сверху вниз (требование constant_memory).
+    Данные сгруппированы [section][floor] -> [apartments];
+    render_cell(deal) возвращает (текст ячейки, стиль).
     """
     worksheet = workbook.add_worksheet(sheet_name)
 
-    # Стили
-    floor_format = workbook.add_format(
-        {'bold': True, 'align': 'center', 'valign': 'vcenter', 'bg_color': '#e9ecef', 'border': 1})
-    cell_format = workbook.add_format({'align': 'center', 'valign': 'vcenter', 'border': 1, 'text_wrap': True})
-    # --- НОВЫЙ СТИЛЬ ДЛЯ ЗАГОЛОВКА ПОДЪЕЗДА ---
-    section_header_format = workbook.add_format(
-        {'bold': True, 'font_size': 14, 'align': 'center', 'valign': 'vcenter', 'bg_color': '#dee2e6', 'border': 1})
-
-    # Ширина колонки этажа
-    worksheet.set_column(0, 0, 10)
+    # Ширины колонок задаются один раз по самому широкому этажу
+    worksheet.set_column(0, 0, FLOOR_COLUMN_WIDTH)
+    max_floor_width = _max_floor_width(checkerboard_data)
+    if max_floor_width:
+        worksheet.set_column(1, max_floor_width, APARTMENT_COLUMN_WIDTH)
 
+    write_string = worksheet.write_string
     row = 0
-    # --- НАЧАЛО ОБНОВЛЕННОГО ЦИКЛА (СНАЧАЛА ПОДЪЕЗДЫ) ---
     for section, floors in checkerboard_data.items():  # sections - это OrderedDict
+        max_apartments = max((len(apts) for apts in floors.values()), default=0)
 
-        # 1. Определяем макс. кол-во квартир для этого подъезда
-        max_apartments = 0
-        if floors:
-            max_apartments = max(len(apts) for apts in floors.values()) if floors.values() else 0
-
-        # 2. Пишем заголовок подъезда
-        worksheet.set_row(row, 25)
-        # Мержим ячейку на ширину (Этаж + макс. квартиры)
+        # Заголовок подъезда на ширину (Этаж + макс. квартиры)
+        worksheet.set_row(row, SECTION_ROW_HEIGHT)
         if max_apartments > 0:
-            worksheet.merge_range(row, 0, row, max_apartments, f'Подъезд {section}', section_header_format)
+            worksheet.merge_range(row, 0, row, max_apartments, f'Подъезд {section}', formats['section_header'])
         else:
-            worksheet.write(row, 0, f'Подъезд {section}', section_header_format)
+            write_string(row, 0, f'Подъезд {section}', formats['section_header'])
         row += 1
 
-        # 3. Пишем этажи и квартиры для этого подъезда
         for floor, apartments in floors.items():
-            worksheet.set_row(row, 30)
-            worksheet.write(row, 0, f'Этаж {floor}', floor_format)
-
+            worksheet.set_row(row, FLOOR_ROW_HEIGHT)
+            write_string(row, 0, f'Этаж {floor}', formats['floor'])
             for col, deal in enumerate(apartments, start=1):
-                content = f"{deal['property_id']}\n({deal['area']:.2f} м²)"
-                worksheet.write(row, col, content, cell_format)
-                worksheet.set_column(col, col, 12)  # Устанавливаем ширину
-
+                content, cell_format = render_cell(deal)
+                write_string(row, col, content, cell_format)
             row += 1
 
-        # 4. Добавляем пустую строку-отступ
+        # Пустая строка-отступ между подъездами
         row += 1
-    # --- КОНЕЦ ОБНОВЛЕННОГО ЦИКЛА ---
 
 
-def _create_diff_checkerboard(workbook, sheet_name, checkerboard_data):
-    """
-    Создает лист шахматки с расхождениями и цветовой индикацией.
-    Данные сгруппированы [section][floor] -> [apartments].
-    """
-    worksheet = workbook.add_worksheet(sheet_name)
+def _create_simple_checkerboard(workbook, sheet_name, checkerboard_data, formats):
+    """Создает простой лист шахматки (номер и площадь)."""
+    cell_format = formats['cell']
 
-    # Стили
-    floor_format = workbook.add_format(
-        {'bold': True, 'align': 'center', 'valign': 'vcenter', 'bg_color': '#e9ecef', 'border': 1})
-    base_cell_format = {'align': 'center', 'valign': 'vcenter', 'border': 1, 'text_wrap': True}
-    green_bg = workbook.add_format({**base_cell_format, 'bg_color': '#d1e7dd'})
-    red_bg = workbook.add_format({**base_cell_format, 'bg_color': '#f8d7da'})
-    default_bg = workbook.add_format(base_cell_format)
-    # --- НОВЫЙ СТИЛЬ ДЛЯ ЗАГОЛОВКА ПОДЪЕЗДА ---
-    section_header_format = workbook.add_format(
-        {'bold': True, 'font_size': 14, 'align': 'center', 'valign': 'vcenter', 'bg_color': '#dee2e6', 'border': 1})
+    def render_cell(deal):
+        return f"{deal['property_id']}\n({deal['area']:.2f} м²)", cell_format
 
-    # Ширина и высота
-    worksheet.set_column(0, 0, 10)
+    _add_checkerboard_sheet(workbook, sheet_name, checkerboard_data, formats, render_cell)
 
-    row = 0
-    # --- НАЧАЛО ОБНОВЛЕННОГО ЦИКЛА (СНАЧАЛА ПОДЪЕЗДЫ) ---
-    for section, floors in checkerboard_data.items():  # sections - это OrderedDict
 
-        # 1. Определяем макс. кол-во квартир для этого подъезда
-        max_apartments = 0
-        if floors:
-            max_apartments = max(len(apts) for apts in floors.values()) if floors.values() else 0
+def _create_diff_checkerboard(workbook, sheet_name, checkerboard_data, formats):
+    """Создает лист шахматки с расхождениями и цветовой индикацией."""
+    increase, decrease, default = formats['increase'], formats['decrease'], formats['cell']
 
-        # 2. Пишем заголовок подъезда
-        worksheet.set_row(row, 25)
-        if max_apartments > 0:
-            worksheet.merge_range(row, 0, row, max_apartments, f'Подъезд {section}', section_header_format)
+    def render_cell(deal):
+        diff = deal['area_diff']
+        if diff > DIFF_HIGHLIGHT_THRESHOLD:
+            cell_format = increase
+        elif diff < -DIFF_HIGHLIGHT_THRESHOLD:
+            cell_format = decrease
         else:
-            worksheet.write(row, 0, f'Подъезд {section}', section_header_format)
-        row += 1
-
-        # 3. Пишем этажи и квартиры для этого подъезда
-        for floor, apartments in floors.items():
-            worksheet.set_row(row, 30)
-            worksheet.write(row, 0, f'Этаж {floor}', floor_format)
+            cell_format = default
+        return f"{deal['property_id']}\n({diff:+.2f})", cell_format
 
-            for col, deal in enumerate(apartments, start=1):
-                diff = deal['area_diff']
-                content = f"{deal['property_id']}\n({diff:+.2f})"
-
-                cell_format = default_bg
-                if diff > 0.1:
-                    cell_format = green_bg
-                elif diff < -0.1:
-                    cell_format = red_bg
-
-                worksheet.write(row, col, content, cell_format)
-                worksheet.set_column(col, col, 12)  # Устанавливаем ширину
-
-            row += 1
-
-        # 4. Добавляем пустую строку-отступ
-        row += 1
-    # --- КОНЕЦ ОБНОВЛЕННОГО ЦИКЛА ---
+    _add_checkerboard_sheet(workbook, sheet_name, checkerboard_data, formats, render_cell)
 
 
+@timed('export')
 def generate_checkerboard_excel(diff_data, file_data, db_data):
-    """Создает Excel-файл с тремя листами: расхождения, данные из файла, данные из БД."""
-    output = io.BytesIO()
-    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    """
+    Создает Excel-файл с тремя листами: расхождения, данные из файла, данные из БД.
+
+    Листы пишутся в режиме constant_memory (в памяти только текущая строка),
+    результат - во временный файл, который остается в памяти до EXPORT_SPOOL_MAX_SIZE
+    и уходит на диск, если шахматка (например, целого комплекса) больше.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=Config.EXPORT_SPOOL_MAX_SIZE)
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    formats = _create_formats(workbook)
 
-    # Создаем три листа
-    _create_diff_checkerboard(workbook, '1. Расхождения', diff_data)
-    _create_simple_checkerboard(workbook, '2. Данные из файла', file_data)
-    _create_simple_checkerboard(workbook, '3. Данные из БД', db_data)
+    _create_diff_checkerboard(workbook, '1. Расхождения', diff_data, formats)
+    _create_simple_checkerboard(workbook, '2. Данные из файла', file_data, formats)
+    _create_simple_checkerboard(workbook, '3. Данные из БД', db_data, formats)
 
     workbook.close()
     output.seek(0)
-    return output
\ No newline at end of file
+    return output
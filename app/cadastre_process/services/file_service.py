@@ -1,11 +1,20 @@
 # app/cadastre_process/services/file_service.py
 
+import numpy as np
 import pandas as pd
 import io
-import docx
-import zipfile
 import re
+import zipfile
+from collections import deque
+from itertools import chain, islice
+from openpyxl import load_workbook
+from app.config import Config
+from app.metrics import stage_timer, timed
 from .data_service import get_apartments_for_house
+from .docx_service import render_notification
+from .parse_diagnostics import ParseDiagnostics
+from .zip_writer import stream_zip
+from .worker_pool import chunked, get_process_pool, get_worker_count
 
 
 def generate_apartment_template(house_id: int):
@@ -27,172 +36,377 @@ def generate_apartment_template(house_id: int):
     return output
 
 
-def _parse_template_format(df):
-    """Разбирает стандартный формат шаблона."""
-    if 'Номер квартиры' not in df.columns or 'КадастроваяПлощадь' not in df.columns:
-        return None
-    df.dropna(subset=['КадастроваяПлощадь'], inplace=True)
-    if df.empty:
-        return {}
-    df['Номер квартиры'] = df['Номер квартиры'].astype(str)
-    return pd.Series(df.КадастроваяПлощадь.values, index=df['Номер квартиры']).to_dict()
+# Недопустимые в имени листа Excel символы и максимальная длина имени
+_SHEET_TITLE_FORBIDDEN = re.compile(r'[\[\]:*?/\\]')
+SHEET_TITLE_MAX_LENGTH = 31
 
 
-def _parse_xonadon_format(df):
-    """Разбирает формат с заголовками 'X-Xonadon', включая промежуточные блоки 'Zinapoya'."""
-    print("\n--- Логирование: Начата обработка формата 'Xonadon' ---")
-    cadastre_data = {}
+def house_sheet_title(house: dict) -> str:
+    """Имя листа дома в пакетном шаблоне (по нему же лист сопоставляется с домом при загрузке)."""
+    title = _SHEET_TITLE_FORBIDDEN.sub(' ', str(house['name'])).strip()
+    return title[:SHEET_TITLE_MAX_LENGTH] or str(house['id'])
+
 
-    # --- ИЗМЕНЕННАЯ ЛОГИКА ---
-    # 1. Находим все маркеры секций (Xonadon, Zinapoya) и их индексы
-    markers = []
-    for idx, value in df[0].astype(str).dropna().items():
-        if 'Xonadon' in value:
-            markers.append({'index': idx, 'type': 'Xonadon', 'value': value})
-        elif 'Zinapoya' in value:
-            markers.append({'index': idx, 'type': 'Zinapoya', 'value': value})
-
-    if not markers:
-        print("!!! Ошибка: Не найдено ни одной строки-заголовка с 'Xonadon'.")
+def generate_batch_template(houses: list):
+    """Создает Excel-шаблон для пакетной загрузки: по листу на каждый дом ЖК."""
+    sheets = []
+    used_titles = set()
+    for house in houses:
+        apartments = [row.geo_flatnum for row in get_apartments_for_house(house['id'])]
+        if not apartments:
+            continue
+        sheet_title = house_sheet_title(house)
+        if sheet_title.casefold() in used_titles:
+            sheet_title = str(house['id'])  # одинаковые после обрезки имена - лист по id дома
+        used_titles.add(sheet_title.casefold())
+        sheets.append((sheet_title, apartments))
+    if not sheets:
         return None
 
-    print(f"Найдено {len(markers)} маркеров секций.")
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        for sheet_title, apartments in sheets:
+            df = pd.DataFrame({'Номер квартиры': apartments, 'КадастроваяПлощадь': ''})
+            df.to_excel(writer, index=False, sheet_name=sheet_title)
+            worksheet = writer.sheets[sheet_title]
+            worksheet.set_column('A:A', 20)
+            worksheet.set_column('B:B', 25)
+    output.seek(0)
+    return output
+
 
-    # 2. Добавляем фиктивный маркер конца файла, чтобы обработать последний блок
-    markers.append({'index': len(df), 'type': 'EOF', 'value': 'EOF'})
+# Книги, которые читает openpyxl. Старый двоичный .xls он не открывает - такие файлы
+# отклоняются при загрузке с просьбой пересохранить их в .xlsx
+SUPPORTED_EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
 
-    # 3. Итерируемся по маркерам для определения границ
-    for i in range(len(markers) - 1):
-        current_marker = markers[i]
-        next_marker = markers[i + 1]
 
-        # Нас интересуют только блоки, которые начинаются с 'Xonadon'
-        if current_marker['type'] == 'Xonadon':
-            start_idx = current_marker['index']
-            end_idx = next_marker['index'] - 1  # Конец блока - строка перед следующим маркером
+def is_supported_excel(filename: str) -> bool:
+    """Можно ли разобрать файл с таким именем (по расширению)."""
+    return (filename or '').lower().endswith(SUPPORTED_EXCEL_EXTENSIONS)
 
-            print(f"\n--- Обработка блока '{current_marker['value']}' (строки с {start_idx} по {end_idx}) ---")
 
-            # Извлекаем номер квартиры из заголовка
-            header_text = current_marker['value']
-            match = re.match(r'(\d+)', header_text)
-            if not match:
-                print(f"!!! Предупреждение: Не удалось извлечь номер квартиры из заголовка: '{header_text}'")
-                continue
-            apartment_number = match.group(1)
-            print(f"Из заголовка '{header_text}' извлечен номер квартиры: {apartment_number}")
-
-            # Площадь находится в последней строке блока, в колонке O (индекс 14)
-            area_val = df.iloc[end_idx, 14]
-            print(
-                f"Для квартиры {apartment_number} ищем площадь в строке {end_idx + 1}, колонка O. Найдено значение: '{area_val}'")
-
-            try:
-                if pd.isna(area_val):
-                    print(
-                        f"!!! Предупреждение: Пропускаем квартиру {apartment_number}, так как значение площади пустое.")
-                    continue
-
-                if isinstance(area_val, str):
-                    area = float(area_val.replace(',', '.'))
-                else:
-                    area = float(area_val)
-                cadastre_data[apartment_number] = area
-                print(f"УСПЕХ: Для квартиры {apartment_number} сохранена площадь: {area}")
-            except (ValueError, TypeError) as e:
-                print(
-                    f"!!! ОШИБКА: Не удалось преобразовать значение площади '{area_val}' для квартиры {apartment_number}. Ошибка: {e}")
+def match_sheets_to_houses(file_storage, houses: list):
+    """
+    Сопоставляет листы книги домам ЖК по имени листа (см. house_sheet_title) или id дома.
+    Возвращает ({house_id: sheet_name}, [несопоставленные листы]).
+    """
+    titles = {}
+    for house in houses:
+        titles.setdefault(house_sheet_title(house).casefold(), house['id'])
+        titles[str(house['id'])] = house['id']
+
+    workbook = load_workbook(file_storage, read_only=True)
+    try:
+        sheet_names = workbook.sheetnames
+    finally:
+        workbook.close()
+    file_storage.seek(0)
+
+    matched, unmatched = {}, []
+    for sheet_name in sheet_names:
+        house_id = titles.get(sheet_name.strip().casefold())
+        if house_id is None or house_id in matched:
+            unmatched.append(sheet_name)
+        else:
+            matched[house_id] = sheet_name
+    return matched, unmatched
+
+
+# Сколько первых строк листа просматривается при определении формата файла
+FORMAT_DETECTION_ROWS = 10
+
+# Колонка O в формате 'Xonadon' (индекс 14), в которой лежит площадь
+XONADON_AREA_COLUMN = 14
+
+
+def _iter_sheet_rows(file_storage, sheet_name=None):
+    """
+    Построчно читает лист книги (по умолчанию первый) в режиме read-only,
+    не загружая весь файл в память и не строя DataFrame.
+    Пустые строки в конце листа (read-only отдает и строки, где остались только стили)
+    отбрасываются, как это делал pd.read_excel: иначе последний блок 'Xonadon' заканчивался
+    бы на пустой строке.
+    """
+    workbook = load_workbook(file_storage, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet_name] if sheet_name else workbook.worksheets[0]
+        empty_rows = []
+        for row in worksheet.iter_rows(values_only=True):
+            if all(value is None for value in row):
+                empty_rows.append(row)
                 continue
-    # --- КОНЕЦ ИЗМЕНЕННОЙ ЛОГИКИ ---
+            if empty_rows:
+                yield from empty_rows
+                empty_rows.clear()
+            yield row
+    finally:
+        workbook.close()
+
+
+def _cell(row, index):
+    """Безопасно достает значение ячейки (строки в read-only режиме бывают короче)."""
+    return row[index] if index < len(row) else None
 
-    print("\n----------------------------------------------------")
-    print(f"ИТОГО: Успешно обработано {len(cadastre_data)} квартир из формата 'Xonadon'.")
-    print(f"Результат: {cadastre_data}")
-    print("--- Логирование: Конец обработки формата 'Xonadon' ---\n")
-    return cadastre_data if cadastre_data else None
 
+def _apartment_key(value):
+    """Приводит номер квартиры к строке так же, как он хранится в CRM ('12', а не '12.0')."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
 
-def parse_cadastre_excel(file_storage):
+
+def _detect_format(head_rows):
     """
-    Определяет формат Excel-файла и разбирает его.
-    Поддерживает стандартный шаблон и новый формат с 'Xonadon'.
+    Определяет формат файла по первым строкам.
+    Для шаблона возвращает ('template', (строка заголовка, колонка номера, колонка площади)),
+    иначе - ('xonadon', None).
     """
+    for row_idx, row in enumerate(head_rows):
+        header = [str(v).strip() if v is not None else '' for v in row]
+        if 'Номер квартиры' in header and 'КадастроваяПлощадь' in header:
+            return 'template', (row_idx, header.index('Номер квартиры'), header.index('КадастроваяПлощадь'))
+    return 'xonadon', None
+
+
+def _area_value(value):
+    """Площадь числом: числа - как есть, строки вида '45,5' - через float, иначе None."""
+    if isinstance(value, (int, float)):
+        return value
     try:
-        # 1. Попытка разбора как стандартный шаблон
-        df_template = pd.read_excel(file_storage)
-        template_data = _parse_template_format(df_template.copy())
-        if template_data is not None and template_data:
-            print("Обнаружен и успешно обработан стандартный формат шаблона.")
-            return template_data
-        else:
-            print("Стандартный шаблон не распознан или пуст. Переход к следующему формату.")
+        return float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _parse_template_format(rows, columns, diagnostics: ParseDiagnostics):
+    """Разбирает стандартный формат шаблона (строки после заголовка)."""
+    header_row, number_col, area_col = columns
+    cadastre_data = {}
+    # Нумерация строк как в Excel: заголовок - строка header_row + 1
+    for row_number, row in enumerate(rows, start=header_row + 2):
+        apartment = _cell(row, number_col)
+        area = _cell(row, area_col)
+        if apartment is None:
+            if area is not None:
+                diagnostics.add('no_apartment_number', row_number, value=area)
+            continue
+        key = _apartment_key(apartment)
+        if area is None:
+            diagnostics.add('empty_area', row_number, key)
+            continue
+        value = _area_value(area)
+        if value is None:
+            diagnostics.add('bad_area', row_number, key, area)
+            continue
+        if key in cadastre_data:
+            diagnostics.add('duplicate_apartment', row_number, key, area)
+        cadastre_data[key] = value
+    return cadastre_data
+
+
+def _parse_xonadon_format(rows, diagnostics: ParseDiagnostics):
+    """
+    Разбирает формат с заголовками 'X-Xonadon', включая промежуточные блоки 'Zinapoya'.
+    Пропущенные квартиры записываются в diagnostics пачками по видам, без вывода по строкам.
+    """
+    # 1. За один проход забираем только нужные колонки: A (маркеры) и O (площадь)
+    first_col, area_col = [], []
+    for row in rows:
+        first_col.append(_cell(row, 0))
+        area_col.append(_cell(row, XONADON_AREA_COLUMN))
+
+    # 2. Находим маркеры секций строковыми масками по всей колонке
+    labels = pd.Series(first_col, dtype=object).astype(str)
+    is_xonadon = labels.str.contains('Xonadon', regex=False).to_numpy()
+    is_marker = is_xonadon | labels.str.contains('Zinapoya', regex=False).to_numpy()
+
+    marker_idx = np.flatnonzero(is_marker)
+    if not len(marker_idx):
+        diagnostics.add('missing_header', value="'Номер квартиры'/'КадастроваяПлощадь' или 'N-Xonadon'")
+        return None
+
+    # 3. Конец блока - строка перед следующим маркером (или последняя строка файла)
+    block_ends = np.append(marker_idx[1:], len(labels)) - 1
+    xonadon_blocks = is_xonadon[marker_idx]
+    starts = marker_idx[xonadon_blocks]
+    ends = block_ends[xonadon_blocks]
+
+    # 4. Номер квартиры из заголовка и площадь из колонки O последней строки блока
+    headers = labels.iloc[starts].reset_index(drop=True)
+    apartment_numbers = headers.str.extract(r'^(\d+)', expand=False)
+    raw_areas = pd.Series(area_col, dtype=object).iloc[ends].reset_index(drop=True)
+    areas = pd.to_numeric(
+        raw_areas.astype(str).str.strip().str.replace(',', '.', regex=False),
+        errors='coerce'
+    )
+
+    no_number = apartment_numbers.isna()
+    empty_area = ~no_number & raw_areas.isna()
+    bad_area = ~no_number & ~empty_area & areas.isna()
+
+    # Номера строк - в нумерации Excel (с 1)
+    no_number_idx = np.flatnonzero(no_number.to_numpy())
+    diagnostics.add_many('no_apartment_number', starts[no_number_idx] + 1, values=headers.iloc[no_number_idx])
+    empty_idx = np.flatnonzero(empty_area.to_numpy())
+    diagnostics.add_many('empty_area', ends[empty_idx] + 1, apartment_numbers.iloc[empty_idx])
+    bad_idx = np.flatnonzero(bad_area.to_numpy())
+    diagnostics.add_many('bad_area', ends[bad_idx] + 1, apartment_numbers.iloc[bad_idx], raw_areas.iloc[bad_idx])
+
+    valid = ~(no_number | empty_area | bad_area)
+    valid_numbers = apartment_numbers[valid]
+    # Повтор номера квартиры: в результат попадает последнее значение
+    duplicate_idx = np.flatnonzero(valid.to_numpy())[valid_numbers.duplicated(keep='last').to_numpy()]
+    diagnostics.add_many('duplicate_apartment', ends[duplicate_idx] + 1,
+                         apartment_numbers.iloc[duplicate_idx], raw_areas.iloc[duplicate_idx])
+
+    cadastre_data = dict(zip(
+        valid_numbers.tolist(),
+        areas[valid].astype(float).tolist()
+    ))
+    return cadastre_data if cadastre_data else None
 
-        file_storage.seek(0)
 
-        # 2. Попытка разбора как формат 'Xonadon'
-        df_new = pd.read_excel(file_storage, header=None)
-        new_format_data = _parse_xonadon_format(df_new)
+@timed('parse', rows=lambda data: len(data) if data else 0)
+def parse_cadastre_excel(file_storage, diagnostics: ParseDiagnostics = None, sheet_name=None):
+    """
+    Определяет формат Excel-файла и разбирает его за один проход.
+    Поддерживает стандартный шаблон и новый формат с 'Xonadon'.
+    Пропущенные квартиры, непонятные площади и ошибки чтения собираются в diagnostics.
+    sheet_name - лист книги с несколькими домами (по умолчанию первый лист).
+    """
+    diagnostics = diagnostics if diagnostics is not None else ParseDiagnostics()
+    try:
+        rows = _iter_sheet_rows(file_storage, sheet_name)
+
+        # 1. Смотрим первые строки, чтобы определить формат
+        head_rows = list(islice(rows, FORMAT_DETECTION_ROWS))
+        file_format, columns = _detect_format(head_rows)
+
+        # 2. Дочитываем остаток листа тем же итератором
+        all_rows = chain(head_rows, rows)
+        if file_format == 'template':
+            template_data = _parse_template_format(islice(all_rows, columns[0] + 1, None), columns, diagnostics)
+            diagnostics.finish(file_format, len(template_data))
+            if template_data:
+                return template_data
+            diagnostics.fail('Стандартный шаблон распознан, но не содержит площадей.')
+            return None
+
+        new_format_data = _parse_xonadon_format(all_rows, diagnostics)
+        diagnostics.finish(file_format, len(new_format_data or ()))
         if new_format_data is not None:
             return new_format_data
 
-        print("\n!!! КРИТИЧЕСКАЯ ОШИБКА: Не удалось определить формат файла или извлечь данные.")
+        diagnostics.fail('Не удалось определить формат файла или извлечь данные.')
         return None
 
     except Exception as e:
-        print(f"\n!!! КРИТИЧЕСКАЯ ОШИБКА при чтении Excel файла: {e}")
+        diagnostics.fail(f'Ошибка при чтении Excel файла: {e}')
         return None
 
 
-def generate_archive_for_group(deals: list, group_key: str):
-    """Создает ZIP-архив с Word-документами."""
-    # Тексты уведомлений
-    notification_texts = {
-        '1_no_issues': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} нет расхождений по площади и отсутствуют задолженности. Приглашаем вас для получения ключей.",
-        '2_debt_only': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} нет расхождений по площади, однако имеется задолженность. Просим вас погасить её перед получением ключей.",
-        # ... добавьте тексты для остальных групп
-    }
-    default_text = "Уведомление для клиента {client_name} по квартире №{apartment_id}."
-    notification_template = notification_texts.get(group_key, default_text)
+def _parse_batch_source(data: bytes, sheet_name=None, source=None):
+    """
+    Разбирает один файл/лист пакетной загрузки (выполняется в процессе-воркере).
+    Возвращает (cadastre_data или None, отчет разбора в виде словаря).
+    """
+    diagnostics = ParseDiagnostics(source)
+    cadastre_data = parse_cadastre_excel(io.BytesIO(data), diagnostics, sheet_name=sheet_name)
+    return cadastre_data, diagnostics.to_dict()
+
+
+@timed('parse_batch', rows=lambda parsed: sum(len(data) for data, _ in parsed.values() if data))
+def parse_batch_sources(sources: list, workers: int = None):
+    """
+    Разбирает файлы пакетной загрузки параллельно в пуле процессов.
+    sources - [(house_id, байты файла, имя листа или None), ...].
+    Возвращает {house_id: (cadastre_data или None, отчет разбора)} в порядке sources.
+    """
+    workers = get_worker_count() if workers is None else workers
+    house_ids = [house_id for house_id, _, _ in sources]
+    datas = [data for _, data, _ in sources]
+    sheet_names = [sheet_name for _, _, sheet_name in sources]
+    labels = [f'дом {house_id}' for house_id in house_ids]
 
+    if workers <= 1 or len(sources) < 2:
+        parsed = map(_parse_batch_source, datas, sheet_names, labels)
+    else:
+        parsed = get_process_pool().map(_parse_batch_source, datas, sheet_names, labels)
+    return dict(zip(house_ids, parsed))
+
+
+def _notification_file_name(deal: dict, with_house_dir: bool):
+    file_name = f"{deal['property_id']}.docx"
+    return f"{deal['house_id']}/{file_name}" if with_house_dir else file_name
+
+
+def _render_notification_chunk(deals: list, group_key: str, with_house_dir: bool = False):
+    """
+    Рендерит пачку уведомлений. Выполняется в процессе-воркере,
+    поэтому принимает и возвращает только простые данные: [(имя файла, байты docx), ...].
+    """
+    return [
+        (_notification_file_name(deal, with_house_dir), render_notification(deal, group_key))
+        for deal in deals
+    ]
+
+
+def _iter_rendered_notifications(deals: list, group_key: str, workers: int = None):
+    """
+    Отдает отрендеренные документы в исходном порядке сделок.
+    Большие группы делятся на пачки и рендерятся в пуле процессов; в работе
+    держится не больше 2 * workers пачек, чтобы при медленном потребителе
+    (потоковая отдача) готовые документы не копились в памяти.
+    """
+    workers = get_worker_count() if workers is None else workers
+    # В пакетном запуске номера квартир повторяются - раскладываем документы по папкам домов
+    with_house_dir = len({deal.get('house_id') for deal in deals}) > 1
+    if workers <= 1 or len(deals) < Config.ARCHIVE_PARALLEL_MIN_DEALS:
+        yield from _render_notification_chunk(deals, group_key, with_house_dir)
+        return
+
+    chunks = iter(chunked(deals, Config.ARCHIVE_CHUNK_SIZE))
+    pool = get_process_pool()
+    # Очередь futures в порядке пачек, поэтому порядок файлов в архиве детерминирован
+    in_flight = deque(
+        pool.submit(_render_notification_chunk, chunk, group_key, with_house_dir)
+        for chunk in islice(chunks, workers * 2)
+    )
+    while in_flight:
+        rendered = in_flight.popleft().result()
+        next_chunk = next(chunks, None)
+        if next_chunk is not None:
+            in_flight.append(pool.submit(_render_notification_chunk, next_chunk, group_key, with_house_dir))
+        yield from rendered
+
+
+def generate_archive_for_group(deals: list, group_key: str, workers: int = None):
+    """Создает ZIP-архив с Word-документами."""
     archive_buffer = io.BytesIO()
-    with zipfile.ZipFile(archive_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for deal in deals:
-            doc = docx.Document()
-            doc.add_paragraph(notification_template.format(
-                client_name=deal.get('client_name', 'Клиент'),
-                apartment_id=deal['property_id']
-            ))
-            doc_buffer = io.BytesIO()
-            doc.save(doc_buffer)
-            doc_buffer.seek(0)
-            zip_file.writestr(f"{deal['property_id']}.docx", doc_buffer.read())
+    with stage_timer('document_archive', rows=len(deals)):
+        with zipfile.ZipFile(archive_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for file_name, content in _iter_rendered_notifications(deals, group_key, workers):
+                zip_file.writestr(file_name, content)
 
     archive_buffer.seek(0)
     return archive_buffer
 
 
+def stream_archive_for_group(deals: list, group_key: str, workers: int = None):
+    """
+    Генератор ZIP-архива с Word-документами для потоковой отдачи:
+    каждый документ уходит в ответ сразу после рендера, архив целиком не собирается.
+    Время этапа - от первого до последнего отданного байта.
+    """
+    with stage_timer('document_archive', rows=len(deals)):
+        yield from stream_zip(_iter_rendered_notifications(deals, group_key, workers))
+
+
+@timed('document_notification', rows=lambda _: 1)
 def generate_single_document(deal: dict, group_key: str):
     """
     Создает один Word-документ в памяти для конкретной сделки.
     """
-    notification_texts = {
-        '1_no_issues': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} нет расхождений по площади и отсутствуют задолженности. Приглашаем вас для получения ключей.",
-        '2_debt_only': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} нет расхождений по площади, однако имеется задолженность. Просим вас погасить её перед получением ключей.",
-        '3_debt_and_increase': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} имеется задолженность и зафиксировано увеличение площади более чем на 2 кв.м. Просим вас обратиться в офис для проведения доплаты и получения ключей.",
-        '4_debt_and_decrease': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} имеется задолженность и зафиксировано уменьшение площади более чем на 2 кв.м. Просим вас обратиться в офис для проведения взаиморасчетов и получения ключей.",
-        '5_increase_only': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} отсутствуют задолженности, но зафиксировано увеличение площади более чем на 2 кв.м. Просим вас обратиться в офис для проведения доплаты и получения ключей.",
-        '6_decrease_only': "Уважаемый(ая) {client_name}, по вашей квартире №{apartment_id} отсутствуют задолженности, но зафиксировано уменьшение площади более чем на 2 кв.м. Просим вас обратиться в офис для проведения взаиморасчетов и получения ключей.",
-    }
-    default_text = "Уведомление для клиента {client_name} по квартире №{apartment_id}."
-    notification_template = notification_texts.get(group_key, default_text)
-
-    doc = docx.Document()
-    doc.add_paragraph(notification_template.format(
-        client_name=deal.get('client_name', 'Клиент'),
-        apartment_id=deal['property_id']
-    ))
-
-    doc_buffer = io.BytesIO()
-    doc.save(doc_buffer)
+    doc_buffer = io.BytesIO(render_notification(deal, group_key))
     doc_buffer.seek(0)
-    return doc_buffer
\ No newline at end of file
+    return doc_buffer
@@ -0,0 +1,280 @@
+# app/cadastre_process/services/job_service.py
+
+import logging
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, update
+
+from flask import current_app
+from app import db
+from app.config import Config
+from app.metrics import traced
+from ..models import UploadJob
+from .file_service import parse_cadastre_excel, parse_batch_sources
+from .parse_diagnostics import ParseDiagnostics
+from .processing_service import process_cadastre_data, process_batch_cadastre_data
+from .run_service import create_run, create_batch_run
+from .worker_pool import get_job_pool
+
+logger = logging.getLogger(__name__)
+
+# Этапы обработки загрузки: (процент готовности в начале этапа, название для пользователя)
+JOB_STAGES = {
+    'queued': (0, 'В очереди'),
+    'parse': (5, 'Чтение Excel-файла'),
+    'crm_lookup': (30, 'Поиск сделок в CRM'),
+    'categorize': (60, 'Распределение по группам'),
+    'statuses': (75, 'Обновление статусов сделок'),
+    'save': (90, 'Сохранение результатов'),
+    'done': (100, 'Готово'),
+}
+
+# Статусы задач, которые еще выполняются (или ждут очереди)
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+# Файл загрузки держится в памяти до этого размера, дальше - во временном файле на диске
+UPLOAD_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+class _JobCancelled(Exception):
+    """Задача уже завершена без воркера (помечена ошибкой по таймауту) - обработку нужно прекратить."""
+
+
+class _JobProgress:
+    """
+    Переключает этапы задачи: пишет этап/процент в БД и считает время каждого этапа.
+    Запись идет условным UPDATE только пока задача активна: задачу, помеченную ошибкой
+    по таймауту, опоздавший воркер не перезапишет.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.timings = {}
+        self._stage = None
+        self._stage_started = None
+
+    def _close_stage(self):
+        if self._stage is not None:
+            self.timings[self._stage] = round(time.perf_counter() - self._stage_started, 3)
+
+    def stage(self, name):
+        self._close_stage()
+        self._stage, self._stage_started = name, time.perf_counter()
+        result = db.session.execute(
+            update(UploadJob)
+            .where(UploadJob.id == self.job_id, UploadJob.status.in_(ACTIVE_JOB_STATUSES))
+            .values(status='running', stage=name, percent=JOB_STAGES[name][0], timings=dict(self.timings),
+                    started_at=func.coalesce(UploadJob.started_at, datetime.utcnow()))
+        )
+        db.session.commit()
+        if not result.rowcount:
+            raise _JobCancelled(self.job_id)
+
+    def finish(self, status, **fields):
+        self._close_stage()
+        values = dict(status=status, timings=dict(self.timings), finished_at=datetime.utcnow(), **fields)
+        if status == 'done':
+            values.update(stage='done', percent=100)
+        result = db.session.execute(
+            update(UploadJob)
+            .where(UploadJob.id == self.job_id, UploadJob.status == 'running')
+            .values(**values)
+        )
+        db.session.commit()
+        if not result.rowcount:
+            logger.warning('Загрузка %s уже завершена (таймаут), результат %s не записан', self.job_id, status)
+
+
+def _purge_expired_jobs():
+    expired_before = datetime.utcnow() - timedelta(hours=Config.RUN_STORE_TTL_HOURS)
+    db.session.execute(delete(UploadJob).where(UploadJob.created_at < expired_before))
+
+
+def fail_interrupted_jobs() -> int:
+    """
+    Помечает ошибкой задачи, которые были в очереди или выполнялись до перезапуска приложения:
+    пул загрузок живет в процессе приложения, и доделать их уже некому. Вызывается при старте.
+    """
+    result = db.session.execute(
+        update(UploadJob)
+        .where(UploadJob.status.in_(ACTIVE_JOB_STATUSES))
+        .values(status='failed', error='Обработка прервана перезапуском приложения.', finished_at=datetime.utcnow())
+    )
+    db.session.commit()
+    if result.rowcount:
+        logger.warning('Прерванные перезапуском загрузки помечены ошибкой: %d', result.rowcount)
+    return result.rowcount
+
+
+def _fail_if_timed_out(job) -> bool:
+    """
+    Задача, которая выполняется дольше JOB_TIMEOUT секунд (от начала первого этапа, время
+    в очереди не считается), помечается ошибкой, чтобы страница перестала ее ждать (воркер
+    мог зависнуть или упасть, не записав результат). Возвращает True, если пометили.
+    """
+    if job.status != 'running' or job.started_at is None:
+        return False
+    now = datetime.utcnow()
+    if job.started_at >= now - timedelta(seconds=Config.JOB_TIMEOUT):
+        return False
+    # Условный UPDATE: воркер мог успеть записать результат после чтения задачи
+    result = db.session.execute(
+        update(UploadJob)
+        .where(UploadJob.id == job.id, UploadJob.status == 'running')
+        .values(status='failed', finished_at=now,
+                error=f'Обработка не завершилась за {Config.JOB_TIMEOUT // 60} мин. Загрузите файл еще раз.')
+    )
+    db.session.commit()
+    db.session.refresh(job)
+    if not result.rowcount:
+        return False
+    logger.warning('Загрузка %s не завершилась за %d с и помечена ошибкой', job.id, Config.JOB_TIMEOUT)
+    return True
+
+
+def _run_upload_job(app, job_id, upload_file, house_id, incremental=None):
+    """Выполняет все этапы обработки в фоновом потоке (в своем контексте приложения)."""
+    with app.app_context(), traced(f'загрузка {job_id} (дом {house_id})'):
+        progress = _JobProgress(job_id)
+        try:
+            progress.stage('parse')
+            diagnostics = ParseDiagnostics(f'дом {house_id}')
+            cadastre_data = parse_cadastre_excel(upload_file, diagnostics)
+            if cadastre_data is None:
+                progress.finish('failed', error=f'Ошибка чтения Excel файла: {diagnostics.error}')
+                return
+
+            results, status_report = process_cadastre_data(
+                cadastre_data, house_id, on_stage=progress.stage, incremental=incremental
+            )
+
+            progress.stage('save')
+            run_id = create_run(house_id, cadastre_data, results, parse_report=diagnostics.to_dict())
+            progress.finish('done', run_id=run_id, status_report=status_report)
+        except _JobCancelled:
+            db.session.rollback()
+            logger.warning('Обработка загрузки %s прекращена: задача уже помечена ошибкой', job_id)
+        except Exception as e:
+            db.session.rollback()
+            logger.exception('Ошибка фоновой обработки загрузки %s', job_id)
+            progress.finish('failed', error=f'Ошибка обработки: {e}')
+        finally:
+            upload_file.close()
+
+
+def _run_batch_job(app, job_id, sources, incremental=None):
+    """
+    Пакетная обработка нескольких домов в фоне: файлы/листы разбираются параллельно,
+    данные CRM по всем домам берутся одним запросом, результат - один общий запуск.
+    """
+    with app.app_context(), traced(f'пакетная загрузка {job_id}'):
+        progress = _JobProgress(job_id)
+        upload_files = {id(upload_file): upload_file for _, upload_file, _ in sources}
+        try:
+            progress.stage('parse')
+            # Книга с листами по домам читается один раз, каждый лист разбирается отдельно
+            contents = {}
+            for key, upload_file in upload_files.items():
+                upload_file.seek(0)
+                contents[key] = upload_file.read()
+            parsed = parse_batch_sources([
+                (house_id, contents[id(upload_file)], sheet_name) for house_id, upload_file, sheet_name in sources
+            ])
+
+            skipped_houses = [house_id for house_id, (data, _) in parsed.items() if data is None]
+            cadastre_by_house = {house_id: data for house_id, (data, _) in parsed.items() if data is not None}
+            parse_reports = {house_id: report for house_id, (data, report) in parsed.items() if data is not None}
+            if not cadastre_by_house:
+                progress.finish('failed', error='Ошибка чтения Excel файлов: ни один дом не удалось разобрать.')
+                return
+
+            results_by_house, status_report = process_batch_cadastre_data(
+                cadastre_by_house, on_stage=progress.stage, incremental=incremental
+            )
+            status_report['skipped_houses'] = skipped_houses
+
+            progress.stage('save')
+            run_id = create_batch_run(cadastre_by_house, results_by_house, parse_reports=parse_reports)
+            progress.finish('done', run_id=run_id, status_report=status_report)
+        except _JobCancelled:
+            db.session.rollback()
+            logger.warning('Пакетная обработка %s прекращена: задача уже помечена ошибкой', job_id)
+        except Exception as e:
+            db.session.rollback()
+            logger.exception('Ошибка фоновой пакетной обработки %s', job_id)
+            progress.finish('failed', error=f'Ошибка обработки: {e}')
+        finally:
+            for upload_file in upload_files.values():
+                upload_file.close()
+
+
+def _spool_upload(file_storage):
+    """Копирует файл из запроса: его поток закрывается вместе с запросом."""
+    upload_file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_SIZE)
+    file_storage.save(upload_file)
+    upload_file.seek(0)
+    return upload_file
+
+
+def _create_job(house_id=None) -> str:
+    job_id = uuid.uuid4().hex
+    _purge_expired_jobs()
+    db.session.add(UploadJob(id=job_id, house_id=house_id, status='queued', stage='queued', percent=0))
+    db.session.commit()
+    return job_id
+
+
+def submit_upload_job(file_storage, house_id, incremental=None) -> str:
+    """
+    Ставит обработку загруженного файла в фоновую очередь и сразу возвращает id задачи.
+    incremental=False - полная обработка со сбросом всех статусов (None - по INCREMENTAL_REUPLOAD).
+    """
+    upload_file = _spool_upload(file_storage)
+    job_id = _create_job(house_id)
+
+    app = current_app._get_current_object()
+    get_job_pool().submit(_run_upload_job, app, job_id, upload_file, house_id, incremental)
+    return job_id
+
+
+def submit_batch_upload_job(sources: list, incremental=None) -> str:
+    """
+    Ставит пакетную обработку в фоновую очередь и сразу возвращает id задачи.
+    sources - [(house_id, FileStorage, имя листа или None), ...]; один и тот же
+    файл (книга с листами по домам) копируется из запроса один раз.
+    """
+    spooled = {}
+    spooled_sources = []
+    for house_id, file_storage, sheet_name in sources:
+        if id(file_storage) not in spooled:
+            spooled[id(file_storage)] = _spool_upload(file_storage)
+        spooled_sources.append((house_id, spooled[id(file_storage)], sheet_name))
+    job_id = _create_job()
+
+    app = current_app._get_current_object()
+    get_job_pool().submit(_run_batch_job, app, job_id, spooled_sources, incremental)
+    return job_id
+
+
+def get_job(job_id):
+    """Состояние задачи для опроса со страницы или None, если задачи нет."""
+    job = db.session.get(UploadJob, job_id) if job_id else None
+    if job is None:
+        return None
+    _fail_if_timed_out(job)
+    return {
+        'job_id': job.id,
+        'status': job.status,
+        'stage': job.stage,
+        'stage_name': JOB_STAGES.get(job.stage, (0, job.stage))[1],
+        'percent': job.percent,
+        'error': job.error,
+        'run_id': job.run_id,
+        'status_report': job.status_report,
+        'timings': [
+            {'stage': stage, 'stage_name': JOB_STAGES.get(stage, (0, stage))[1], 'seconds': seconds}
+            for stage, seconds in (job.timings or {}).items()
+        ],
+    }
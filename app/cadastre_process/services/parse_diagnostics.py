@@ -0,0 +1,94 @@
+# app/cadastre_process/services/parse_diagnostics.py
+import logging
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Виды замечаний при разборе файла и их описание для пользователя
+DIAGNOSTIC_KINDS = {
+    'missing_header': 'Не найден заголовок',
+    'no_apartment_number': 'Не удалось извлечь номер квартиры',
+    'empty_area': 'Пустое значение площади',
+    'bad_area': 'Не удалось преобразовать значение площади',
+    'duplicate_apartment': 'Квартира встречается повторно (взято последнее значение)',
+}
+
+# Сколько замечаний хранится с номерами строк; счетчики ведутся по всем
+MAX_DIAGNOSTIC_ENTRIES = 200
+
+
+class ParseDiagnostics:
+    """
+    Собирает замечания разбора Excel-файла: вид, номер строки, квартира, исходное значение.
+    Хранит не больше MAX_DIAGNOSTIC_ENTRIES записей, счетчики по видам - полные.
+    Каждое замечание пишется в лог на уровне DEBUG только если этот уровень включен,
+    итог разбора - одной строкой на уровне INFO.
+    """
+
+    def __init__(self, source=None):
+        self.source = source
+        self.file_format = None
+        self.parsed = 0
+        self.error = None
+        self.counts = Counter()
+        self.entries = []
+
+    def add(self, kind, row=None, apartment=None, value=None):
+        self.add_many(kind, [row], [apartment], [value])
+
+    def add_many(self, kind, rows, apartments=None, values=None):
+        """Добавляет замечания одного вида пачкой (строки - в нумерации Excel, с 1)."""
+        rows = list(rows)
+        if not rows:
+            return
+        apartments = list(apartments) if apartments is not None else [None] * len(rows)
+        values = list(values) if values is not None else [None] * len(rows)
+        self.counts[kind] += len(rows)
+
+        free = MAX_DIAGNOSTIC_ENTRIES - len(self.entries)
+        for row, apartment, value in zip(rows[:free], apartments, values):
+            self.entries.append({
+                'kind': kind,
+                'row': None if row is None else int(row),
+                'apartment': None if apartment is None else str(apartment),
+                'value': None if value is None else str(value),
+            })
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for row, apartment, value in zip(rows, apartments, values):
+                logger.debug('%s: строка %s, квартира %s, значение %r - %s',
+                             self.source or 'файл', row, apartment, value, DIAGNOSTIC_KINDS.get(kind, kind))
+
+    def fail(self, message):
+        """Разбор не удался: файл не распознан или не читается."""
+        self.error = message
+        logger.warning('%s: %s', self.source or 'файл', message)
+
+    def finish(self, file_format, parsed):
+        """Фиксирует формат и число разобранных квартир и пишет итог в лог."""
+        self.file_format = file_format
+        self.parsed = parsed
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('%s: формат %s, разобрано квартир %d, замечаний %d',
+                        self.source or 'файл', file_format, parsed, self.total)
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def to_dict(self) -> dict:
+        """Отчет для хранения в запуске (JSON) и показа на странице результатов."""
+        return {
+            'format': self.file_format,
+            'parsed': self.parsed,
+            'error': self.error,
+            'total': self.total,
+            'counts': [
+                {'kind': kind, 'label': DIAGNOSTIC_KINDS.get(kind, kind), 'count': count}
+                for kind, count in self.counts.most_common()
+            ],
+            'entries': [
+                {**entry, 'label': DIAGNOSTIC_KINDS.get(entry['kind'], entry['kind'])} for entry in self.entries
+            ],
+            'truncated': self.total > len(self.entries),
+        }
@@ -1,36 +1,91 @@
 # /app/cadastre_process/services/processing_service.py
 
+import logging
 from collections import defaultdict
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.config import Config
 from app.database import MysqlSession
+from app.metrics import timed
 from app import db
 from ..models import DealStatus
-from .data_service import get_deals_data
+from .data_service import get_deals_data, get_deals_data_for_houses
+from .reconcile_service import apartment_fingerprint, diff_apartments
+from .run_service import get_previous_house_apartments
 
+logger = logging.getLogger(__name__)
 
-def process_cadastre_data(cadastre_data: dict, house_id: int):
-    property_ids = list(cadastre_data.keys())
-    if not property_ids:
-        return {}
 
-    db_session_mysql = MysqlSession()
-    try:
-        properties_from_db = get_deals_data(db_session_mysql, property_ids, house_id)
-    finally:
-        MysqlSession.remove()
+# Порог изменения площади (м²), после которого считаем, что площадь изменилась
+AREA_CHANGE_THRESHOLD = 2
 
-    categorized_deals = defaultdict(list)
-    for prop_id, cadastre_area in cadastre_data.items():
+# Ключи групп по индексу has_debt * 3 + area_change (0 - без изменений, 1 - увеличение, 2 - уменьшение)
+GROUP_KEYS = np.array([
+    '1_no_issues', '5_increase_only', '6_decrease_only',
+    '2_debt_only', '3_debt_and_increase', '4_debt_and_decrease',
+])
+
+# Поля этапов процесса, которые обнуляются при повторной обработке сделки
+WORKFLOW_RESET_FIELDS = {
+    'documents_delivered_at': None,
+    'arrival_deadline': None,
+    'client_arrived_at': None,
+    'unilateral_act_downloaded_at': None,
+    'unilateral_act_uploaded_path': None,
+    'acceptance_act_downloaded_at': None,
+    'is_act_signed': None,
+    'has_defect_list': None,
+    'signed_act_uploaded_path': None,
+    'defect_list_uploaded_path': None,
+}
+
+
+# Поля сделки, которые раскладка пишет в результат (в этом порядке)
+CATEGORIZED_DEAL_FIELDS = (
+    'deal_id', 'property_id', 'area_diff', 'contract_area', 'client_id', 'client_name',
+    'floor', 'section', 'sell_status_name', 'deal_status_name',
+)
+
+
+@timed('categorize', rows=lambda categorized: sum(map(len, categorized.values())))
+def _categorize_deals(cadastre_data: dict, properties_from_db: dict, fingerprints: dict = None):
+    """
+    Раскладывает квартиры по группам колонками: расхождение площадей и порог
+    считаются сразу для всех квартир, словари сделок собираются только на выходе.
+    fingerprints - отпечатки квартир, их сохраняет запуск для следующей загрузки.
+    """
+    fingerprints = fingerprints or {}
+    # 1. Соединяем кадастровые площади с данными CRM (только квартиры со сделкой)
+    matched_ids, matched_props = [], []
+    for prop_id in cadastre_data:
         prop_data = properties_from_db.get(prop_id)
-        if not prop_data:
-            continue
+        if prop_data and prop_data.get('deal_id'):
+            matched_ids.append(prop_id)
+            matched_props.append(prop_data)
 
-        if not prop_data.get('deal_id'):
-            continue
+    categorized_deals = defaultdict(list)
+    if not matched_ids:
+        return categorized_deals
 
-        contract_area = float(prop_data.get('contract_area', 0))
-        area_diff = cadastre_area - contract_area
+    count = len(matched_ids)
+    cadastre_areas = np.fromiter((float(cadastre_data[p]) for p in matched_ids), dtype=float, count=count)
+    contract_areas = np.fromiter((float(d.get('contract_area', 0)) for d in matched_props), dtype=float, count=count)
+    has_debt = np.fromiter((bool(d.get('has_debt', False)) for d in matched_props), dtype=bool, count=count)
 
-        deal_info = {
+    # 2. Расхождение и направление изменения площади для всех строк сразу
+    area_diffs = cadastre_areas - contract_areas
+    area_change = np.select(
+        [area_diffs > AREA_CHANGE_THRESHOLD, area_diffs < -AREA_CHANGE_THRESHOLD],
+        [1, 2],
+        default=0
+    )
+    group_keys = GROUP_KEYS[has_debt * 3 + area_change]
+
+    # 3. Собираем записи сделок в исходном порядке квартир
+    for prop_id, prop_data, contract_area, area_diff, key in zip(
+            matched_ids, matched_props, contract_areas.tolist(), area_diffs.tolist(), group_keys.tolist()):
+        categorized_deals[key].append({
             'deal_id': prop_data.get('deal_id'),
             'property_id': prop_id,
             'area_diff': round(area_diff, 2),
@@ -38,61 +93,220 @@ def process_cadastre_data(cadastre_data: dict, house_id: int):
             'client_id': prop_data.get('client_id'),
             'client_name': prop_data.get('client_name'),
             'floor': prop_data.get('floor'),
-            'section': prop_data.get('section', 'N/A'), # <-- ДОБАВЛЕНО ПОЛЕ
+            'section': prop_data.get('section', 'N/A'),
             'sell_status_name': prop_data.get('sell_status_name'),
-            'deal_status_name': prop_data.get('deal_status_name')
-        }
+            'deal_status_name': prop_data.get('deal_status_name'),
+            'fingerprint': fingerprints.get(prop_id),
+        })
+
+    return categorized_deals
 
-        has_debt = prop_data.get('has_debt', False)
-        area_change = 'increase' if area_diff > 2 else 'decrease' if area_diff < -2 else 'no_change'
 
-        key_map = {
-            (False, 'no_change'): '1_no_issues', (True, 'no_change'): '2_debt_only',
-            (False, 'increase'): '5_increase_only', (True, 'increase'): '3_debt_and_increase',
-            (False, 'decrease'): '6_decrease_only', (True, 'decrease'): '4_debt_and_decrease',
-        }
-        key = key_map.get((has_debt, area_change))
-        if key:
-            categorized_deals[key].append(deal_info)
+def _deal_groups(categorized_deals: dict) -> dict:
+    """{deal_id: group_key} всех сделок результата раскладки."""
+    return {
+        deal['deal_id']: group_key
+        for group_key, deals in categorized_deals.items() for deal in deals if deal.get('deal_id')
+    }
 
-    try:
-        all_deals_map = {
-            deal['deal_id']: {'group_key': group_key, **deal}
-            for group_key, deals in categorized_deals.items() for deal in deals if deal.get('deal_id')
+
+def _reconcile_house(cadastre_data: dict, properties_from_db: dict, house_id, incremental: bool):
+    """
+    Раскладка одного дома с учетом его прошлого запуска. Квартиры сравниваются по отпечаткам
+    (площадь + поля CRM): в инкрементальном режиме заново раскладываются только новые и
+    изменившиеся, остальные берутся из прошлого запуска как есть. Если прошлого запуска нет
+    (дом не загружался или история сброшена перезапуском), сравнивать не с чем - обработка
+    полная, со сбросом всех статусов (mode 'initial').
+    Возвращает (categorized_deals, touched, kept, report): touched - {deal_id: group_key}
+    сделок, статусы которых сбрасываются, kept - сделки, ход процесса по которым сохраняется.
+    """
+    fingerprints = {
+        prop_id: apartment_fingerprint(area, properties_from_db.get(prop_id))
+        for prop_id, area in cadastre_data.items()
+    }
+    previous = get_previous_house_apartments(house_id)
+    diff = diff_apartments(fingerprints, {
+        prop_id: row.fingerprint for prop_id, row in (previous or {}).items()
+    })
+    report = {name: len(prop_ids) for name, prop_ids in diff.items()}
+
+    if not incremental or previous is None:
+        report['mode'] = 'full' if not incremental else 'initial'
+        categorized_deals = _categorize_deals(cadastre_data, properties_from_db, fingerprints)
+        return categorized_deals, _deal_groups(categorized_deals), {}, report
+
+    report['mode'] = 'incremental'
+    recomputed = _categorize_deals(
+        {prop_id: cadastre_data[prop_id] for prop_id in diff['added'] + diff['changed']},
+        properties_from_db, fingerprints,
+    )
+    placed = {deal['property_id']: (group_key, deal) for group_key, deals in recomputed.items() for deal in deals}
+    kept = {}
+    for prop_id in diff['unchanged']:
+        row = previous[str(prop_id)]
+        if row.group_key is None:
+            continue
+        deal = {field: getattr(row, field) for field in CATEGORIZED_DEAL_FIELDS}
+        deal.update({'property_id': prop_id, 'fingerprint': row.fingerprint})
+        placed[prop_id] = (row.group_key, deal)
+        kept[row.deal_id] = row.group_key
+
+    # Итог в порядке квартир файла - как при полной раскладке
+    categorized_deals = defaultdict(list)
+    for prop_id in cadastre_data:
+        if prop_id in placed:
+            group_key, deal = placed[prop_id]
+            categorized_deals[group_key].append(deal)
+    return categorized_deals, _deal_groups(recomputed), kept, report
+
+
+def _count_existing_statuses(deal_ids: list) -> int:
+    """Сколько статусов из списка уже есть (одна выборка на пачку)."""
+    batch_size = Config.STATUS_UPSERT_BATCH_SIZE
+    existing_count = 0
+    for i in range(0, len(deal_ids), batch_size):
+        batch = deal_ids[i:i + batch_size]
+        existing_count += db.session.execute(
+            select(func.count()).select_from(DealStatus).where(DealStatus.deal_id.in_(batch))
+        ).scalar_one()
+    return existing_count
+
+
+@timed('status_upsert', rows=lambda report: report['inserted'] + report['reset'])
+def _upsert_deal_statuses(deal_groups: dict):
+    """
+    Создает или сбрасывает статусы сделок пачками INSERT ... ON CONFLICT(deal_id) DO UPDATE.
+    deal_groups - {deal_id: group_key}. Возвращает {'inserted': N, 'reset': M}.
+    """
+    deal_ids = list(deal_groups)
+    batch_size = Config.STATUS_UPSERT_BATCH_SIZE
+
+    # Сколько статусов уже есть - только для отчета
+    existing_count = _count_existing_statuses(deal_ids)
+
+    rows = [
+        {'deal_id': deal_id, 'group_key': group_key, 'status': 'processing', **WORKFLOW_RESET_FIELDS}
+        for deal_id, group_key in deal_groups.items()
+    ]
+    stmt = sqlite_insert(DealStatus)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DealStatus.deal_id],
+        set_={
+            'group_key': stmt.excluded.group_key,
+            'status': stmt.excluded.status,
+            **WORKFLOW_RESET_FIELDS,
         }
+    )
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(stmt, rows[i:i + batch_size])
+
+    return {'inserted': len(deal_ids) - existing_count, 'reset': existing_count}
 
-        if all_deals_map:
-            all_deal_ids = list(all_deals_map.keys())
-
-            existing_statuses = DealStatus.query.filter(DealStatus.deal_id.in_(all_deal_ids)).all()
-            existing_status_map = {s.deal_id: s for s in existing_statuses}
-
-            for deal_id, deal_info in all_deals_map.items():
-                status = existing_status_map.get(deal_id)
-                if status:
-                    status.group_key = deal_info['group_key']
-                    status.status = 'processing'
-                    # ... (сброс полей)
-                    status.documents_delivered_at = None
-                    status.client_arrived_at = None
-                    status.unilateral_act_downloaded_at = None
-                    status.unilateral_act_uploaded_path = None
-                    status.acceptance_act_downloaded_at = None
-                    status.is_act_signed = None
-                    status.has_defect_list = None
-                    status.signed_act_uploaded_path = None
-                    status.defect_list_uploaded_path = None
-                else:
-                    new_status = DealStatus(
-                        deal_id=deal_id,
-                        group_key=deal_info['group_key'],
-                        status='processing'
-                    )
-                    db.session.add(new_status)
-
-            db.session.commit()
-    except Exception as e:
+
+def _insert_missing_statuses(deal_groups: dict) -> int:
+    """
+    Создает статусы неизменившихся сделок, если их нет (INSERT ... ON CONFLICT DO NOTHING):
+    существующие статусы и ход процесса по ним не трогаются. Возвращает число созданных.
+    """
+    deal_ids = list(deal_groups)
+    batch_size = Config.STATUS_UPSERT_BATCH_SIZE
+    missing_count = len(deal_ids) - _count_existing_statuses(deal_ids)
+    if missing_count:
+        stmt = sqlite_insert(DealStatus).on_conflict_do_nothing(index_elements=[DealStatus.deal_id])
+        rows = [{'deal_id': deal_id, 'group_key': group_key, 'status': 'processing'}
+                for deal_id, group_key in deal_groups.items()]
+        for i in range(0, len(rows), batch_size):
+            db.session.execute(stmt, rows[i:i + batch_size])
+    return missing_count
+
+
+def _update_statuses(touched: dict, kept: dict = None):
+    """
+    Одним upsert создает/сбрасывает статусы сделок touched ({deal_id: group_key});
+    для сделок kept только создает недостающие статусы (kept в отчете - сколько статусов сохранено).
+    """
+    status_report = {'inserted': 0, 'reset': 0, 'kept': 0}
+    try:
+        if touched:
+            status_report.update(_upsert_deal_statuses(touched))
+        if kept:
+            missing_count = _insert_missing_statuses(kept)
+            status_report['inserted'] += missing_count
+            status_report['kept'] = len(kept) - missing_count
+        db.session.commit()
+    except Exception:
         db.session.rollback()
-        print(f"Ошибка при обновлении/создании статусов: {e}")
+        logger.exception('Ошибка при обновлении/создании статусов')
+    return status_report
 
-    return categorized_deals
+
+def process_cadastre_data(cadastre_data: dict, house_id: int, on_stage=None, incremental: bool = None):
+    """
+    Раскладывает квартиры по группам и сбрасывает/создает статусы сделок.
+    В инкрементальном режиме (по умолчанию INCREMENTAL_REUPLOAD) при повторной загрузке дома
+    пересчитываются и сбрасываются только новые и изменившиеся квартиры.
+    Возвращает (categorized_deals, status_report), где status_report - {'inserted': N, 'reset': M,
+    'kept': K, 'reconcile': {'mode', 'added', 'changed', 'unchanged', 'removed'}}.
+    on_stage(stage) вызывается перед каждым этапом: 'crm_lookup', 'categorize', 'statuses'.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    if incremental is None:
+        incremental = Config.INCREMENTAL_REUPLOAD
+    property_ids = list(cadastre_data.keys())
+    if not property_ids:
+        return {}, {'inserted': 0, 'reset': 0, 'kept': 0}
+
+    on_stage('crm_lookup')
+    db_session_mysql = MysqlSession()
+    properties_from_db = get_deals_data(db_session_mysql, property_ids, house_id)
+
+    on_stage('categorize')
+    categorized_deals, touched, kept, reconcile_report = _reconcile_house(
+        cadastre_data, properties_from_db, house_id, incremental
+    )
+
+    on_stage('statuses')
+    status_report = _update_statuses(touched, kept)
+    status_report['reconcile'] = reconcile_report
+    return categorized_deals, status_report
+
+
+def process_batch_cadastre_data(cadastre_by_house: dict, on_stage=None, incremental: bool = None):
+    """
+    Пакетная обработка нескольких домов: данные CRM по всем домам одним запросом,
+    раскладка по группам - отдельно по каждому дому (номера квартир повторяются
+    между домами, прошлый запуск у каждого дома свой), статусы всех сделок - одним upsert.
+    Возвращает ({house_id: categorized_deals}, status_report); reconcile в отчете - сумма по домам.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    if incremental is None:
+        incremental = Config.INCREMENTAL_REUPLOAD
+
+    on_stage('crm_lookup')
+    properties_by_house = get_deals_data_for_houses(
+        MysqlSession(), {house_id: list(data) for house_id, data in cadastre_by_house.items()}
+    )
+
+    on_stage('categorize')
+    categorized_by_house, touched, kept = {}, {}, {}
+    reconcile_report = {'mode': 'full', 'added': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+    for house_id, cadastre_data in cadastre_by_house.items():
+        if not cadastre_data:
+            categorized_by_house[house_id] = {}
+            continue
+        categorized_by_house[house_id], house_touched, house_kept, house_report = _reconcile_house(
+            cadastre_data, properties_by_house[house_id], house_id, incremental
+        )
+        touched.update(house_touched)
+        kept.update(house_kept)
+        for name, value in house_report.items():
+            if name == 'mode':
+                if value == 'incremental' or (value == 'initial' and reconcile_report['mode'] == 'full'):
+                    reconcile_report['mode'] = value
+            else:
+                reconcile_report[name] += value
+
+    on_stage('statuses')
+    status_report = _update_statuses(touched, kept)
+    status_report['reconcile'] = reconcile_report
+    return categorized_by_house, status_report
@@ -0,0 +1,52 @@
+# app/cadastre_process/services/reconcile_service.py
+import hashlib
+from decimal import Decimal
+
+# Поля CRM, от которых зависит результат сверки квартиры (группа и данные сделки)
+FINGERPRINT_FIELDS = (
+    'deal_id', 'contract_area', 'has_debt', 'client_id', 'client_name',
+    'floor', 'section', 'sell_status_name', 'deal_status_name',
+)
+
+
+def _normalize(value):
+    """Одно и то же значение из CRM, файла и сохраненного запуска дает один и тот же вид."""
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float, Decimal)):
+        return round(float(value), 4)
+    return str(value)
+
+
+def apartment_fingerprint(cadastre_area, prop_data: dict = None) -> str:
+    """
+    Отпечаток входных данных квартиры: площадь из файла и поля CRM ее сделки.
+    Для квартиры без сделки - только площадь (такие квартиры не сверяются).
+    """
+    try:
+        values = [_normalize(float(cadastre_area))]
+    except (TypeError, ValueError):
+        values = [None]
+    if prop_data and prop_data.get('deal_id'):
+        values.extend(_normalize(prop_data.get(field)) for field in FINGERPRINT_FIELDS)
+    return hashlib.blake2b(repr(values).encode('utf-8'), digest_size=8).hexdigest()
+
+
+def diff_apartments(fingerprints: dict, previous_fingerprints: dict) -> dict:
+    """
+    Сравнивает отпечатки новой загрузки {property_id: fingerprint} с прошлым запуском дома.
+    Возвращает {'added': [...], 'changed': [...], 'unchanged': [...], 'removed': [...]}:
+    первые три - номера в порядке файла, removed - квартиры прошлого запуска, которых нет в файле.
+    """
+    diff = {'added': [], 'changed': [], 'unchanged': [], 'removed': []}
+    for prop_id, fingerprint in fingerprints.items():
+        previous = previous_fingerprints.get(str(prop_id), False)
+        if previous is False:
+            diff['added'].append(prop_id)
+        elif previous == fingerprint:
+            diff['unchanged'].append(prop_id)
+        else:
+            diff['changed'].append(prop_id)
+    current_ids = {str(prop_id) for prop_id in fingerprints}
+    diff['removed'] = [prop_id for prop_id in previous_fingerprints if prop_id not in current_ids]
+    return diff
@@ -0,0 +1,261 @@
+# app/cadastre_process/services/run_service.py
+
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, select
+
+from app import db
+from app.config import Config
+from app.metrics import stage_timer
+from ..models import UploadRun, RunApartment, DealStatus
+from .checkerboard_service import build_checkerboards
+from .deadline_service import deadline_conditions, is_overdue
+from .reconcile_service import apartment_fingerprint
+
+# Поля сделки в том виде, в котором их отдает process_cadastre_data
+DEAL_FIELDS = (
+    'house_id', 'deal_id', 'property_id', 'area_diff', 'contract_area', 'client_id', 'client_name',
+    'floor', 'section', 'sell_status_name', 'deal_status_name',
+)
+
+_DEAL_COLUMNS = [getattr(RunApartment, field) for field in DEAL_FIELDS]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _latest_house_run_ids():
+    """Запрос id последнего запуска каждого дома (по индексу house_id + run_id)."""
+    house_runs = (
+        select(RunApartment.house_id, RunApartment.run_id)
+        .where(RunApartment.house_id.isnot(None))
+        .distinct()
+        .subquery()
+    )
+    ranked = (
+        select(
+            house_runs.c.run_id,
+            func.row_number().over(
+                partition_by=house_runs.c.house_id, order_by=UploadRun.created_at.desc()
+            ).label('position'),
+        )
+        .join(UploadRun, UploadRun.id == house_runs.c.run_id)
+        .subquery()
+    )
+    return select(ranked.c.run_id).where(ranked.c.position == 1)
+
+
+def _purge_expired_runs():
+    """
+    Удаляет запуски старше RUN_STORE_TTL_HOURS вместе с их квартирами. Последний запуск
+    каждого дома остается: по его отпечаткам сверяется следующая загрузка дома.
+    """
+    expired_before = datetime.utcnow() - timedelta(hours=Config.RUN_STORE_TTL_HOURS)
+    expired_ids = db.session.scalars(
+        select(UploadRun.id)
+        .where(UploadRun.created_at < expired_before, UploadRun.id.not_in(_latest_house_run_ids()))
+    ).all()
+    if not expired_ids:
+        return
+    db.session.execute(delete(RunApartment).where(RunApartment.run_id.in_(expired_ids)))
+    db.session.execute(delete(UploadRun).where(UploadRun.id.in_(expired_ids)))
+
+
+def _apartment_rows(run_id, house_id, cadastre_data: dict, categorized_results: dict):
+    """Строки run_apartments одного дома: сначала сделки в порядке групп, затем квартиры без сделок."""
+    rows = []
+    categorized_ids = set()
+    for group_key, deals in categorized_results.items():
+        for deal in deals:
+            prop_id = str(deal['property_id'])
+            categorized_ids.add(prop_id)
+            row = {field: deal.get(field) for field in DEAL_FIELDS}
+            row.update({
+                'run_id': run_id,
+                'house_id': house_id,
+                'property_id': prop_id,
+                'group_key': group_key,
+                'cadastre_area': _to_float(cadastre_data.get(deal['property_id'])),
+                'fingerprint': deal.get('fingerprint'),
+            })
+            rows.append(row)
+
+    for prop_id, area in cadastre_data.items():
+        if str(prop_id) not in categorized_ids:
+            rows.append({
+                'run_id': run_id, 'house_id': house_id, 'property_id': str(prop_id), 'cadastre_area': _to_float(area),
+                'fingerprint': apartment_fingerprint(area),
+            })
+    return rows
+
+
+def create_batch_run(cadastre_by_house: dict, categorized_by_house: dict, house_id=None, parse_reports=None):
+    """
+    Сохраняет результаты обработки одного или нескольких домов одним запуском
+    и возвращает id запуска. Шахматки строятся здесь же, один раз на запуск, по каждому дому.
+    parse_reports - {house_id: отчет разбора файла} для показа на странице результатов.
+    """
+    run_id = uuid.uuid4().hex
+    _purge_expired_runs()
+
+    rows = []
+    checkerboards = {}
+    with stage_timer('checkerboards'):
+        for house, cadastre_data in cadastre_by_house.items():
+            categorized_results = categorized_by_house.get(house) or {}
+            rows.extend(_apartment_rows(run_id, house, cadastre_data, categorized_results))
+            checkerboards[str(house)] = build_checkerboards(cadastre_data, categorized_results)
+
+    with stage_timer('run_save', rows=len(rows)):
+        db.session.add(UploadRun(
+            id=run_id, house_id=house_id,
+            house_ids=list(cadastre_by_house),
+            checkerboards=checkerboards,
+            parse_reports={str(house): report for house, report in (parse_reports or {}).items()},
+        ))
+        if rows:
+            # Все квартиры одним executemany, без ORM unit-of-work
+            db.session.execute(insert(RunApartment), rows)
+        db.session.commit()
+    return run_id
+
+
+def create_run(house_id, cadastre_data: dict, categorized_results: dict, parse_report=None):
+    """Сохраняет результаты обработки одного дома и возвращает id запуска."""
+    return create_batch_run(
+        {house_id: cadastre_data}, {house_id: categorized_results}, house_id=house_id,
+        parse_reports={house_id: parse_report} if parse_report else None,
+    )
+
+
+def get_run_house_ids(run_id):
+    """Дома запуска в порядке загрузки."""
+    run = db.session.get(UploadRun, run_id) if run_id else None
+    return list(run.house_ids or []) if run else []
+
+
+def get_parse_report(run_id, house_id):
+    """Отчет разбора файла дома в запуске или None."""
+    run = db.session.get(UploadRun, run_id) if run_id else None
+    if run is None or not run.parse_reports:
+        return None
+    return run.parse_reports.get(str(house_id))
+
+
+def get_previous_house_apartments(house_id):
+    """
+    Квартиры дома из его последнего сохраненного запуска (одиночного или пакетного):
+    {property_id: строка с fingerprint, group_key и полями сделки} или None,
+    если дом еще не загружался (последний запуск дома не удаляется по сроку хранения).
+    """
+    run_id = db.session.scalar(
+        select(UploadRun.id)
+        .where(UploadRun.id.in_(select(RunApartment.run_id).where(RunApartment.house_id == house_id)))
+        .order_by(UploadRun.created_at.desc())
+        .limit(1)
+    )
+    if run_id is None:
+        return None
+    query = (
+        select(RunApartment.fingerprint, RunApartment.group_key, *_DEAL_COLUMNS)
+        .where(RunApartment.run_id == run_id, RunApartment.house_id == house_id)
+    )
+    return {row.property_id: row for row in db.session.execute(query)}
+
+
+def run_exists(run_id) -> bool:
+    if not run_id:
+        return False
+    return db.session.get(UploadRun, run_id) is not None
+
+
+def _deal_from_row(row):
+    return {field: getattr(row, field) for field in DEAL_FIELDS}
+
+
+def get_categorized_results(run_id):
+    """Возвращает все сделки запуска в формате {group_key: [deal, ...]}."""
+    categorized = defaultdict(list)
+    query = (
+        select(RunApartment.group_key, *_DEAL_COLUMNS)
+        .where(RunApartment.run_id == run_id, RunApartment.group_key.isnot(None))
+        .order_by(RunApartment.id)
+    )
+    for row in db.session.execute(query):
+        categorized[row.group_key].append(_deal_from_row(row))
+    return categorized
+
+
+def get_group_deals(run_id, group_key):
+    """Возвращает сделки одной группы (по индексу run_id + group_key)."""
+    query = (
+        select(*_DEAL_COLUMNS)
+        .where(RunApartment.run_id == run_id, RunApartment.group_key == group_key)
+        .order_by(RunApartment.id)
+    )
+    return [_deal_from_row(row) for row in db.session.execute(query)]
+
+
+def find_deal_by_property(run_id, group_key, property_id, house_id=None):
+    """Находит сделку группы по номеру квартиры (в пакетном запуске - с уточнением дома)."""
+    conditions = [
+        RunApartment.run_id == run_id,
+        RunApartment.property_id == str(property_id),
+        RunApartment.group_key == group_key,
+    ]
+    if house_id is not None:
+        conditions.append(RunApartment.house_id == house_id)
+    query = select(*_DEAL_COLUMNS).where(*conditions).limit(1)
+    row = db.session.execute(query).first()
+    return _deal_from_row(row) if row else None
+
+
+def get_deals_page(run_id, filters: dict, page: int, per_page: int):
+    """
+    Возвращает одну страницу сделок запуска со статусами и общее количество.
+    Фильтры (group_key, status, timeout = 'overdue' | 'due_soon' | 'on_time') и пагинация
+    выполняются в SQL; срок явки хранится в DealStatus.arrival_deadline.
+    """
+    now = datetime.utcnow()
+    conditions = [
+        RunApartment.run_id == run_id,
+        RunApartment.group_key.isnot(None),
+        RunApartment.deal_id.isnot(None),
+    ]
+    if filters.get('group_key'):
+        conditions.append(RunApartment.group_key == filters['group_key'])
+    if filters.get('status'):
+        conditions.append(DealStatus.status == filters['status'])
+    conditions.extend(deadline_conditions(filters.get('timeout'), now))
+
+    total_count = db.session.execute(
+        select(func.count(RunApartment.id))
+        .outerjoin(DealStatus, DealStatus.deal_id == RunApartment.deal_id)
+        .where(*conditions)
+    ).scalar_one()
+
+    page_query = (
+        select(RunApartment, DealStatus)
+        .outerjoin(DealStatus, DealStatus.deal_id == RunApartment.deal_id)
+        .where(*conditions)
+        .order_by(RunApartment.id)
+        .limit(per_page)
+        .offset((page - 1) * per_page)
+    )
+    deals_for_page = []
+    for apartment, status_obj in db.session.execute(page_query):
+        deal = _deal_from_row(apartment)
+        deal['group_key'] = apartment.group_key
+        deal['status_obj'] = status_obj
+        deal['is_timed_out'] = is_overdue(status_obj, now)
+        deal['deadline_iso'] = (
+            status_obj.arrival_deadline.isoformat() if status_obj and status_obj.arrival_deadline else None
+        )
+        deals_for_page.append(deal)
+
+    return deals_for_page, total_count
@@ -0,0 +1,185 @@
+# app/cadastre_process/services/scan_storage.py
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from sqlalchemy import select, union
+from werkzeug.utils import secure_filename
+
+from app import db
+from app.config import Config
+from ..models import DealStatus
+
+# Виды сканов сделки и колонки DealStatus, в которых хранится ключ файла
+SCAN_KINDS = {
+    'unilateral_act': 'unilateral_act_uploaded_path',
+    'signed_act': 'signed_act_uploaded_path',
+    'defect_list': 'defect_list_uploaded_path',
+}
+
+logger = logging.getLogger(__name__)
+
+# Ключ файла в хранилище: sha256 содержимого + расширение исходного файла
+_KEY_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]{1,10})?$')
+
+
+_gc_started = False
+_gc_lock = threading.Lock()
+
+
+class ScanStorageError(Exception):
+    """Файл не принят хранилищем (пустой, слишком большой); текст - для пользователя."""
+
+
+def _root():
+    return Config.UPLOAD_FOLDER
+
+
+def _extension(filename):
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return ext if re.fullmatch(r'\.[a-z0-9]{1,10}', ext) else ''
+
+
+def scan_path(key: str):
+    """
+    Путь к файлу по ключу: uploads/ab/cd/<sha256><ext>. Две ступени по 256 папок -
+    в одной папке остаются единицы файлов даже при сотнях тысяч сканов.
+    Значения из старых версий (путь к файлу в плоской папке) возвращаются как есть.
+    """
+    if not key:
+        return None
+    if _KEY_RE.match(key):
+        return os.path.join(_root(), key[:2], key[2:4], key)
+    return key
+
+
+def save_scan(file_storage) -> str:
+    """
+    Потоково пишет загруженный файл во временный файл хранилища, одновременно считая sha256
+    и проверяя размер (SCAN_MAX_SIZE_MB), затем атомарно переносит его на место по хэшу.
+    Одинаковые файлы хранятся один раз: уже сохраненный файл заменяется тем же содержимым,
+    так что после возврата он точно на месте и "свежий" для сборки мусора (collect_orphan_scans).
+    Возвращает ключ файла для DealStatus.
+    """
+    max_size = Config.SCAN_MAX_SIZE_MB * 1024 * 1024
+    tmp_dir = os.path.join(_root(), 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            while True:
+                chunk = file_storage.stream.read(Config.SCAN_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise ScanStorageError(f'Файл больше {Config.SCAN_MAX_SIZE_MB} МБ.')
+                digest.update(chunk)
+                tmp_file.write(chunk)
+        if not size:
+            raise ScanStorageError('Файл пустой.')
+
+        key = digest.hexdigest() + _extension(file_storage.filename)
+        path = scan_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return key
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def scan_etag(key: str):
+    """ETag файла - его хэш: содержимое по ключу никогда не меняется."""
+    return key.split('.', 1)[0] if key and _KEY_RE.match(key) else None
+
+
+def _referenced_keys() -> set:
+    """Ключи всех сканов, на которые ссылаются сделки (одним запросом по трем колонкам)."""
+    query = union(*(select(getattr(DealStatus, column)) for column in SCAN_KINDS.values()))
+    return {key for key in db.session.scalars(query) if key}
+
+
+def _collect_file(path: str, min_mtime: float) -> bool:
+    """
+    Удаляет файл без ссылок. Сначала файл атомарно уводится в сторону: если за это время
+    save_scan успел положить на его место то же содержимое (свежий mtime), файл возвращается.
+    """
+    trash_path = f'{path}.gc'
+    try:
+        os.replace(path, trash_path)
+    except FileNotFoundError:
+        return False
+    if os.stat(trash_path).st_mtime >= min_mtime:
+        os.replace(trash_path, path)
+        return False
+    os.remove(trash_path)
+    return True
+
+
+def collect_orphan_scans(min_age: float = None) -> int:
+    """
+    Сборка мусора хранилища: удаляет файлы, на которые не ссылается ни одна сделка и которые
+    не обновлялись дольше min_age секунд (по умолчанию SCAN_GC_MIN_AGE), и брошенные временные
+    файлы. Файлы не удаляются сразу при неудачной загрузке: тот же файл мог только что
+    сохранить другой оператор, и проверка ссылок с удалением гонялись бы с его записью.
+    Возвращает число удаленных файлов.
+    """
+    min_age = Config.SCAN_GC_MIN_AGE if min_age is None else min_age
+    min_mtime = time.time() - min_age
+    root = _root()
+    if not os.path.isdir(root):
+        return 0
+
+    referenced = _referenced_keys()
+    removed = 0
+    for dir_path, _, file_names in os.walk(root):
+        in_tmp = os.path.relpath(dir_path, root).split(os.sep)[0] == 'tmp'
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            if in_tmp or file_name.endswith('.gc'):
+                # Временные файлы прерванных загрузок
+                if os.stat(path).st_mtime < min_mtime:
+                    os.remove(path)
+                    removed += 1
+            elif _KEY_RE.match(file_name) and file_name not in referenced and os.stat(path).st_mtime < min_mtime:
+                removed += _collect_file(path, min_mtime)
+    return removed
+
+
+def _gc_loop(app, stop_event):
+    while not stop_event.wait(Config.SCAN_GC_INTERVAL):
+        with app.app_context():
+            try:
+                removed = collect_orphan_scans()
+                if removed:
+                    logger.info('Удалено файлов сканов без ссылок: %d', removed)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Ошибка сборки мусора хранилища сканов')
+
+
+def start_scan_gc(app):
+    """
+    Запускает сборку мусора хранилища сканов раз в SCAN_GC_INTERVAL секунд
+    (0 - не запускать). Один поток на процесс приложения.
+    """
+    global _gc_started
+    if not Config.SCAN_GC_INTERVAL:
+        return None
+    with _gc_lock:
+        if _gc_started:
+            return None
+        _gc_started = True
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_gc_loop, args=(app, stop_event), name='scan-gc', daemon=True)
+    thread.start()
+    return stop_event
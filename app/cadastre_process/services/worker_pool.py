@@ -0,0 +1,75 @@
+# app/cadastre_process/services/worker_pool.py
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.config import Config
+
+_pool = None
+_pool_lock = threading.Lock()
+_job_pool = None
+
+
+def get_worker_count() -> int:
+    """Число процессов для тяжелых задач (0 в конфиге - по числу ядер)."""
+    return Config.WORKER_PROCESSES or os.cpu_count() or 1
+
+
+# Модули, которые сервер forkserver импортирует один раз: воркеры получают их уже загруженными
+WORKER_PRELOAD_MODULES = ['app.cadastre_process.services.file_service']
+
+
+def _get_worker_context():
+    """
+    Контекст запуска воркеров: 'forkserver' (где его нет - 'spawn'), но не 'fork'.
+    В процессе приложения работают потоки (планировщик сроков, писатель статусов,
+    обновление снимков CRM, пул загрузок), и fork копирует их блокировки в том
+    состоянии, в каком они были, - дочерний процесс может зависнуть навсегда.
+    Сервер forkserver запускается с чистого интерпретатора и сам потоков не имеет.
+    Главный модуль воркеры импортируют как '__mp_main__', поэтому он должен быть
+    безопасен для импорта (см. run.py: приложение там не создается).
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(WORKER_PRELOAD_MODULES)
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def get_process_pool():
+    """Возвращает общий пул процессов (создается один раз на процесс приложения)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=get_worker_count(),
+                mp_context=_get_worker_context(),
+            )
+        return _pool
+
+
+def shutdown_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def get_job_pool():
+    """
+    Пул потоков для фоновой обработки загрузок. Потоки, а не процессы: этапы
+    в основном ждут MySQL и SQLite, а рендер документов уходит в пул процессов.
+    """
+    global _job_pool
+    with _pool_lock:
+        if _job_pool is None:
+            _job_pool = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS, thread_name_prefix='upload-job')
+        return _job_pool
+
+
+def chunked(items: list, size: int):
+    """Делит список на последовательные куски по size элементов."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
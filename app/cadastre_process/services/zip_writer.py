@@ -0,0 +1,142 @@
+# app/cadastre_process/services/zip_writer.py
+"""
+Минимальная запись ZIP-архивов из заранее сжатых записей.
+Нужна там, где zipfile заставил бы заново сжимать одни и те же данные
+(неизменные части docx-шаблона), и для потоковой отдачи архива в ответ.
+"""
+import struct
+import time
+import zlib
+from typing import NamedTuple
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_OF_CENTRAL_DIR = struct.Struct('<IHHHHIIH')
+
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+
+_LOCAL_HEADER_SIGNATURE = 0x04034b50
+_DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+_CENTRAL_HEADER_SIGNATURE = 0x02014b50
+_END_OF_CENTRAL_DIR_SIGNATURE = 0x06054b50
+
+_VERSION = 20
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+
+
+class ZipEntry(NamedTuple):
+    """Запись архива с уже сжатыми данными."""
+    name: str
+    crc: int
+    size: int
+    data: bytes
+    method: int = ZIP_DEFLATED
+    dos_time: int = 0
+    dos_date: int = 0
+
+
+def _dos_datetime(timestamp: float = None):
+    t = time.localtime(timestamp)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def deflate(data: bytes, level: int = 6) -> bytes:
+    """Сжимает данные "сырым" DEFLATE (без заголовков zlib), как того требует ZIP."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def make_entry(name: str, data: bytes, method: int = ZIP_DEFLATED, level: int = 6) -> ZipEntry:
+    """Сжимает данные и возвращает готовую к записи запись архива."""
+    dos_time, dos_date = _dos_datetime()
+    payload = deflate(data, level) if method == ZIP_DEFLATED else data
+    return ZipEntry(name, zlib.crc32(data), len(data), payload, method, dos_time, dos_date)
+
+
+def _name_and_flags(name: str):
+    try:
+        return name.encode('ascii'), 0
+    except UnicodeEncodeError:
+        return name.encode('utf-8'), _FLAG_UTF8
+
+
+def _central_record(name, flags, method, dos_time, dos_date, crc, compressed_size, size, offset):
+    return _CENTRAL_HEADER.pack(
+        _CENTRAL_HEADER_SIGNATURE, _VERSION, _VERSION, flags, method, dos_time, dos_date,
+        crc, compressed_size, size, len(name), 0, 0, 0, 0, 0, offset,
+    ) + name
+
+
+def _end_of_central_dir(entries_count, central_size, central_offset):
+    return _END_OF_CENTRAL_DIR.pack(
+        _END_OF_CENTRAL_DIR_SIGNATURE, 0, 0, entries_count, entries_count, central_size, central_offset, 0,
+    )
+
+
+def build_zip(entries) -> bytes:
+    """Собирает ZIP-архив из записей ZipEntry (данные не пересжимаются)."""
+    chunks = []
+    central = []
+    offset = 0
+    for entry in entries:
+        name, flags = _name_and_flags(entry.name)
+        header = _LOCAL_HEADER.pack(
+            _LOCAL_HEADER_SIGNATURE, _VERSION, flags, entry.method, entry.dos_time, entry.dos_date,
+            entry.crc, len(entry.data), entry.size, len(name), 0,
+        )
+        chunks.append(header)
+        chunks.append(name)
+        chunks.append(entry.data)
+        central.append(_central_record(
+            name, flags, entry.method, entry.dos_time, entry.dos_date,
+            entry.crc, len(entry.data), entry.size, offset,
+        ))
+        offset += len(header) + len(name) + len(entry.data)
+
+    central_dir = b''.join(central)
+    chunks.append(central_dir)
+    chunks.append(_end_of_central_dir(len(central), len(central_dir), offset))
+    return b''.join(chunks)
+
+
+def stream_zip(files, level: int = 6):
+    """
+    Генератор ZIP-архива: принимает итерируемое (имя файла, байты) и отдает
+    куски архива по мере сжатия каждого файла.
+
+    CRC и размеры записываются после данных в дескрипторе (флаг 0x08), поэтому
+    локальный заголовок уходит клиенту сразу, а в памяти держится только
+    текущий файл и строки центрального каталога (~100 байт на файл).
+    """
+    central = []
+    offset = 0
+    for file_name, data in files:
+        name, flags = _name_and_flags(file_name)
+        flags |= _FLAG_DATA_DESCRIPTOR
+        dos_time, dos_date = _dos_datetime()
+        header = _LOCAL_HEADER.pack(
+            _LOCAL_HEADER_SIGNATURE, _VERSION, flags, ZIP_DEFLATED, dos_time, dos_date,
+            0, 0, 0, len(name), 0,
+        )
+        yield header + name
+
+        payload = deflate(data, level)
+        yield payload
+
+        crc = zlib.crc32(data)
+        yield _DATA_DESCRIPTOR.pack(_DATA_DESCRIPTOR_SIGNATURE, crc, len(payload), len(data))
+
+        central.append(_central_record(
+            name, flags, ZIP_DEFLATED, dos_time, dos_date, crc, len(payload), len(data), offset,
+        ))
+        offset += len(header) + len(name) + len(payload) + _DATA_DESCRIPTOR.size
+
+    central_dir = b''.join(central)
+    yield central_dir
+    yield _end_of_central_dir(len(central), len(central_dir), offset)
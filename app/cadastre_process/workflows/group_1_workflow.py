@@ -1,25 +1,41 @@
 # /app/cadastre_process/workflows/group_1_workflow.py
+from functools import lru_cache
+
 import docx
-from io import BytesIO
 
-def generate_unilateral_act(deal_data: dict):
-    """
-    Генерирует Word-документ одностороннего акта.
-    """
-    # В будущем сюда можно передавать больше данных о сделке
-    client_name = deal_data.get('client_name', 'Клиент')
-    apartment_id = deal_data.get('property_id', 'N/A')
+from app.metrics import timed
+
+from ..services.docx_service import DocxTemplate
 
+
+def _build_unilateral_act():
+    """Каркас одностороннего акта с полями {client_name} и {apartment_id}."""
     doc = docx.Document()
     doc.add_heading('ОДНОСТОРОННИЙ АКТ ПРИЕМА-ПЕРЕДАЧИ', 0)
     p = doc.add_paragraph()
-    p.add_run(f'Настоящий акт составлен в связи с неявкой клиента ({client_name}) ').bold = True
+    p.add_run('Настоящий акт составлен в связи с неявкой клиента ({client_name}) ').bold = True
     p.add_run('в установленный 30-дневный срок для приёмки квартиры №')
-    p.add_run(str(apartment_id)).bold = True
+    p.add_run('{apartment_id}').bold = True
     p.add_run('.')
     # ... здесь можно добавить больше текста и деталей акта ...
+    return doc
+
+
+@lru_cache(maxsize=None)
+def _get_unilateral_act_template():
+    return DocxTemplate(_build_unilateral_act, fields=('client_name', 'apartment_id'))
+
+
+@timed('document_unilateral_act', rows=lambda _: 1)
+def generate_unilateral_act(deal_data: dict):
+    """
+    Генерирует Word-документ одностороннего акта.
+    """
+    # В будущем сюда можно передавать больше данных о сделке
+    client_name = deal_data.get('client_name', 'Клиент')
+    apartment_id = deal_data.get('property_id', 'N/A')
 
-    doc_buffer = BytesIO()
-    doc.save(doc_buffer)
-    doc_buffer.seek(0)
-    return doc_buffer
\ No newline at end of file
+    return _get_unilateral_act_template().render_buffer(
+        client_name=client_name,
+        apartment_id=apartment_id,
+    )
@@ -21,6 +21,107 @@ class Config:
         f"@{os.environ.get('MYSQL_HOST')}:{os.environ.get('MYSQL_PORT')}"
         f"/{os.environ.get('MYSQL_DB')}"
     )
+
+    # --- ПУЛ СОЕДИНЕНИЙ С CRM (MySQL) ---
+    MYSQL_POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE', 10))
+    MYSQL_MAX_OVERFLOW = int(os.environ.get('MYSQL_MAX_OVERFLOW', 10))
+    # Сколько секунд ждать свободное соединение из пула
+    MYSQL_POOL_TIMEOUT = int(os.environ.get('MYSQL_POOL_TIMEOUT', 30))
+    # Пересоздавать соединения старше N секунд (меньше wait_timeout на стороне MySQL)
+    MYSQL_POOL_RECYCLE = int(os.environ.get('MYSQL_POOL_RECYCLE', 1800))
+    MYSQL_POOL_PRE_PING = os.environ.get('MYSQL_POOL_PRE_PING', '1') == '1'
+    # Таймауты драйвера pymysql (сек)
+    MYSQL_CONNECT_TIMEOUT = int(os.environ.get('MYSQL_CONNECT_TIMEOUT', 10))
+    MYSQL_READ_TIMEOUT = int(os.environ.get('MYSQL_READ_TIMEOUT', 60))
+    MYSQL_WRITE_TIMEOUT = int(os.environ.get('MYSQL_WRITE_TIMEOUT', 60))
+
+    # --- ВЫБОРКА СДЕЛОК ИЗ CRM (get_deals_data) ---
+    # До этого размера список квартир уходит одним IN-запросом, больше - пачками такого размера
+    DEALS_CHUNK_SIZE = int(os.environ.get('DEALS_CHUNK_SIZE', 500))
+    # Начиная с этого размера выгоднее забрать весь дом по house_id и отфильтровать в Python
+    DEALS_HOUSE_SCAN_THRESHOLD = int(os.environ.get('DEALS_HOUSE_SCAN_THRESHOLD', 3000))
+    # Сколько пачек выполняется параллельно (каждая на своем соединении из пула)
+    DEALS_QUERY_WORKERS = int(os.environ.get('DEALS_QUERY_WORKERS', 4))
+    # Размер порции при потоковом чтении результата
+    DEALS_YIELD_PER = int(os.environ.get('DEALS_YIELD_PER', 1000))
+
+    # --- КЭШ СПРАВОЧНЫХ ЗАПРОСОВ К CRM ---
+    # Максимальное число ключей и время жизни по умолчанию (сек)
+    REFERENCE_CACHE_SIZE = int(os.environ.get('REFERENCE_CACHE_SIZE', 256))
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL', 300))
+    # Список ЖК и домов меняется редко - держим его дольше
+    HOUSES_CACHE_TTL = int(os.environ.get('HOUSES_CACHE_TTL', 900))
+
+    # --- СНИМОК ДАННЫХ CRM ПО ДОМАМ (квартиры, сделки, покупатели) В SQLITE ---
+    # Повторная работа с домом идет без запросов к CRM, пока снимок не старше CRM_SNAPSHOT_MAX_AGE (сек).
+    # Выключен по умолчанию: со снимком долг и статус сделки при сверке могут отставать от CRM на MAX_AGE
+    CRM_SNAPSHOT_ENABLED = os.environ.get('CRM_SNAPSHOT_ENABLED', '0') == '1'
+    CRM_SNAPSHOT_MAX_AGE = int(os.environ.get('CRM_SNAPSHOT_MAX_AGE', 600))
+    # Как часто (сек) фоновый поток перечитывает все снимки; 0 - только по обращению
+    CRM_SNAPSHOT_REFRESH_INTERVAL = int(os.environ.get('CRM_SNAPSHOT_REFRESH_INTERVAL', 0))
+
+    # --- ХРАНИЛИЩЕ РЕЗУЛЬТАТОВ ОБРАБОТКИ ---
+    # Сколько часов хранить результаты запусков в локальной БД
+    RUN_STORE_TTL_HOURS = int(os.environ.get('RUN_STORE_TTL_HOURS', 72))
+    # Кэш готовых шахматок запусков в памяти процесса
+    CHECKERBOARD_CACHE_SIZE = int(os.environ.get('CHECKERBOARD_CACHE_SIZE', 32))
+    CHECKERBOARD_CACHE_TTL = int(os.environ.get('CHECKERBOARD_CACHE_TTL', 3600))
+
+    # Срок явки клиента после доставки документов (дней)
+    ARRIVAL_DEADLINE_DAYS = int(os.environ.get('ARRIVAL_DEADLINE_DAYS', 30))
+    # Фильтр 'скоро срок': явка истекает в ближайшие N дней
+    DEADLINE_DUE_SOON_DAYS = int(os.environ.get('DEADLINE_DUE_SOON_DAYS', 3))
+    # Как часто (сек) фоновая проверка переводит просроченные сделки в 'arrival_overdue'; 0 - не запускать
+    DEADLINE_SWEEP_INTERVAL = int(os.environ.get('DEADLINE_SWEEP_INTERVAL', 300))
+
+    # Размер пачки при массовом создании/сбросе статусов сделок
+    STATUS_UPSERT_BATCH_SIZE = int(os.environ.get('STATUS_UPSERT_BATCH_SIZE', 500))
+    # Повторная загрузка дома сбрасывает статусы только новых и изменившихся квартир
+    # (сравнение с последним запуском дома); '0' - всегда полная обработка со сбросом
+    INCREMENTAL_REUPLOAD = os.environ.get('INCREMENTAL_REUPLOAD', '1') == '1'
+
+    # --- ФОНОВЫЕ ПРОЦЕССЫ ---
+    # Число процессов для тяжелых задач (рендер документов); 0 - по числу ядер, 1 - без пула
+    WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', 0))
+    # Сколько загрузок обрабатывается в фоне одновременно
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    # Загрузка, не завершившаяся за столько секунд с начала обработки (без очереди), считается
+    # потерянной и помечается ошибкой; ее результат, если воркер все же доработает, не записывается
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 1800))
+    # Архив уведомлений: размер пачки на один воркер и минимальный размер группы для пула
+    ARCHIVE_CHUNK_SIZE = int(os.environ.get('ARCHIVE_CHUNK_SIZE', 25))
+    ARCHIVE_PARALLEL_MIN_DEALS = int(os.environ.get('ARCHIVE_PARALLEL_MIN_DEALS', 50))
+    # Шахматка Excel: сколько байт держать в памяти, прежде чем сбросить файл на диск
+    EXPORT_SPOOL_MAX_SIZE = int(os.environ.get('EXPORT_SPOOL_MAX_SIZE', 16 * 1024 * 1024))
+    # Отдавать архивы групп потоком (без сборки целого ZIP в памяти)
+    ARCHIVE_STREAMING = os.environ.get('ARCHIVE_STREAMING', '1') == '1'
+
+    # --- СКАНЫ ДОКУМЕНТОВ ---
+    # Папка хранилища сканов (создается при первой загрузке), лимит размера файла и размер порции записи
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'uploads')
+    SCAN_MAX_SIZE_MB = int(os.environ.get('SCAN_MAX_SIZE_MB', 50))
+    SCAN_CHUNK_SIZE = int(os.environ.get('SCAN_CHUNK_SIZE', 1024 * 1024))
+    # Сборка мусора сканов: как часто (сек, 0 - не запускать) и сколько секунд файл без ссылок
+    # должен пролежать нетронутым, прежде чем его удалят
+    SCAN_GC_INTERVAL = int(os.environ.get('SCAN_GC_INTERVAL', 3600))
+    SCAN_GC_MIN_AGE = int(os.environ.get('SCAN_GC_MIN_AGE', 3600))
+
+    # --- ЛОГИ И МЕТРИКИ ---
+    # Уровень логов приложения: DEBUG печатает каждое замечание разбора файла, INFO - только итоги
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    # Запросы и фоновые задачи дольше этого времени (сек) пишутся в лог с разбивкой по этапам; 0 - не писать
+    SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 5))
+
+    # --- ЛОКАЛЬНАЯ БД (SQLite) ---
+    # Режим журнала (WAL - чтение не блокируется записью), ожидание блокировки (мс),
+    # уровень synchronous и размер mmap (байт); пустое значение / 0 - не менять
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').upper()
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+    # Обновления статусов за это окно (мс) пишутся одной транзакцией; 0 - каждое отдельно
+    STATUS_WRITE_COALESCE_MS = float(os.environ.get('STATUS_WRITE_COALESCE_MS', 5))
+
     SQLALCHEMY_DATABASE_URI = 'sqlite:///notifications.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     RESET_DB_ON_START = True
\ No newline at end of file
@@ -1,14 +1,129 @@
 # app/database.py
-from sqlalchemy import create_engine
+import threading
+import time
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 from app.config import Config
 
-# Создаем "движок" для подключения к базе данных MySQL
-mysql_engine = create_engine(Config.MYSQL_DATABASE_URI)
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool, который дополнительно считает ожидания свободного соединения: сколько раз
+    и как долго запрос ждал, потому что все соединения пула (с overflow) были заняты.
+    Обычные выдачи соединения без ожидания в статистику не попадают.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _is_exhausted(self) -> bool:
+        # max_overflow = -1 - overflow не ограничен, ждать не придется
+        return self._max_overflow >= 0 and self.checkedout() >= self.size() + self._max_overflow
+
+    def _do_get(self):
+        if not self._is_exhausted():
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with self._wait_lock:
+                self.wait_count += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+
+# Допустимые значения PRAGMA локальной БД - в PRAGMA нельзя передать параметр, только подставить текст
+SQLITE_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SQLITE_SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def sqlite_pragmas():
+    """PRAGMA для каждого нового соединения с локальной SQLite по профилю из Config."""
+    pragmas = []
+    if Config.SQLITE_BUSY_TIMEOUT_MS:
+        pragmas.append(f'busy_timeout = {int(Config.SQLITE_BUSY_TIMEOUT_MS)}')
+    if Config.SQLITE_JOURNAL_MODE:
+        if Config.SQLITE_JOURNAL_MODE not in SQLITE_JOURNAL_MODES:
+            raise ValueError(f'Недопустимый SQLITE_JOURNAL_MODE: {Config.SQLITE_JOURNAL_MODE}')
+        pragmas.append(f'journal_mode = {Config.SQLITE_JOURNAL_MODE}')
+    if Config.SQLITE_SYNCHRONOUS:
+        if Config.SQLITE_SYNCHRONOUS not in SQLITE_SYNCHRONOUS_LEVELS:
+            raise ValueError(f'Недопустимый SQLITE_SYNCHRONOUS: {Config.SQLITE_SYNCHRONOUS}')
+        pragmas.append(f'synchronous = {Config.SQLITE_SYNCHRONOUS}')
+    if Config.SQLITE_MMAP_SIZE:
+        pragmas.append(f'mmap_size = {int(Config.SQLITE_MMAP_SIZE)}')
+    return pragmas
+
+
+def configure_sqlite_engine(engine):
+    """
+    Вешает на движок локальной БД установку PRAGMA при каждом подключении.
+    WAL позволяет читать список сделок, пока идет запись, busy_timeout - ждать
+    блокировку вместо мгновенного 'database is locked'.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in sqlite_pragmas():
+                cursor.execute(f'PRAGMA {pragma}')
+        finally:
+            cursor.close()
+
+
+# Создаем "движок" для подключения к базе данных MySQL.
+# Параметры пула и таймауты берутся из Config, pre_ping отсекает "протухшие" соединения.
+mysql_engine = create_engine(
+    Config.MYSQL_DATABASE_URI,
+    poolclass=TimedQueuePool,
+    pool_size=Config.MYSQL_POOL_SIZE,
+    max_overflow=Config.MYSQL_MAX_OVERFLOW,
+    pool_timeout=Config.MYSQL_POOL_TIMEOUT,
+    pool_recycle=Config.MYSQL_POOL_RECYCLE,
+    pool_pre_ping=Config.MYSQL_POOL_PRE_PING,
+    connect_args={
+        'connect_timeout': Config.MYSQL_CONNECT_TIMEOUT,
+        'read_timeout': Config.MYSQL_READ_TIMEOUT,
+        'write_timeout': Config.MYSQL_WRITE_TIMEOUT,
+    },
+)
 
 # Создаем фабрику сессий, которая будет создавать новые сессии для работы с БД
 mysql_session_factory = sessionmaker(bind=mysql_engine)
 
 # Создаем "scoped" сессию. Это гарантирует, что в каждом веб-запросе используется своя уникальная сессия.
 # Это важно для потокобезопасности в веб-приложениях.
-MysqlSession = scoped_session(mysql_session_factory)
\ No newline at end of file
+# Сессия закрывается один раз в конце запроса (teardown в create_app), а не после каждого вызова.
+MysqlSession = scoped_session(mysql_session_factory)
+
+
+def get_pool_stats():
+    """Возвращает текущее состояние пула соединений MySQL."""
+    pool = mysql_engine.pool
+    stats = {
+        'pool_size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'max_overflow': Config.MYSQL_MAX_OVERFLOW,
+    }
+    if isinstance(pool, TimedQueuePool):
+        with pool._wait_lock:
+            stats.update({
+                'wait_count': pool.wait_count,
+                'wait_total_ms': round(pool.wait_total * 1000, 2),
+                'wait_avg_ms': round(pool.wait_total * 1000 / pool.wait_count, 2) if pool.wait_count else 0.0,
+                'wait_max_ms': round(pool.wait_max * 1000, 2),
+            })
+    return stats
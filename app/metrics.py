@@ -0,0 +1,263 @@
+# app/metrics.py
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм (сек): от быстрых запросов до загрузки целого комплекса
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + '}'
+
+
+class Counter:
+    """Монотонный счетчик с метками."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """Гистограмма задержек с накопительными корзинами, суммой и числом наблюдений."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}  # метки -> [счетчики корзин, сумма, число]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(snapshot.items()):
+            labels = dict(zip(self.labelnames, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket', {**labels, 'le': _format_value(float(bound))}, bucket_count
+            yield f'{self.name}_sum', labels, round(total, 6)
+            yield f'{self.name}_count', labels, count
+
+
+class MetricsRegistry:
+    """Набор метрик процесса и их вывод в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, gauges=()) -> str:
+        """
+        gauges - мгновенные значения, которые считаются в момент запроса:
+        [(имя, описание, [(метки, значение), ...]), ...].
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for name, help_text, values in gauges:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in values:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'cadastre_stage_duration_seconds', 'Время этапов обработки (сек)', ('stage',))
+STAGE_ROWS = registry.counter(
+    'cadastre_stage_rows_total', 'Число строк (квартир, сделок, документов), прошедших через этап', ('stage',))
+REQUEST_SECONDS = registry.histogram(
+    'cadastre_http_request_duration_seconds', 'Время обработки HTTP-запросов (сек)', ('method', 'endpoint'))
+REQUESTS = registry.counter(
+    'cadastre_http_requests_total', 'Число HTTP-запросов', ('method', 'endpoint', 'status'))
+
+
+class Trace:
+    """Разбивка одного запроса или фоновой задачи по этапам: [(этап, сек, строк), ...]."""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.stages = []
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def breakdown(self) -> str:
+        parts = []
+        for stage, seconds, rows in self.stages:
+            rows_text = f', {rows} строк' if rows is not None else ''
+            parts.append(f'{stage} {seconds:.3f} с{rows_text}')
+        return '; '.join(parts) or 'этапы не отмечены'
+
+
+_current_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+
+def start_trace(label) -> Trace:
+    """Начинает сбор этапов для текущего потока (запрос или фоновая задача)."""
+    trace = Trace(label)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: Trace) -> float:
+    """
+    Завершает сбор этапов и пишет в лог медленный запрос/задачу
+    (дольше Config.SLOW_REQUEST_SECONDS, 0 - не писать). Возвращает длительность.
+    """
+    elapsed = trace.elapsed
+    if _current_trace.get() is trace:
+        _current_trace.set(None)
+    threshold = Config.SLOW_REQUEST_SECONDS
+    if threshold and elapsed >= threshold:
+        logger.warning('Медленно: %s - %.3f с (%s)', trace.label, elapsed, trace.breakdown())
+    return elapsed
+
+
+@contextmanager
+def traced(label):
+    """Контекстный менеджер для фоновых задач: start_trace/finish_trace вокруг блока."""
+    trace = start_trace(label)
+    try:
+        yield trace
+    finally:
+        finish_trace(trace)
+
+
+class _StageTimer:
+    def __init__(self, rows):
+        self.rows = rows
+
+
+@contextmanager
+def stage_timer(stage, rows=None):
+    """
+    Замеряет этап: время - в гистограмму, число строк - в счетчик, оба - в разбивку
+    текущего запроса. Число строк можно задать после замера: timer.rows = N.
+    """
+    timer = _StageTimer(rows)
+    started = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timer.rows is not None:
+            STAGE_ROWS.inc(timer.rows, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages.append((stage, round(elapsed, 3), timer.rows))
+
+
+def timed(stage, rows=None):
+    """
+    Декоратор для stage_timer. rows(result) - число строк по результату функции.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage) as timer:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    timer.rows = rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def init_request_metrics(app):
+    """Подключает замер HTTP-запросов и лог медленных запросов с разбивкой по этапам."""
+    from flask import g, request
+
+    @app.before_request
+    def start_request_trace():
+        g.metrics_trace = start_trace(f'{request.method} {request.path}')
+
+    @app.after_request
+    def finish_request_trace(response):
+        trace = g.pop('metrics_trace', None)
+        if trace is None:
+            return response
+        method = request.method
+        endpoint = request.endpoint or 'unmatched'
+        status = response.status_code
+
+        def record():
+            # Потоковые ответы (архивы) дописываются уже после after_request - считаем по закрытию
+            elapsed = finish_trace(trace)
+            REQUEST_SECONDS.observe(elapsed, method=method, endpoint=endpoint)
+            REQUESTS.inc(method=method, endpoint=endpoint, status=status)
+
+        response.call_on_close(record)
+        return response
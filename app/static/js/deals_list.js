@@ -52,6 +52,65 @@ document.addEventListener('DOMContentLoaded', function() {
         ));
     });
 
+    // -------------------------------------------------------------------
+    // МАССОВЫЕ ДЕЙСТВИЯ: ОДИН ЗАПРОС НА ВСЕ ВЫБРАННЫЕ СДЕЛКИ
+    // -------------------------------------------------------------------
+    const bulkActions = document.getElementById('bulk-actions');
+    if (bulkActions) {
+        const selectAll = document.getElementById('bulk-select-all');
+        const selectedCount = document.getElementById('bulk-selected-count');
+        const rowCheckboxes = Array.from(document.querySelectorAll('.bulk-select'));
+        const actionButtons = bulkActions.querySelectorAll('.bulk-action-btn');
+
+        function selectedDealIds() {
+            return rowCheckboxes.filter(cb => cb.checked).map(cb => Number(cb.dataset.dealId));
+        }
+
+        function updateBulkState() {
+            const count = selectedDealIds().length;
+            selectedCount.textContent = count;
+            actionButtons.forEach(button => button.disabled = count === 0);
+            selectAll.checked = count > 0 && count === rowCheckboxes.length;
+        }
+
+        selectAll.disabled = rowCheckboxes.length === 0;
+        selectAll.addEventListener('change', () => {
+            rowCheckboxes.forEach(cb => cb.checked = selectAll.checked);
+            updateBulkState();
+        });
+        rowCheckboxes.forEach(cb => cb.addEventListener('change', updateBulkState));
+
+        actionButtons.forEach(button => {
+            button.addEventListener('click', async function() {
+                const dealIds = selectedDealIds();
+                if (!dealIds.length) return;
+                actionButtons.forEach(b => b.disabled = true);
+
+                try {
+                    const response = await fetch(bulkActions.dataset.url, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({ action: this.dataset.action, deal_ids: dealIds })
+                    });
+                    const data = await response.json();
+                    if (!response.ok) throw new Error(data.message || 'Server error');
+
+                    if (data.failed) {
+                        const errors = data.results
+                            .filter(result => !result.ok)
+                            .map(result => `Сделка ${result.deal_id}: ${result.error}`);
+                        alert(`Обновлено: ${data.updated}, не обновлено: ${data.failed}.\n` + errors.join('\n'));
+                    }
+                    window.location.reload();
+                } catch (error) {
+                    console.error('Bulk action error:', error);
+                    alert('Произошла ошибка при сохранении. Попробуйте снова.');
+                    updateBulkState();
+                }
+            });
+        });
+    }
+
     // -------------------------------------------------------------------
     // ЛОГИКА ДЛЯ КНОПОК СКАЧИВАНИЯ АКТОВ С ПЕРЕЗАГРУЗКОЙ
     // -------------------------------------------------------------------
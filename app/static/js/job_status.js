@@ -0,0 +1,60 @@
+// /app/static/js/job_status.js
+
+document.addEventListener('DOMContentLoaded', function() {
+    const card = document.getElementById('job-card');
+    if (!card) return;
+
+    const statusUrl = card.dataset.statusUrl;
+    const stageLabel = document.getElementById('job-stage');
+    const progressBar = document.getElementById('job-progress');
+    const errorBox = document.getElementById('job-error');
+    const timingsBody = document.getElementById('job-timings');
+    const POLL_INTERVAL_MS = 1000;
+
+    function renderTimings(timings) {
+        timingsBody.innerHTML = '';
+        timings.forEach(timing => {
+            const row = timingsBody.insertRow();
+            row.insertCell().textContent = timing.stage_name;
+            const seconds = row.insertCell();
+            seconds.className = 'text-end';
+            seconds.textContent = timing.seconds.toFixed(2);
+        });
+    }
+
+    function showError(message) {
+        progressBar.classList.remove('progress-bar-animated');
+        progressBar.classList.add('bg-danger');
+        errorBox.textContent = message;
+        errorBox.classList.remove('d-none');
+    }
+
+    function poll() {
+        fetch(statusUrl)
+        .then(response => {
+            if (!response.ok) throw new Error('Server error');
+            return response.json();
+        })
+        .then(job => {
+            stageLabel.textContent = job.stage_name;
+            progressBar.style.width = `${job.percent}%`;
+            progressBar.setAttribute('aria-valuenow', job.percent);
+            progressBar.textContent = `${job.percent}%`;
+            renderTimings(job.timings);
+
+            if (job.status === 'done') {
+                window.location.href = job.results_url;
+            } else if (job.status === 'failed') {
+                showError(job.error || 'Обработка завершилась с ошибкой.');
+            } else {
+                setTimeout(poll, POLL_INTERVAL_MS);
+            }
+        })
+        .catch(error => {
+            console.error('Fetch Error:', error);
+            showError('Не удалось получить состояние обработки.');
+        });
+    }
+
+    poll();
+});
@@ -0,0 +1,111 @@
+# app/write_coalescer.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+
+class WriteCoalescer:
+    """
+    Объединяет записи из разных потоков в общие транзакции: при параллельной записи
+    первая запись ждет window секунд, все, что пришло за это время и накопилось в очереди
+    (не больше max_batch), уходит одной пачкой в write_batch(items) -> [результат, ...] в отдельном потоке-писателе
+    внутри контекста приложения. Вызывающий поток блокируется до своего результата.
+    Если пачка целиком не записалась (ошибка commit), ее записи повторяются по одной:
+    исключение получает только та запись, из-за которой не прошла транзакция.
+    Один писатель на процесс еще и снимает конкуренцию за блокировку записи SQLite.
+    """
+
+    def __init__(self, app, write_batch, window: float, max_batch: int = 500, name: str = 'write-coalescer'):
+        self.app = app
+        self.write_batch = write_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self.retried_batches = 0
+        self._last_batch_size = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """Ставит запись в очередь и ждет ее результат (исключение записи пробрасывается)."""
+        return self.submit_many([item])[0].result()
+
+    def submit_many(self, items) -> list:
+        """Ставит записи в очередь разом (в порядке items) и возвращает их Future, не дожидаясь записи."""
+        futures = []
+        for item in items:
+            future = Future()
+            self._queue.put((item, future))
+            futures.append(future)
+        return futures
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # Окно ждем, только если записи шли параллельно (прошлая пачка была больше одной):
+        # одиночный оператор не получает лишней задержки, а под нагрузкой пачки растут
+        # и без ожидания - за время commit очередь успевает наполниться.
+        window = self.window if self._last_batch_size > 1 else 0.0
+        deadline = time.monotonic() + window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._last_batch_size = len(batch)
+        return batch
+
+    def _write(self, batch):
+        """Пишет пачку [(запись, future), ...] одной транзакцией и раздает результаты."""
+        items = [item for item, _ in batch]
+        with self.app.app_context(), stage_timer(self.name, rows=len(items)):
+            results = self.write_batch(items)
+        self.batches += 1
+        self.items += len(items)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._write(batch)
+                continue
+            except Exception as e:
+                if len(batch) == 1:
+                    logger.exception('%s: ошибка записи', self.name)
+                    batch[0][1].set_exception(e)
+                    continue
+                logger.warning('%s: пачка из %d не записана (%s), повтор по одной записи', self.name, len(batch), e)
+            self.retried_batches += 1
+            for entry in batch:
+                try:
+                    self._write([entry])
+                except Exception as e:
+                    logger.exception('%s: ошибка записи', self.name)
+                    entry[1].set_exception(e)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'retried_batches': self.retried_batches,
+            'queued': self._queue.qsize(),
+        }
@@ -0,0 +1,64 @@
+# benchmarks/bench_checkerboard_export.py
+"""
+Замер экспорта шахматки в Excel на синтетическом комплексе:
+время сборки, пиковая память Python и размер файла.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_checkerboard_export --sections 20 --floors 40 --per-floor 60
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from app.cadastre_process.services.export_service import generate_checkerboard_excel
+
+
+def make_checkerboards(sections: int, floors: int, per_floor: int):
+    diff_data, area_data = OrderedDict(), OrderedDict()
+    property_id = 0
+    for section in range(1, sections + 1):
+        diff_floors = diff_data[str(section)] = OrderedDict()
+        area_floors = area_data[str(section)] = OrderedDict()
+        for floor in range(1, floors + 1):
+            ids = [str(property_id + i) for i in range(per_floor)]
+            property_id += per_floor
+            diff_floors[str(floor)] = [{'property_id': p, 'area_diff': random.uniform(-3, 3)} for p in ids]
+            area_floors[str(floor)] = [{'property_id': p, 'area': random.uniform(30, 120)} for p in ids]
+    return diff_data, area_data, property_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sections', type=int, default=20)
+    parser.add_argument('--floors', type=int, default=40)
+    parser.add_argument('--per-floor', type=int, default=60)
+    args = parser.parse_args()
+
+    random.seed(0)
+    diff_data, area_data, apartments = make_checkerboards(args.sections, args.floors, args.per_floor)
+
+    started = time.perf_counter()
+    generate_checkerboard_excel(diff_data, area_data, area_data)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    output = generate_checkerboard_excel(diff_data, area_data, area_data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    output.seek(0, 2)
+
+    print(json.dumps({
+        'benchmark': 'checkerboard_export',
+        'apartments': apartments,
+        'cells': apartments * 3,
+        'seconds': round(elapsed, 3),
+        'peak_mb': round(peak / 2 ** 20, 2),
+        'bytes': output.tell(),
+    }))
+
+
+if __name__ == '__main__':
+    main()
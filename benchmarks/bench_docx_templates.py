@@ -0,0 +1,63 @@
+# benchmarks/bench_docx_templates.py
+"""
+Сравнение рендера уведомлений: python-docx Document() на каждый документ
+против заготовки DocxTemplate.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_docx_templates --docs 200
+"""
+import argparse
+import io
+import json
+import time
+
+import docx
+
+from app.cadastre_process.services.docx_service import get_notification_text, render_notification
+
+
+def render_with_python_docx(deal: dict, group_key: str) -> bytes:
+    """Прежний путь: новый Document() и полное сохранение пакета на каждую сделку."""
+    doc = docx.Document()
+    doc.add_paragraph(get_notification_text(group_key).format(
+        client_name=deal.get('client_name', 'Клиент'),
+        apartment_id=deal['property_id']
+    ))
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def measure(render, deals, group_key):
+    started = time.perf_counter()
+    total_bytes = sum(len(render(deal, group_key)) for deal in deals)
+    elapsed = time.perf_counter() - started
+    return {
+        'seconds': round(elapsed, 4),
+        'ms_per_doc': round(elapsed * 1000 / len(deals), 3),
+        'avg_bytes': total_bytes // len(deals),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--docs', type=int, default=200)
+    parser.add_argument('--group', default='1_no_issues')
+    args = parser.parse_args()
+
+    deals = [{'property_id': str(i), 'client_name': f'Клиент {i}'} for i in range(1, args.docs + 1)]
+    render_notification(deals[0], args.group)  # сборка заготовки - один раз, вне замера
+
+    legacy = measure(render_with_python_docx, deals, args.group)
+    template = measure(render_notification, deals, args.group)
+    print(json.dumps({
+        'benchmark': 'docx_templates',
+        'docs': args.docs,
+        'python_docx': legacy,
+        'docx_template': template,
+        'speedup': round(legacy['seconds'] / template['seconds'], 1),
+    }, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
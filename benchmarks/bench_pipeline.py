@@ -0,0 +1,206 @@
+# benchmarks/bench_pipeline.py
+"""
+Бенчмарк горячих путей обработки на синтетических данных:
+разбор Excel (оба формата), сверка с CRM (напрямую, через снимок дома и повторная загрузка
+с инкрементальной сверкой) и раскладка по группам,
+построение шахматок, экспорт шахматки в Excel и архив уведомлений.
+
+Для каждого размера и этапа печатается время, пропускная способность
+(квартир/сделок в секунду) и пиковая память Python (tracemalloc) - одним JSON.
+С --baseline сравнивает время с предыдущим прогоном и помечает регрессии.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_pipeline --sizes 100,1000 --repeat 3 --output bench.json
+    python -m benchmarks.bench_pipeline --sizes 100,1000 --repeat 3 --baseline bench.json
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.synthetic import (
+    DEFAULT_SIZES, WORKBOOK_FORMATS, create_crm_standin, override_config, use_crm_standin,
+)
+
+HOUSE_ID = 1
+ARCHIVE_GROUP = '1_no_issues'
+
+
+def measure(stage, size, items, func, repeat=1, **labels):
+    """
+    Запускает func: один раз под tracemalloc (пиковая память и результат),
+    затем repeat раз без него - лучшее время (tracemalloc сам замедляет код).
+    Возвращает (результат, запись с метриками).
+    """
+    tracemalloc.start()
+    result = func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    count = items(result) if callable(items) else items
+    return result, {
+        'stage': stage,
+        'size': size,
+        **labels,
+        'items': count,
+        'seconds': round(best, 4),
+        'items_per_sec': round(count / best, 1) if best else None,
+        'peak_mb': round(peak / 2 ** 20, 2),
+    }
+
+
+def run_size(app, size, workdir, archive_limit, repeat):
+    from app.cadastre_process.services.checkerboard_service import build_checkerboards, expand_checkerboards
+    from app.cadastre_process.services.crm_snapshot_service import refresh_snapshots
+    from app.cadastre_process.services.export_service import generate_checkerboard_excel
+    from app.cadastre_process.services.file_service import generate_archive_for_group, parse_cadastre_excel
+    from app.cadastre_process.services.processing_service import process_cadastre_data
+    from app.cadastre_process.services.run_service import create_run
+
+    results = []
+    cadastre_data = None
+    for file_format, make_workbook in WORKBOOK_FORMATS.items():
+        workbook = make_workbook(size)
+        parsed, record = measure(
+            'parse_cadastre_excel', size, len, lambda: parse_cadastre_excel(io.BytesIO(workbook)),
+            format=file_format, repeat=repeat,
+        )
+        results.append(record)
+        if file_format == 'template':
+            cadastre_data = parsed
+
+    engine = create_crm_standin(os.path.join(workdir, f'crm_{size}.db'), size, HOUSE_ID)
+    with use_crm_standin(engine), app.app_context():
+        # Сверка с CRM напрямую и через локальный снимок дома (снимок снимается до замера)
+        with override_config(CRM_SNAPSHOT_ENABLED=False):
+            (categorized, _), record = measure(
+                'process_cadastre_data', size, len(cadastre_data),
+                lambda: process_cadastre_data(cadastre_data, HOUSE_ID), repeat=repeat,
+            )
+        results.append(record)
+
+        with override_config(CRM_SNAPSHOT_ENABLED=True):
+            refresh_snapshots([HOUSE_ID])
+            _, record = measure(
+                'process_cadastre_data_snapshot', size, len(cadastre_data),
+                lambda: process_cadastre_data(cadastre_data, HOUSE_ID), repeat=repeat,
+            )
+        results.append(record)
+
+        # Повторная загрузка дома: сверка с его сохраненным запуском, изменилась каждая 20-я квартира
+        create_run(HOUSE_ID, cadastre_data, categorized)
+        reuploaded = {
+            prop_id: area + 5 if number % 20 == 0 else area
+            for number, (prop_id, area) in enumerate(cadastre_data.items())
+        }
+        with override_config(CRM_SNAPSHOT_ENABLED=False):
+            (_, status_report), record = measure(
+                'process_cadastre_data_reupload', size, len(reuploaded),
+                lambda: process_cadastre_data(reuploaded, HOUSE_ID, incremental=True), repeat=repeat,
+            )
+        record['reconcile'] = status_report['reconcile']
+        results.append(record)
+
+    stored, record = measure(
+        'build_checkerboards', size, len(cadastre_data),
+        lambda: build_checkerboards(cadastre_data, categorized), repeat=repeat,
+    )
+    results.append(record)
+
+    checkerboards = expand_checkerboards(stored)
+    _, record = measure(
+        'generate_checkerboard_excel', size, len(cadastre_data),
+        lambda: generate_checkerboard_excel(checkerboards['diff'], checkerboards['file'], checkerboards['db']),
+        repeat=repeat,
+    )
+    results.append(record)
+
+    deals = categorized.get(ARCHIVE_GROUP, [])[:archive_limit]
+    _, record = measure(
+        'generate_archive_for_group', size, len(deals),
+        lambda: generate_archive_for_group(deals, ARCHIVE_GROUP), repeat=repeat,
+    )
+    results.append(record)
+    engine.dispose()
+    return results
+
+
+def compare_with_baseline(results, baseline_path, threshold, min_seconds):
+    """
+    Добавляет к записям отношение ко времени базового прогона и флаг регрессии.
+    Этапы быстрее min_seconds не помечаются: на них время определяется шумом.
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {
+            (r['stage'], r['size'], r.get('format')): r['seconds'] for r in json.load(f)['results']
+        }
+    regressions = 0
+    for record in results:
+        base_seconds = baseline.get((record['stage'], record['size'], record.get('format')))
+        if not base_seconds:
+            continue
+        record['baseline_seconds'] = base_seconds
+        record['ratio'] = round(record['seconds'] / base_seconds, 2)
+        record['regression'] = record['ratio'] > threshold and record['seconds'] >= min_seconds
+        regressions += record['regression']
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Размеры (число квартир) через запятую')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Сколько раз замерять время каждого этапа (берется лучшее)')
+    parser.add_argument('--archive-limit', type=int, default=2000,
+                        help='Максимум документов в замере архива')
+    parser.add_argument('--output', help='Файл для JSON-результата (по умолчанию только stdout)')
+    parser.add_argument('--baseline', help='JSON предыдущего прогона для сравнения')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Во сколько раз медленнее базового прогона считается регрессией')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='Этапы быстрее этого времени не считаются регрессией')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    with tempfile.TemporaryDirectory() as workdir, override_config(
+        # Локальная БД бенчмарка - во временной папке, рабочая instance/ не трогается
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(workdir, 'notifications.db')}",
+        SESSION_FILE_DIR=os.path.join(workdir, 'flask_session'),
+    ):
+        from app import create_app
+        from app.cadastre_process.services.worker_pool import shutdown_process_pool
+        app = create_app()
+
+        results = []
+        for size in sizes:
+            results.extend(run_size(app, size, workdir, args.archive_limit, args.repeat))
+        shutdown_process_pool()
+
+    report = {'benchmark': 'pipeline', 'python': sys.version.split()[0], 'cpu_count': os.cpu_count(),
+              'results': results}
+    if args.baseline:
+        report['regressions'] = compare_with_baseline(results, args.baseline, args.threshold, args.min_seconds)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    print(output)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+# benchmarks/bench_sqlite_writers.py
+"""
+Пропускная способность параллельной записи статусов в локальную SQLite:
+несколько потоков-операторов отмечают доставку своих сделок (update_deal_status),
+пока потоки-читатели листают таблицу статусов.
+
+Профили:
+    rollback     - журнал DELETE, synchronous=FULL, без объединения записей;
+    wal          - WAL, synchronous=NORMAL, mmap, без объединения записей;
+    wal_coalesce - то же + объединение записей за STATUS_WRITE_COALESCE_MS в одну транзакцию.
+
+Для каждого профиля печатается число обновлений в секунду, задержка одного
+обновления (p50/p95/max, мс), число ошибок и прочитанных страниц - одним JSON.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_sqlite_writers --writers 8 --updates 200 --readers 2
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from app.config import Config
+from benchmarks.synthetic import override_config
+
+PROFILES = {
+    'rollback': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': 0,
+                 'STATUS_WRITE_COALESCE_MS': 0},
+    'wal': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL', 'SQLITE_MMAP_SIZE': 64 * 1024 * 1024,
+            'STATUS_WRITE_COALESCE_MS': 0},
+    'wal_coalesce': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL',
+                     'SQLITE_MMAP_SIZE': 64 * 1024 * 1024, 'STATUS_WRITE_COALESCE_MS': 5},
+}
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))] if ordered else 0.0
+
+
+def profile_settings(workdir, name, coalesce_ms):
+    """Настройки Config профиля: отдельная БД в workdir и PRAGMA профиля (они ставятся при подключении)."""
+    settings = dict(PROFILES[name], SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(workdir, f'{name}.db')}")
+    if settings['STATUS_WRITE_COALESCE_MS'] and coalesce_ms is not None:
+        settings['STATUS_WRITE_COALESCE_MS'] = coalesce_ms
+    return settings
+
+
+def seed_statuses(app, count):
+    from app import db
+    from app.cadastre_process.models import DealStatus
+    with app.app_context():
+        db.session.bulk_insert_mappings(DealStatus, [
+            {'deal_id': deal_id, 'group_key': '1_no_issues', 'status': 'processing'}
+            for deal_id in range(1, count + 1)
+        ])
+        db.session.commit()
+
+
+def run_profile(app, writers, updates, readers):
+    from sqlalchemy import func, select
+    from app import db
+    from app.cadastre_process.models import DealStatus
+    from app.cadastre_process.services.data_service import update_deal_status
+
+    latencies = [[] for _ in range(writers)]
+    errors = [0] * writers
+    pages_read = [0] * readers
+    stop_readers = threading.Event()
+    start = threading.Barrier(writers + readers + 1)
+
+    def writer(index):
+        with app.app_context():
+            start.wait()
+            for deal_id in range(index * updates + 1, (index + 1) * updates + 1):
+                started = time.perf_counter()
+                ok = update_deal_status(deal_id, 'mark_delivered')
+                latencies[index].append(time.perf_counter() - started)
+                errors[index] += not ok
+
+    def reader(index):
+        with app.app_context():
+            start.wait()
+            while not stop_readers.is_set():
+                db.session.execute(
+                    select(DealStatus.status, func.count()).group_by(DealStatus.status)
+                ).all()
+                db.session.execute(select(DealStatus).order_by(DealStatus.deal_id).limit(50)).all()
+                db.session.rollback()
+                pages_read[index] += 1
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads[:writers]:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop_readers.set()
+    for thread in threads[writers:]:
+        thread.join()
+
+    with app.app_context():
+        delivered = db.session.scalar(
+            select(func.count()).select_from(DealStatus).where(DealStatus.status == 'pending_arrival')
+        )
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+
+    all_latencies = [value * 1000 for values in latencies for value in values]
+    result = {
+        'journal_mode': journal_mode,
+        'synchronous': Config.SQLITE_SYNCHRONOUS,
+        'coalesce_ms': Config.STATUS_WRITE_COALESCE_MS,
+        'updates': len(all_latencies),
+        'delivered': delivered,
+        'errors': sum(errors),
+        'seconds': round(elapsed, 4),
+        'updates_per_sec': round(len(all_latencies) / elapsed, 1),
+        'p50_ms': round(percentile(all_latencies, 0.5), 2),
+        'p95_ms': round(percentile(all_latencies, 0.95), 2),
+        'max_ms': round(max(all_latencies), 2),
+        'reads_per_sec': round(sum(pages_read) / elapsed, 1),
+    }
+    writer_stats = app.extensions.get('status_writer')
+    if writer_stats is not None:
+        result['coalescer'] = writer_stats.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=8, help='Параллельных потоков записи')
+    parser.add_argument('--updates', type=int, default=200, help='Обновлений на поток')
+    parser.add_argument('--readers', type=int, default=2, help='Параллельных потоков чтения')
+    parser.add_argument('--profiles', default=','.join(PROFILES), help='Профили через запятую')
+    parser.add_argument('--coalesce-ms', type=float, help='Окно объединения для профиля wal_coalesce')
+    args = parser.parse_args()
+
+    from app import create_app, db
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir, override_config(
+        # Локальные БД бенчмарка - во временной папке, рабочая instance/ не трогается
+        SESSION_FILE_DIR=os.path.join(workdir, 'flask_session'),
+        DEADLINE_SWEEP_INTERVAL=0,
+    ):
+        for name in args.profiles.split(','):
+            with override_config(**profile_settings(workdir, name, args.coalesce_ms)):
+                app = create_app()
+                seed_statuses(app, args.writers * args.updates)
+                results[name] = run_profile(app, args.writers, args.updates, args.readers)
+                with app.app_context():
+                    db.engine.dispose()
+
+    report = {'benchmark': 'sqlite_writers', 'python': sys.version.split()[0], 'cpu_count': os.cpu_count(),
+              'writers': args.writers, 'updates_per_writer': args.updates, 'readers': args.readers,
+              'results': results}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
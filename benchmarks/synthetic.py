@@ -0,0 +1,159 @@
+# benchmarks/synthetic.py
+"""
+Синтетические данные для бенчмарков: кадастровые книги в обоих форматах
+и SQLite-подмена схемы CRM (estate_sells / estate_deals / estate_deals_contacts),
+а также временная подмена настроек и подключения к CRM на время прогона.
+"""
+import contextlib
+import io
+import os
+import random
+
+from openpyxl import Workbook
+from sqlalchemy import create_engine, text
+
+# Размеры по умолчанию: от небольшого дома до целого комплекса
+DEFAULT_SIZES = (100, 1000, 10000, 50000)
+
+APARTMENTS_PER_FLOOR = 8
+APARTMENTS_PER_SECTION = 160
+XONADON_AREA_COLUMN = 14
+
+
+def contract_area(number: int) -> float:
+    """Площадь квартиры по договору (детерминированная, 30-120 м²)."""
+    return 30 + (number * 37 % 900) / 10
+
+
+def _cadastre_area(number: int, rnd) -> float:
+    # Кадастровая площадь отличается от договорной на ±4 м²: примерно половина
+    # квартир выходит за порог в 2 м², поэтому заполняются все шесть групп
+    return round(contract_area(number) + rnd.uniform(-4, 4), 2)
+
+
+def make_template_workbook(apartments: int, seed: int = 0) -> bytes:
+    """Стандартный шаблон: 'Номер квартиры' | 'КадастроваяПлощадь'."""
+    rnd = random.Random(seed)
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Кадастр')
+    worksheet.append(['Номер квартиры', 'КадастроваяПлощадь'])
+    for number in range(1, apartments + 1):
+        worksheet.append([number, _cadastre_area(number, rnd)])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def make_xonadon_workbook(apartments: int, seed: int = 0, rooms: int = 3) -> bytes:
+    """
+    Формат 'Xonadon': блок на квартиру ('N-Xonadon', строки комнат, итог с площадью
+    в колонке O), перед каждой секцией - блок 'Zinapoya'. Часть площадей записана
+    строкой с запятой, как в выгрузках из кадастра.
+    """
+    rnd = random.Random(seed)
+    padding = [None] * (XONADON_AREA_COLUMN - 1)
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Xonadon')
+    worksheet.append(['Kadastr'])
+    for number in range(1, apartments + 1):
+        if number % APARTMENTS_PER_SECTION == 1:
+            worksheet.append([f'{number // APARTMENTS_PER_SECTION + 1}-Zinapoya'])
+            worksheet.append(['Umumiy'] + padding + [rnd.uniform(20, 60)])
+        worksheet.append([f'{number}-Xonadon'])
+        for _ in range(rooms):
+            worksheet.append(['Xona'] + padding + [round(rnd.uniform(5, 25), 2)])
+        area = _cadastre_area(number, rnd)
+        worksheet.append(['Jami'] + padding + [str(area).replace('.', ',') if number % 3 == 0 else area])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+WORKBOOK_FORMATS = {
+    'template': make_template_workbook,
+    'xonadon': make_xonadon_workbook,
+}
+
+
+def create_crm_standin(path: str, apartments: int, house_id: int = 1):
+    """
+    SQLite-подмена CRM для одного дома: квартиры 1..apartments, у 80% - активная
+    сделка, у каждой четвертой - долг; площади - contract_area. Возвращает engine.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE estate_houses (id INTEGER PRIMARY KEY, complex_name TEXT, name TEXT)"))
+        conn.execute(text(
+            "CREATE TABLE estate_sells (id INTEGER PRIMARY KEY, house_id INTEGER, geo_flatnum TEXT,"
+            " estate_floor INTEGER, geo_house_entrance INTEGER, estate_sell_status_name TEXT,"
+            " estate_area REAL, estate_sell_category TEXT)"))
+        conn.execute(text(
+            "CREATE TABLE estate_deals (id INTEGER PRIMARY KEY, estate_sell_id INTEGER, house_id INTEGER,"
+            " deal_area REAL, deal_status_name TEXT, seller_contacts_id INTEGER,"
+            " finances_income_reserved REAL, contacts_buy_id INTEGER)"))
+        conn.execute(text(
+            "CREATE TABLE estate_deals_contacts (id INTEGER PRIMARY KEY, contacts_buy_name TEXT,"
+            " contacts_buy_phones TEXT)"))
+        conn.execute(text("CREATE INDEX ix_sells_house ON estate_sells (house_id, geo_flatnum)"))
+        conn.execute(text("CREATE INDEX ix_deals_sell ON estate_deals (estate_sell_id)"))
+
+        conn.execute(text("INSERT INTO estate_houses VALUES (:id, 'Бенчмарк', 'Дом 1')"), {'id': house_id})
+        sells, deals, contacts = [], [], []
+        for number in range(1, apartments + 1):
+            position = (number - 1) % APARTMENTS_PER_SECTION
+            sells.append({
+                'id': number, 'house_id': house_id, 'flat': str(number),
+                'floor': position // APARTMENTS_PER_FLOOR + 1,
+                'section': (number - 1) // APARTMENTS_PER_SECTION + 1,
+                'area': contract_area(number),
+            })
+            if number % 5:
+                deals.append({
+                    'id': number, 'sell_id': number, 'house_id': house_id,
+                    # У половины сделок площадь не указана - берется площадь объекта
+                    'area': contract_area(number) if number % 2 else None,
+                    'debt': 1000.0 if number % 4 == 0 else 0.0,
+                })
+                contacts.append({'id': number, 'name': f'Клиент {number}'})
+
+        conn.execute(text(
+            "INSERT INTO estate_sells VALUES (:id, :house_id, :flat, :floor, :section, 'Продано', :area, 'flat')"),
+            sells)
+        conn.execute(text(
+            "INSERT INTO estate_deals VALUES (:id, :sell_id, :house_id, :area, 'Сделка в работе', :id, :debt, :id)"),
+            deals)
+        conn.execute(text("INSERT INTO estate_deals_contacts VALUES (:id, :name, '')"), contacts)
+    return engine
+
+
+@contextlib.contextmanager
+def use_crm_standin(engine):
+    """Сессии CRM (mysql_session_factory) на время блока идут в engine, затем - обратно в MySQL."""
+    from app.database import mysql_session_factory
+    previous = mysql_session_factory.kw.get('bind')
+    mysql_session_factory.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        mysql_session_factory.configure(bind=previous)
+
+
+@contextlib.contextmanager
+def override_config(**values):
+    """Подменяет атрибуты Config на время блока: прежние значения возвращаются, новые атрибуты удаляются."""
+    from app.config import Config
+    missing = object()
+    previous = {name: Config.__dict__.get(name, missing) for name in values}
+    for name, value in values.items():
+        setattr(Config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is missing:
+                delattr(Config, name)
+            else:
+                setattr(Config, name, value)
@@ -1,7 +1,10 @@
 # run.py
 from app import create_app
 
-app = create_app()
+# Процессы пула воркеров (forkserver/spawn) импортируют этот модуль как '__mp_main__':
+# в них приложение не создается, иначе RESET_DB_ON_START сбросил бы локальную БД
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True,port =5555)
\ No newline at end of file
@@ -0,0 +1,47 @@
+# tests/conftest.py
+import pytest
+
+from app.cache import checkerboard_cache, reference_cache
+from benchmarks.synthetic import create_crm_standin, override_config, use_crm_standin
+
+# Квартир в SQLite-подмене CRM (дом 1): у 80% - сделка, у каждой четвертой - долг
+CRM_APARTMENTS = 40
+HOUSE_ID = 1
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Приложение с локальной БД и хранилищем сканов во временной папке, без фоновых потоков."""
+    with override_config(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'notifications.db'}",
+        SESSION_FILE_DIR=str(tmp_path / 'flask_session'),
+        UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+        DEADLINE_SWEEP_INTERVAL=0,
+        CRM_SNAPSHOT_REFRESH_INTERVAL=0,
+        SCAN_GC_INTERVAL=0,
+        STATUS_WRITE_COALESCE_MS=0,
+        WORKER_PROCESSES=1,
+    ):
+        from app import create_app, db
+        app = create_app()
+        app.config['TESTING'] = True
+        with app.app_context():
+            yield app
+            db.session.remove()
+            db.engine.dispose()
+    reference_cache.clear()
+    checkerboard_cache.clear()
+
+
+@pytest.fixture
+def crm(tmp_path):
+    """SQLite-подмена CRM на время теста: сессии CRM идут в нее. Возвращает engine."""
+    engine = create_crm_standin(str(tmp_path / 'crm.db'), CRM_APARTMENTS, HOUSE_ID)
+    with use_crm_standin(engine):
+        yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,59 @@
+# tests/test_cache.py
+import pytest
+
+from app import cache as cache_module
+from app.cache import TTLCache, cached
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время кэша: clock[0] - текущее значение time.monotonic()."""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_entry_expires_after_its_ttl(clock):
+    cache = TTLCache(maxsize=4, default_ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=30)
+
+    clock[0] += 9.9
+    assert cache.get('a') == 1
+    clock[0] += 0.1
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.stats()['size'] == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_least_recently_used_key_is_evicted(clock):
+    cache = TTLCache(maxsize=2, default_ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' становится самым старым
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_cached_function_is_called_again_after_expiry_and_invalidate(clock):
+    cache = TTLCache(maxsize=8, default_ttl=60)
+    calls = []
+
+    @cached(cache, ttl=5)
+    def houses(complex_name):
+        calls.append(complex_name)
+        return [complex_name]
+
+    houses('Бенчмарк')
+    houses('Бенчмарк')
+    assert calls == ['Бенчмарк']
+
+    clock[0] += 5
+    houses('Бенчмарк')
+    houses.invalidate('Бенчмарк')
+    houses('Бенчмарк')
+    assert calls == ['Бенчмарк'] * 3
@@ -0,0 +1,62 @@
+# tests/test_crm_snapshot_service.py
+from sqlalchemy import select, text, update
+
+from app import db
+from app.cadastre_process.models import CrmSnapshotHouse, CrmSnapshotRow
+from app.cadastre_process.services.crm_snapshot_service import (
+    ensure_snapshots, expire_snapshots, get_snapshot_stats, refresh_snapshots,
+)
+from tests.conftest import CRM_APARTMENTS, HOUSE_ID
+
+
+def _mark_snapshot_row(deal_id):
+    """Метка в строке снимка: она переживает обновление, только если строки не переписывались."""
+    db.session.execute(
+        update(CrmSnapshotRow).where(CrmSnapshotRow.deal_id == deal_id).values(contacts_buy_name='метка')
+    )
+    db.session.commit()
+
+
+def _snapshot_row(deal_id):
+    db.session.expire_all()
+    return db.session.execute(select(CrmSnapshotRow).where(CrmSnapshotRow.deal_id == deal_id)).scalar_one()
+
+
+def test_unchanged_crm_data_does_not_rewrite_rows(app, crm):
+    assert refresh_snapshots([HOUSE_ID]) == {HOUSE_ID: {'rows': CRM_APARTMENTS, 'changed': True}}
+    changed_at = db.session.get(CrmSnapshotHouse, HOUSE_ID).changed_at
+    _mark_snapshot_row(1)
+
+    assert refresh_snapshots([HOUSE_ID]) == {HOUSE_ID: {'rows': CRM_APARTMENTS, 'changed': False}}
+    assert _snapshot_row(1).contacts_buy_name == 'метка'
+    snapshot = db.session.get(CrmSnapshotHouse, HOUSE_ID)
+    assert snapshot.changed_at == changed_at
+    assert snapshot.refreshed_at >= changed_at
+
+
+def test_changed_crm_data_rewrites_rows(app, crm):
+    refresh_snapshots([HOUSE_ID])
+    checksum = db.session.get(CrmSnapshotHouse, HOUSE_ID).checksum
+    _mark_snapshot_row(1)
+
+    with crm.begin() as conn:
+        conn.execute(text("UPDATE estate_deals SET finances_income_reserved = 500 WHERE id = 1"))
+
+    assert refresh_snapshots([HOUSE_ID]) == {HOUSE_ID: {'rows': CRM_APARTMENTS, 'changed': True}}
+    row = _snapshot_row(1)
+    assert row.contacts_buy_name == 'Клиент 1'
+    assert row.has_debt is True
+    assert db.session.get(CrmSnapshotHouse, HOUSE_ID).checksum != checksum
+
+
+def test_expired_snapshot_is_stale_with_real_age(app, crm):
+    refresh_snapshots([HOUSE_ID])
+    expire_snapshots()
+
+    [stats] = get_snapshot_stats()
+    assert stats['stale'] is True
+    assert stats['fresh'] is False
+    assert stats['age_seconds'] < 60
+
+    assert ensure_snapshots([HOUSE_ID]) == {HOUSE_ID: {'rows': CRM_APARTMENTS, 'changed': False}}
+    assert get_snapshot_stats()[0]['fresh'] is True
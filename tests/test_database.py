@@ -0,0 +1,43 @@
+# tests/test_database.py
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+from app.database import TimedQueuePool
+
+
+def _engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool,
+                         pool_size=1, max_overflow=0, pool_timeout=5)
+
+
+def test_checkouts_from_free_pool_are_not_waits(tmp_path):
+    engine = _engine(tmp_path)
+    for _ in range(5):
+        with engine.connect():
+            pass
+    assert engine.pool.wait_count == 0
+    assert engine.pool.wait_total == 0.0
+    engine.dispose()
+
+
+def test_checkout_from_exhausted_pool_is_counted_as_wait(tmp_path):
+    engine = _engine(tmp_path)
+    holder = engine.connect()
+    checked_out = threading.Event()
+
+    def waiter():
+        with engine.connect():
+            checked_out.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.1)
+    assert not checked_out.is_set()
+    holder.close()
+    thread.join()
+
+    assert engine.pool.wait_count == 1
+    assert engine.pool.wait_max >= 0.05
+    engine.dispose()
@@ -0,0 +1,57 @@
+# tests/test_deadline_service.py
+from datetime import datetime, timedelta
+
+from app import db
+from app.cadastre_process.models import DealStatus
+from app.cadastre_process.services.deadline_service import (
+    OVERDUE_STATUS, arrival_deadline_for, backfill_arrival_deadlines, get_deadline_deals, sweep_overdue_deals,
+)
+
+
+def _add(deal_id, status, deadline=None, delivered_at=None):
+    db.session.add(DealStatus(deal_id=deal_id, group_key='1_no_issues', status=status,
+                              arrival_deadline=deadline, documents_delivered_at=delivered_at))
+
+
+def _status(deal_id):
+    db.session.expire_all()
+    return db.session.get(DealStatus, deal_id).status
+
+
+def test_sweeper_moves_only_expired_pending_deals_to_overdue(app):
+    now = datetime.utcnow()
+    _add(1, 'pending_arrival', now - timedelta(minutes=1))
+    _add(2, 'pending_arrival', now + timedelta(days=1))
+    _add(3, 'acceptance_pending', now - timedelta(days=1))
+    _add(4, 'pending_arrival')
+    db.session.commit()
+
+    assert sweep_overdue_deals(now) == 1
+    assert [_status(deal_id) for deal_id in (1, 2, 3, 4)] == [
+        OVERDUE_STATUS, 'pending_arrival', 'acceptance_pending', 'pending_arrival',
+    ]
+    assert sweep_overdue_deals(now) == 0
+
+    deadlines = get_deadline_deals(now)
+    assert [deal['deal_id'] for deal in deadlines['overdue']] == [1]
+    assert [deal['deal_id'] for deal in deadlines['due_soon']] == [2]
+
+
+def test_backfill_sets_deadline_from_delivery_time(app):
+    delivered_at = datetime.utcnow() - timedelta(days=40)
+    _add(1, 'pending_arrival', delivered_at=delivered_at)
+    _add(2, 'pending_arrival', delivered_at=datetime.utcnow())
+    _add(3, 'processing', delivered_at=delivered_at)
+    _add(4, 'pending_arrival')
+    db.session.commit()
+
+    assert backfill_arrival_deadlines() == 2
+    db.session.expire_all()
+    assert db.session.get(DealStatus, 1).arrival_deadline == arrival_deadline_for(delivered_at)
+    assert db.session.get(DealStatus, 3).arrival_deadline is None
+    assert db.session.get(DealStatus, 4).arrival_deadline is None
+    assert backfill_arrival_deadlines() == 0
+
+    # Доставленная 40 дней назад сделка после проставления срока уходит в просроченные
+    assert sweep_overdue_deals() == 1
+    assert (_status(1), _status(2)) == (OVERDUE_STATUS, 'pending_arrival')
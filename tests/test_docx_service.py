@@ -0,0 +1,48 @@
+# tests/test_docx_service.py
+import io
+import zipfile
+
+import docx
+
+from app.cadastre_process.services.docx_service import (
+    NOTIFICATION_TEXTS, DocxTemplate, render_notification,
+)
+from app.cadastre_process.services.zip_writer import build_zip, make_entry
+
+
+def _open(data: bytes):
+    package = zipfile.ZipFile(io.BytesIO(data))
+    assert package.testzip() is None
+    return docx.Document(io.BytesIO(data))
+
+
+def test_every_group_notification_opens_with_python_docx():
+    for group_key in NOTIFICATION_TEXTS:
+        document = _open(render_notification({'client_name': 'Иванов И.И.', 'property_id': '17'}, group_key))
+        text = '\n'.join(paragraph.text for paragraph in document.paragraphs)
+        assert 'Иванов И.И.' in text and '№17' in text
+        assert '{' not in text
+
+
+def test_template_escapes_values_and_keeps_paragraphs():
+    def build():
+        document = docx.Document()
+        document.add_paragraph('Клиент: {client_name}')
+        document.add_paragraph('Квартира {apartment_id}, снова {client_name}')
+        return document
+
+    template = DocxTemplate(build, fields=('client_name', 'apartment_id'))
+    document = _open(template.render(client_name='ООО "Рога & <Копыта>"', apartment_id=5))
+
+    assert [paragraph.text for paragraph in document.paragraphs] == [
+        'Клиент: ООО "Рога & <Копыта>"',
+        'Квартира 5, снова ООО "Рога & <Копыта>"',
+    ]
+
+
+def test_build_zip_is_readable_by_zipfile():
+    entries = [make_entry('a.txt', b'a' * 1000), make_entry('папка/б.txt', 'текст'.encode('utf-8'))]
+    with zipfile.ZipFile(io.BytesIO(build_zip(entries))) as package:
+        assert package.testzip() is None
+        assert package.namelist() == ['a.txt', 'папка/б.txt']
+        assert package.read('папка/б.txt').decode('utf-8') == 'текст'
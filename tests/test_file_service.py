@@ -0,0 +1,86 @@
+# tests/test_file_service.py
+import io
+import zipfile
+
+import docx
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+from app.cadastre_process.services.file_service import (
+    generate_archive_for_group, parse_cadastre_excel, stream_archive_for_group,
+)
+from app.cadastre_process.services.parse_diagnostics import ParseDiagnostics
+
+
+def _xonadon_workbook(areas: dict, styled_empty_rows: int = 0) -> io.BytesIO:
+    """Книга формата 'Xonadon': заголовок квартиры, комнаты и итоговая строка с площадью в колонке O."""
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['Kadastr'])
+    for apartment, area in areas.items():
+        worksheet.append([f'{apartment}-Xonadon'])
+        worksheet.append(['xona'] + [None] * 13 + [12.5])
+        worksheet.append(['Jami'] + [None] * 13 + [area])
+    # Пустые строки, у которых остались только стили: read-only режим openpyxl их отдает
+    last_row = worksheet.max_row
+    for row in range(last_row + 1, last_row + 1 + styled_empty_rows):
+        worksheet.cell(row=row, column=1).font = Font(bold=True)
+        worksheet.cell(row=row, column=15).font = Font(bold=True)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def test_xonadon_last_apartment_kept_with_styled_trailing_rows():
+    diagnostics = ParseDiagnostics('test.xlsx')
+    data = parse_cadastre_excel(_xonadon_workbook({1: 45.5, 2: 60.25}, styled_empty_rows=5), diagnostics)
+
+    assert data == {'1': 45.5, '2': 60.25}
+    assert diagnostics.total == 0
+
+
+def test_template_ignores_styled_trailing_rows():
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.append(['Номер квартиры', 'КадастроваяПлощадь'])
+    worksheet.append([1, 40.0])
+    worksheet.append([2, 55.5])
+    for row in range(4, 8):
+        worksheet.cell(row=row, column=2).font = Font(bold=True)
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+
+    assert parse_cadastre_excel(output) == {'1': 40.0, '2': 55.5}
+
+
+def _deals(count, house_ids=(1,)):
+    return [
+        {'house_id': house_ids[n % len(house_ids)], 'property_id': str(n + 1), 'client_name': f'Клиент {n + 1}'}
+        for n in range(count)
+    ]
+
+
+def test_streamed_archive_opens_and_matches_buffered_one():
+    deals = _deals(12)
+    streamed = b''.join(stream_archive_for_group(deals, '2_debt_only', workers=1))
+
+    with zipfile.ZipFile(io.BytesIO(streamed)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [f'{n}.docx' for n in range(1, 13)]
+        document = docx.Document(io.BytesIO(archive.read('7.docx')))
+        assert 'Клиент 7' in document.paragraphs[0].text
+        with zipfile.ZipFile(generate_archive_for_group(deals, '2_debt_only', workers=1)) as buffered:
+            assert buffered.testzip() is None
+            assert buffered.namelist() == archive.namelist()
+            for name in buffered.namelist():
+                assert archive.read(name) == buffered.read(name)
+
+
+def test_streamed_batch_archive_puts_documents_into_house_folders():
+    streamed = b''.join(stream_archive_for_group(_deals(4, house_ids=(1, 2)), '1_no_issues', workers=1))
+
+    with zipfile.ZipFile(io.BytesIO(streamed)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['1/1.docx', '2/2.docx', '1/3.docx', '2/4.docx']
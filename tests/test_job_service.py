@@ -0,0 +1,55 @@
+# tests/test_job_service.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.cadastre_process.models import UploadJob
+from app.cadastre_process.services.job_service import _JobCancelled, _JobProgress, _create_job, get_job
+from app.config import Config
+
+
+def _age(job_id, *fields):
+    """Сдвигает указанные времена задачи в прошлое на JOB_TIMEOUT + 1 минуту."""
+    job = db.session.get(UploadJob, job_id)
+    for name in fields:
+        setattr(job, name, datetime.utcnow() - timedelta(seconds=Config.JOB_TIMEOUT + 60))
+    db.session.commit()
+
+
+def test_finished_job_records_start_and_result(app):
+    job_id = _create_job()
+    progress = _JobProgress(job_id)
+    progress.stage('parse')
+    progress.finish('done', run_id='run1')
+
+    job = get_job(job_id)
+    assert (job['status'], job['stage'], job['percent'], job['run_id']) == ('done', 'done', 100, 'run1')
+    assert db.session.get(UploadJob, job_id).started_at is not None
+
+
+def test_time_in_queue_does_not_count_towards_timeout(app):
+    job_id = _create_job()
+    _age(job_id, 'created_at')
+    assert get_job(job_id)['status'] == 'queued'
+
+    _JobProgress(job_id).stage('parse')
+    assert get_job(job_id)['status'] == 'running'
+
+
+def test_late_worker_does_not_overwrite_timed_out_job(app):
+    job_id = _create_job()
+    progress = _JobProgress(job_id)
+    progress.stage('parse')
+    _age(job_id, 'started_at')
+
+    job = get_job(job_id)
+    assert job['status'] == 'failed'
+    assert 'не завершилась' in job['error']
+
+    with pytest.raises(_JobCancelled):
+        progress.stage('save')
+    progress.finish('done', run_id='late')
+    db.session.expire_all()
+    job = get_job(job_id)
+    assert (job['status'], job['run_id']) == ('failed', None)
@@ -0,0 +1,110 @@
+# tests/test_processing_service.py
+from sqlalchemy import func, select
+
+from app import db
+from app.cadastre_process.models import DealStatus
+from app.cadastre_process.services.data_service import update_deal_status
+from app.cadastre_process.services.processing_service import (
+    _insert_missing_statuses, _upsert_deal_statuses, process_cadastre_data,
+)
+from app.cadastre_process.services.run_service import create_run
+from benchmarks.synthetic import contract_area, override_config
+from tests.conftest import HOUSE_ID
+
+
+def _cadastre(numbers, changed=()):
+    """Кадастровые площади квартир: как по договору, у changed - на 5 м² больше."""
+    return {str(n): contract_area(n) + (5 if n in changed else 0) for n in numbers}
+
+
+def _upload(cadastre_data, incremental=True):
+    """Обработка загрузки и сохранение запуска - как в фоновой задаче."""
+    categorized, report = process_cadastre_data(cadastre_data, HOUSE_ID, incremental=incremental)
+    create_run(HOUSE_ID, cadastre_data, categorized)
+    return categorized, report
+
+
+def _status(deal_id):
+    db.session.expire_all()
+    return db.session.get(DealStatus, deal_id).status
+
+
+def test_first_upload_without_previous_run_resets_existing_statuses(app, crm):
+    # Статус остался с прошлого запуска приложения, история запусков при этом сброшена
+    db.session.add(DealStatus(deal_id=1, group_key='1_no_issues', status='pending_arrival'))
+    db.session.commit()
+
+    _, report = _upload(_cadastre(range(1, 31)))
+
+    # Квартиры 1..30, сделки у всех, кроме кратных 5
+    assert report['inserted'] == 23
+    assert report['reset'] == 1
+    assert report['kept'] == 0
+    assert report['reconcile']['mode'] == 'initial'
+    assert report['reconcile']['added'] == 30
+    assert _status(1) == 'processing'
+
+
+def test_reupload_resets_only_added_and_changed_deals(app, crm):
+    _upload(_cadastre(range(1, 31)))
+    assert update_deal_status(2, 'mark_delivered')
+    assert update_deal_status(7, 'mark_delivered')
+
+    # Квартира 2 изменилась, 31-33 добавлены, 29 и 30 пропали из файла
+    categorized, report = _upload(_cadastre(list(range(1, 29)) + [31, 32, 33], changed={2}))
+
+    assert report['reconcile'] == {'mode': 'incremental', 'added': 3, 'changed': 1, 'unchanged': 27, 'removed': 2}
+    assert report['inserted'] == 3
+    assert report['reset'] == 1
+    # Сделки 1..28 без кратных 5 и без изменившейся 2
+    assert report['kept'] == 22
+    assert _status(2) == 'processing'
+    assert _status(7) == 'pending_arrival'
+    deal_ids = {deal['deal_id'] for deals in categorized.values() for deal in deals}
+    assert deal_ids == {n for n in list(range(1, 29)) + [31, 32, 33] if n % 5}
+
+
+def test_full_reprocess_resets_every_deal(app, crm):
+    _upload(_cadastre(range(1, 31)))
+    assert update_deal_status(7, 'mark_delivered')
+
+    _, report = _upload(_cadastre(range(1, 31)), incremental=False)
+
+    assert report['reconcile']['mode'] == 'full'
+    assert report['inserted'] == 0
+    assert report['reset'] == 24
+    assert _status(7) == 'processing'
+
+
+def test_upsert_counts_inserted_and_reset_across_batches(app):
+    db.session.add_all([
+        DealStatus(deal_id=2, group_key='1_no_issues', status='pending_arrival', is_act_signed=True),
+        DealStatus(deal_id=5, group_key='2_debt_only', status='completed', signed_act_uploaded_path='a.pdf'),
+    ])
+    db.session.commit()
+
+    # Пачки по 2: существующие статусы попадают в разные пачки
+    with override_config(STATUS_UPSERT_BATCH_SIZE=2):
+        report = _upsert_deal_statuses({deal_id: '5_increase_only' for deal_id in range(1, 7)})
+    db.session.commit()
+
+    assert report == {'inserted': 4, 'reset': 2}
+    db.session.expire_all()
+    statuses = db.session.scalars(select(DealStatus).order_by(DealStatus.deal_id)).all()
+    assert [status.deal_id for status in statuses] == [1, 2, 3, 4, 5, 6]
+    assert {(status.status, status.group_key) for status in statuses} == {('processing', '5_increase_only')}
+    assert db.session.get(DealStatus, 2).is_act_signed is None
+    assert db.session.get(DealStatus, 5).signed_act_uploaded_path is None
+
+
+def test_insert_missing_statuses_keeps_existing_ones(app):
+    db.session.add(DealStatus(deal_id=2, group_key='1_no_issues', status='pending_arrival'))
+    db.session.commit()
+
+    with override_config(STATUS_UPSERT_BATCH_SIZE=2):
+        inserted = _insert_missing_statuses({1: '1_no_issues', 2: '2_debt_only', 3: '1_no_issues'})
+    db.session.commit()
+
+    assert inserted == 2
+    assert db.session.scalar(select(func.count()).select_from(DealStatus)) == 3
+    assert (_status(2), db.session.get(DealStatus, 2).group_key) == ('pending_arrival', '1_no_issues')
@@ -0,0 +1,68 @@
+# tests/test_run_service.py
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.cadastre_process.models import DealStatus
+from app.cadastre_process.services.deadline_service import OVERDUE_STATUS
+from app.cadastre_process.services.processing_service import process_cadastre_data
+from app.cadastre_process.services.run_service import create_run, get_deals_page
+from benchmarks.synthetic import contract_area
+from tests.conftest import HOUSE_ID
+
+
+@pytest.fixture
+def run_id(app, crm):
+    """Запуск по квартирам 1..30: 24 сделки (без кратных 5), у 4, 8, ... - долг."""
+    cadastre_data = {str(n): contract_area(n) for n in range(1, 31)}
+    categorized, _ = process_cadastre_data(cadastre_data, HOUSE_ID)
+    run_id = create_run(HOUSE_ID, cadastre_data, categorized)
+
+    now = datetime.utcnow()
+    deadlines = {
+        1: (OVERDUE_STATUS, now - timedelta(days=5)),
+        2: ('pending_arrival', now - timedelta(days=1)),
+        3: ('pending_arrival', now + timedelta(days=1)),
+        4: ('pending_arrival', now - timedelta(hours=1)),
+        6: ('pending_arrival', now + timedelta(days=10)),
+    }
+    for deal_id, (status, deadline) in deadlines.items():
+        deal_status = db.session.get(DealStatus, deal_id)
+        deal_status.status, deal_status.arrival_deadline = status, deadline
+    db.session.commit()
+    return run_id
+
+
+def _deal_ids(run_id, per_page=100, page=1, **filters):
+    deals, total_count = get_deals_page(run_id, filters, page, per_page)
+    return {deal['deal_id'] for deal in deals}, total_count
+
+
+def test_pages_cover_every_deal_once(run_id):
+    pages = [get_deals_page(run_id, {}, page, 10) for page in (1, 2, 3, 4)]
+
+    assert [total for _, total in pages] == [24] * 4
+    assert [len(deals) for deals, _ in pages] == [10, 10, 4, 0]
+    deal_ids = [deal['deal_id'] for deals, _ in pages for deal in deals]
+    assert sorted(deal_ids) == [n for n in range(1, 31) if n % 5]
+
+
+def test_timeout_filters(run_id):
+    assert _deal_ids(run_id, timeout='overdue') == ({1, 2, 4}, 3)
+    assert _deal_ids(run_id, timeout='due_soon') == ({3}, 1)
+    assert _deal_ids(run_id, timeout='on_time') == ({3, 6}, 2)
+
+    deals, _ = get_deals_page(run_id, {'timeout': 'overdue'}, 1, 100)
+    assert all(deal['is_timed_out'] and deal['deadline_iso'] for deal in deals)
+
+
+def test_filters_combine_with_pagination(run_id):
+    assert _deal_ids(run_id, timeout='overdue', group_key='1_no_issues') == ({1, 2}, 2)
+    assert _deal_ids(run_id, group_key='2_debt_only') == ({4, 8, 12, 16, 24, 28}, 6)
+    assert _deal_ids(run_id, status='pending_arrival') == ({2, 3, 4, 6}, 4)
+
+    first, total = _deal_ids(run_id, per_page=2, page=1, timeout='overdue')
+    second, _ = _deal_ids(run_id, per_page=2, page=2, timeout='overdue')
+    assert (len(first), len(second), total) == (2, 1, 3)
+    assert first | second == {1, 2, 4}
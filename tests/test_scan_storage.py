@@ -0,0 +1,104 @@
+# tests/test_scan_storage.py
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.config import Config
+from app.cadastre_process.models import DealStatus
+from app.cadastre_process.services.scan_storage import (
+    ScanStorageError, collect_orphan_scans, save_scan, scan_etag, scan_path,
+)
+
+PDF = b'%PDF-1.4 ' + bytes(range(256)) * 40
+
+
+def _save(data, filename='scan.PDF'):
+    return save_scan(FileStorage(stream=io.BytesIO(data), filename=filename))
+
+
+def _stored_files():
+    return sorted(
+        os.path.relpath(os.path.join(dir_path, name), Config.UPLOAD_FOLDER)
+        for dir_path, _, names in os.walk(Config.UPLOAD_FOLDER) for name in names
+    )
+
+
+def _make_old(key, seconds=7200):
+    old = time.time() - seconds
+    os.utime(scan_path(key), (old, old))
+
+
+def test_key_is_sha256_with_extension_in_sharded_path(app):
+    key = _save(PDF)
+
+    digest = hashlib.sha256(PDF).hexdigest()
+    assert key == digest + '.pdf'
+    assert scan_path(key) == os.path.join(Config.UPLOAD_FOLDER, digest[:2], digest[2:4], key)
+    with open(scan_path(key), 'rb') as f:
+        assert f.read() == PDF
+    assert scan_etag(key) == digest
+
+
+def test_same_content_is_stored_once(app):
+    assert _save(PDF, 'a.pdf') == _save(PDF, 'b.pdf')
+    assert len([path for path in _stored_files() if not path.startswith('tmp')]) == 1
+
+
+def test_rejected_files_leave_no_temporary_files(app, monkeypatch):
+    monkeypatch.setattr(Config, 'SCAN_MAX_SIZE_MB', 0)
+    with pytest.raises(ScanStorageError):
+        _save(PDF)
+    monkeypatch.undo()
+    with pytest.raises(ScanStorageError):
+        _save(b'')
+    assert _stored_files() == []
+
+
+def test_gc_removes_only_old_unreferenced_files(app):
+    referenced = _save(PDF)
+    orphan = _save(b'orphan scan')
+    fresh_orphan = _save(b'fresh orphan scan')
+    db.session.add(DealStatus(deal_id=1, status='completed', unilateral_act_uploaded_path=referenced))
+    db.session.commit()
+    _make_old(referenced)
+    _make_old(orphan)
+
+    assert collect_orphan_scans() == 1
+    assert os.path.exists(scan_path(referenced))
+    assert not os.path.exists(scan_path(orphan))
+    assert os.path.exists(scan_path(fresh_orphan))
+
+
+def test_saving_same_content_again_protects_file_from_gc(app):
+    key = _save(PDF)
+    _make_old(key)
+    # Другой оператор загрузил те же байты: файл обновлен и еще не записан в статус
+    assert _save(PDF) == key
+
+    assert collect_orphan_scans() == 0
+    assert os.path.exists(scan_path(key))
+
+
+def test_download_supports_range_and_etag(app, client):
+    key = _save(PDF)
+    db.session.add(DealStatus(deal_id=5, status='completed', signed_act_uploaded_path=key))
+    db.session.commit()
+
+    response = client.get('/scans/5/signed_act')
+    assert response.status_code == 200
+    assert response.data == PDF
+    etag = response.headers['ETag'].strip('"')
+    assert etag == hashlib.sha256(PDF).hexdigest()
+
+    partial = client.get('/scans/5/signed_act', headers={'Range': 'bytes=10-19'})
+    assert partial.status_code == 206
+    assert partial.data == PDF[10:20]
+    assert partial.headers['Content-Range'] == f'bytes 10-19/{len(PDF)}'
+
+    cached = client.get('/scans/5/signed_act', headers={'If-None-Match': f'"{etag}"'})
+    assert cached.status_code == 304
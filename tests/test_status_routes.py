@@ -0,0 +1,49 @@
+# tests/test_status_routes.py
+from app import db
+from app.cadastre_process.models import DealStatus
+
+
+def _seed(statuses):
+    db.session.add_all(
+        DealStatus(deal_id=deal_id, group_key='1_no_issues', status=status) for deal_id, status in statuses.items()
+    )
+    db.session.commit()
+
+
+def test_batch_status_reports_rule_rejections_per_deal(app, client):
+    _seed({1: 'processing', 2: 'processing', 3: 'completed', 4: 'pending_arrival'})
+
+    response = client.post('/batch-status', json={'action': 'mark_delivered', 'deal_ids': [1, 3, 2, 4, 99, 1]})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['status'], body['updated'], body['failed']) == ('partial', 2, 3)
+    results = {result['deal_id']: result for result in body['results']}
+    assert list(results) == [1, 3, 2, 4, 99]
+    assert results[1]['ok'] and results[1]['status'] == 'pending_arrival'
+    assert results[3] == {'deal_id': 3, 'ok': False, 'status': 'completed',
+                          'error': "Действие недоступно в статусе 'completed'"}
+    assert not results[4]['ok'] and results[4]['status'] == 'pending_arrival'
+    assert results[99]['error'] == 'Сделка не найдена'
+
+    db.session.expire_all()
+    assert db.session.get(DealStatus, 3).documents_delivered_at is None
+    assert db.session.get(DealStatus, 4).arrival_deadline is None
+
+
+def test_batch_status_with_only_rejections_is_an_error(app, client):
+    _seed({1: 'completed'})
+
+    body = client.post('/batch-status', json={'action': 'mark_arrived', 'deal_ids': [1]}).get_json()
+
+    assert (body['status'], body['updated'], body['failed']) == ('error', 0, 1)
+
+
+def test_batch_status_rejects_actions_outside_batch_list(app, client):
+    _seed({1: 'processing'})
+
+    response = client.post('/batch-status', json={'action': 'act_uploaded', 'deal_ids': [1]})
+
+    assert response.status_code == 400
+    db.session.expire_all()
+    assert db.session.get(DealStatus, 1).status == 'processing'
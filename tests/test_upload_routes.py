@@ -0,0 +1,36 @@
+# tests/test_upload_routes.py
+import io
+
+from app import db
+from app.cadastre_process.models import UploadJob
+
+
+def _flashes(client):
+    with client.session_transaction() as session:
+        return session.get('_flashes', [])
+
+
+def test_xls_upload_is_rejected_with_message(app, client):
+    response = client.post('/process-upload', data={
+        'house_id': '1', 'cadastre_file': (io.BytesIO(b'\xd0\xcf\x11\xe0'), 'kadastr.xls'),
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/')
+    [(category, message)] = _flashes(client)
+    assert category == 'danger'
+    assert 'kadastr.xls' in message and '.xlsx' in message
+    assert db.session.query(UploadJob).count() == 0
+
+
+def test_batch_upload_with_xls_file_is_rejected(app, crm, client):
+    response = client.post('/process-batch-upload', data={
+        'complex_name': 'Бенчмарк',
+        'cadastre_file_1': (io.BytesIO(b'\xd0\xcf\x11\xe0'), 'dom1.XLS'),
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 302
+    [(category, message)] = _flashes(client)
+    assert category == 'danger'
+    assert 'dom1.XLS' in message
+    assert db.session.query(UploadJob).count() == 0
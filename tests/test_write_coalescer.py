@@ -0,0 +1,59 @@
+# tests/test_write_coalescer.py
+import threading
+
+import pytest
+
+from app import db
+from app.cadastre_process.models import DealStatus
+from app.cadastre_process.services.data_service import update_deal_statuses
+from app.write_coalescer import WriteCoalescer
+from benchmarks.synthetic import override_config
+
+
+def test_failing_item_fails_only_its_own_caller(app):
+    started, release = threading.Event(), threading.Event()
+    written = []
+
+    def write_batch(items):
+        if 'slow' in items:
+            started.set()
+            release.wait(5)
+        if 'bad' in items:
+            raise RuntimeError('bad row')
+        written.extend(items)
+        return [item.upper() for item in items]
+
+    writer = WriteCoalescer(app, write_batch, window=0.0, name='test-writer')
+    slow = writer.submit_many(['slow'])[0]
+    assert started.wait(5)
+    # Пока писатель занят, три записи копятся в очереди и уходят одной пачкой
+    futures = writer.submit_many(['a', 'bad', 'c'])
+    release.set()
+
+    assert slow.result(5) == 'SLOW'
+    assert futures[0].result(5) == 'A'
+    assert futures[2].result(5) == 'C'
+    with pytest.raises(RuntimeError, match='bad row'):
+        futures[1].result(5)
+    assert written == ['slow', 'a', 'c']
+    assert writer.stats()['retried_batches'] == 1
+
+
+def test_batch_status_goes_through_status_writer(app):
+    db.session.add_all([
+        DealStatus(deal_id=1, group_key='1_no_issues', status='processing'),
+        DealStatus(deal_id=2, group_key='1_no_issues', status='completed'),
+    ])
+    db.session.commit()
+
+    with override_config(STATUS_WRITE_COALESCE_MS=5):
+        results = update_deal_statuses([1, 2, 3, 1], 'mark_delivered')
+
+    assert [(r['deal_id'], r['ok'], r['status']) for r in results] == [
+        (1, True, 'pending_arrival'),
+        (2, False, 'completed'),
+        (3, False, None),
+    ]
+    assert app.extensions['status_writer'].stats()['items'] == 3
+    db.session.expire_all()
+    assert db.session.get(DealStatus, 1).arrival_deadline is not None